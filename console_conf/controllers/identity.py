@@ -22,7 +22,8 @@ from subiquitycore.controller import BaseController
 from subiquitycore.models import IdentityModel
 from subiquitycore.utils import disable_console_conf, run_command
 
-from console_conf.ui.views import IdentityView, LoginView
+from console_conf.ui.views.identity import IdentityView
+from console_conf.ui.views.login import LoginView
 
 log = logging.getLogger('console_conf.controllers.identity')
 
@@ -13,7 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from console_conf.ui.views import WelcomeView
+from console_conf.ui.views.welcome import WelcomeView
 
 from subiquitycore.controller import BaseController
 
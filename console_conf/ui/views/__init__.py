@@ -13,10 +13,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-""" ConsoleConf UI Views """
+from subiquitycore.lazy import lazy_attributes
 
-from .identity import IdentityView  # NOQA
-from .login import LoginView  # NOQA
-from .welcome import WelcomeView  # NOQA
-#from .network import NetworkView  # NOQA
-#from .network_configure_interface import NetworkConfigureInterfaceView  # NOQA
+lazy_attributes(__name__, {
+    'IdentityView': '.identity',
+    'LoginView': '.login',
+    'WelcomeView': '.welcome',
+    })
@@ -0,0 +1,277 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Install from an answers file without a UI.
+
+When the answers file answers every screen there is nobody to show the
+screens to, so HeadlessInstall drives the models directly from the
+answers, writes the curtin configs and runs curtin, reporting progress
+as plain lines of text.  Neither urwid nor any of the views are
+imported.
+"""
+
+import logging
+import os
+import select
+import subprocess
+import sys
+import time
+
+import yaml
+
+from subiquitycore import utils
+from subiquitycore.models.network import (
+    DEFAULT_ROUTE_TIMEOUT,
+    NETPLAN_APPLY_COMMANDS,
+    netplan_config_path,
+    NetworkModelReceiver,
+    write_dry_run_netplan,
+    write_netplan_config,
+    )
+from subiquitycore.prober import Prober, ProberException
+from subiquitycore.scheduler import Scheduler
+from subiquitycore.user import create_user
+
+from subiquity.curtin import (
+    CURTIN_INSTALL_LOG,
+    CURTIN_POSTINSTALL_LOG,
+    curtin_config_path,
+    curtin_install_cmd,
+    write_curtin_config,
+    )
+from subiquity.models.filesystem import NoSpaceError
+from subiquity.models.subiquity import SubiquityModel
+
+log = logging.getLogger('subiquity.autoinstall')
+
+
+class AutoinstallError(Exception):
+    """ The answers do not describe an install that can run headless """
+    pass
+
+
+def missing_answers(answers):
+    """Return a list of the answers a headless install needs but lacks."""
+    missing = []
+    if not answers.get('Network', {}).get('accept-default', False):
+        missing.append('Network: accept-default')
+    if not answers.get('Filesystem', {}).get('guided', False):
+        missing.append('Filesystem: guided')
+    identity = answers.get('Identity', {})
+    for key in 'realname', 'username', 'hostname', 'password':
+        if key not in identity:
+            missing.append('Identity: ' + key)
+    return missing
+
+
+def guided_disk(filesystem_model, answers):
+    """Return the disk the Filesystem answers choose to install to."""
+    disks = filesystem_model.all_disks()
+    index = answers['Filesystem'].get('guided-index', 0)
+    try:
+        return disks[index]
+    except IndexError:
+        raise AutoinstallError(
+            "guided-index {} but only {} disks found".format(
+                index, len(disks)))
+
+
+def user_from_answers(answers):
+    """Return the Identity answers in the form IdentityModel.add_user takes."""
+    answers = answers['Identity']
+    return {
+        'realname': answers['realname'],
+        'username': answers['username'],
+        'hostname': answers['hostname'],
+        'password': answers['password'],
+        'confirm_password': answers['password'],
+        'ssh_import_id': answers.get('ssh-import-id', ''),
+        }
+
+
+class HeadlessInstall:
+
+    def __init__(self, opts, answers, output=sys.stdout):
+        missing = missing_answers(answers)
+        if missing:
+            raise AutoinstallError(
+                "answers needed to install without a UI are missing: " +
+                ", ".join(missing))
+        opts.project = "subiquity"
+        self.opts = opts
+        self.answers = answers
+        self.output = output
+        self.scheduler = Scheduler({'probe': 2})
+        try:
+            self.prober = Prober(opts)
+            # Nothing here uses wlan scan results.
+            self.prober.start_probing(
+                self.scheduler.lane('probe'),
+                getattr(opts, 'probe_scopes', [])
+                or ('storage.block-only', 'network.links'))
+        except ProberException as e:
+            self.scheduler.shutdown(wait=False)
+            raise AutoinstallError("Prober init failed: {}".format(e))
+        self.model = SubiquityModel({'prober': self.prober})
+        if opts.dry_run:
+            self.root = os.path.abspath(".subiquity")
+        else:
+            self.root = "/"
+
+    def progress(self, message):
+        log.info("%s", message)
+        self.output.write(message + "\n")
+        self.output.flush()
+
+    def run(self):
+        """Run the install, returning 0 on success and 1 on failure."""
+        try:
+            self.configure_locale()
+            self.configure_network()
+            self.configure_storage()
+            self.configure_identity()
+            self.install()
+        except (AutoinstallError, NoSpaceError, ProberException) as e:
+            # A bad machine config or a disk that is too small ends up
+            # here as well as a bad answers file.
+            log.exception("installation failed")
+            self.progress("Installation failed: {}".format(e))
+            return 1
+        finally:
+            self.scheduler.shutdown(wait=False)
+        self.progress("Installation complete")
+        if self.answers.get('InstallProgress', {}).get('reboot', False):
+            self.reboot()
+        elif not self.opts.dry_run:
+            utils.disable_subiquity()
+        return 0
+
+    def configure_locale(self):
+        lang = self.answers.get('Welcome', {}).get('lang')
+        if lang is not None:
+            self.progress("Language: {}".format(lang))
+            self.model.locale.switch_language(lang)
+
+    def configure_network(self):
+        self.progress("Configuring network")
+        model = self.model.network
+        netplan_path = netplan_config_path(self.root, self.opts.project)
+        if self.opts.dry_run:
+            write_dry_run_netplan(netplan_path)
+        model.parse_netplan_configs(self.root)
+        self.network_receiver = NetworkModelReceiver(model)
+        self.network_observer, self.network_fds = self.prober.probe_network(
+            self.network_receiver)
+        os.makedirs(os.path.dirname(netplan_path), exist_ok=True)
+        write_netplan_config(netplan_path, model.render(), self.opts.project)
+        model.parse_netplan_configs(self.root)
+        if self.opts.dry_run:
+            return
+        for stage, cmd in NETPLAN_APPLY_COMMANDS:
+            result = utils.run_command(cmd)
+            if result['status'] != 0:
+                raise AutoinstallError(
+                    "{} failed: {}".format(" ".join(cmd), result['err']))
+        self.wait_for_default_route(DEFAULT_ROUTE_TIMEOUT)
+
+    def wait_for_default_route(self, timeout):
+        """Read network events until there is a default route."""
+        deadline = time.monotonic() + timeout
+        while not self.network_receiver.default_routes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AutoinstallError(
+                    "no default route after {}s".format(timeout))
+            ready = select.select(self.network_fds, [], [], remaining)[0]
+            for fd in ready:
+                self.network_observer.data_ready(fd)
+
+    def is_uefi(self):
+        if self.opts.dry_run and self.opts.uefi:
+            return True
+        return os.path.exists('/sys/firmware/efi')
+
+    def configure_storage(self):
+        model = self.model.filesystem
+        # What is mounted here is irrelevant to a machine config's disks.
+        model.probe(exclude_mounted=not self.opts.machine_config)
+        disk = guided_disk(model, self.answers)
+        self.progress("Installing to {}".format(disk.path))
+        model.add_guided_layout(disk, self.is_uefi())
+
+    def configure_identity(self):
+        result = user_from_answers(self.answers)
+        self.progress("Creating user {}".format(result['username']))
+        self.model.identity.add_user(result)
+        try:
+            create_user(result, dryrun=self.opts.dry_run)
+        except PermissionError as e:
+            raise AutoinstallError(str(e))
+
+    def write_config(self, install_step):
+        path = curtin_config_path(install_step, self.opts.dry_run)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_curtin_config(path, self.model.render(install_step=install_step))
+        return path
+
+    def run_curtin(self, install_step, logfile_location):
+        config_location = self.write_config(install_step)
+        cmd = curtin_install_cmd([config_location])
+        if self.opts.dry_run:
+            self.progress("Not running {}".format(" ".join(cmd)))
+            return
+        self.progress("Running {} step".format(install_step))
+        # curtin reports events with the "print" reporter, so pass the
+        # start/finish lines on and put everything in the log.
+        with open(logfile_location, 'wb', buffering=0) as logfile:
+            proc = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL)
+            for line in proc.stdout:
+                logfile.write(line)
+                text = line.decode('utf-8', 'replace').rstrip()
+                if text.startswith(('start:', 'finish:')):
+                    self.progress("  " + text)
+            returncode = proc.wait()
+        if returncode != 0:
+            raise AutoinstallError(
+                "curtin {} failed, see {}".format(
+                    install_step, logfile_location))
+
+    def install(self):
+        self.run_curtin("install", CURTIN_INSTALL_LOG)
+        self.run_curtin("postinstall", CURTIN_POSTINSTALL_LOG)
+
+    def reboot(self):
+        if self.opts.dry_run:
+            log.debug('dry-run enabled, skipping reboot')
+        else:
+            utils.run_command(["/sbin/reboot"])
+
+
+def run_headless(opts, output=sys.stdout):
+    """Install using the answers in opts.answers, returning an exit code."""
+    if opts.answers is None:
+        output.write("Installing without a UI needs an answers file\n")
+        return 1
+    with open(opts.answers) as fp:
+        answers = yaml.safe_load(fp) or {}
+    log.debug("Loaded answers %s", answers)
+    try:
+        install = HeadlessInstall(opts, answers, output)
+    except AutoinstallError as e:
+        output.write("{}\n".format(e))
+        return 1
+    return install.run()
@@ -0,0 +1,163 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Write the curtin configs for many machines at once.
+
+Given a directory of machine configs (as captured by probert) and an
+answers file, this writes the install and postinstall curtin configs
+subiquity would use on each machine, so they can be reviewed before a
+rollout.  Machines are processed in parallel, one process per core.
+"""
+
+import argparse
+from concurrent import futures
+import logging
+import os
+import sys
+
+import yaml
+
+from subiquitycore.models.network import NetplanConfig, NetworkModelReceiver
+from subiquitycore.prober import Prober, ProberException
+
+from subiquity.autoinstall import (
+    AutoinstallError,
+    guided_disk,
+    missing_answers,
+    user_from_answers,
+    )
+from subiquity.curtin import write_curtin_config
+from subiquity.models.filesystem import NoSpaceError
+from subiquity.models.subiquity import SubiquityModel
+
+log = logging.getLogger('subiquity.compile_configs')
+
+MACHINE_CONFIG_SUFFIXES = ('.json', '.yaml', '.yml')
+INSTALL_STEPS = ('install', 'postinstall')
+
+
+def find_machine_configs(dir):
+    """Return the paths of the machine configs in dir, sorted."""
+    paths = []
+    for name in sorted(os.listdir(dir)):
+        if name.endswith(MACHINE_CONFIG_SUFFIXES):
+            paths.append(os.path.join(dir, name))
+    return paths
+
+
+def compile_machine(machine_config, answers, output_dir, uefi=False,
+                    netplan_root=None):
+    """Write the curtin configs for one machine.
+
+    The configs go in a directory named after the machine config file
+    in output_dir.  The network config is based on the netplan config
+    found under netplan_root, if given.  Returns (machine_config,
+    error), where error is None if all went well.
+    """
+    name = os.path.splitext(os.path.basename(machine_config))[0]
+    opts = argparse.Namespace(
+        machine_config=machine_config, machine_config_snapshot=False,
+        dry_run=True, uefi=uefi, project="subiquity")
+    try:
+        prober = Prober(opts)
+        model = SubiquityModel({'prober': prober})
+        if netplan_root is not None:
+            model.network.parse_netplan_configs(netplan_root)
+        else:
+            model.network.config = NetplanConfig()
+        prober.probe_network(NetworkModelReceiver(model.network))
+        # The storage data was not captured on this machine, so what is
+        # mounted here is irrelevant.
+        model.filesystem.probe(exclude_mounted=False)
+        model.filesystem.add_guided_layout(
+            guided_disk(model.filesystem, answers), uefi)
+        model.identity.add_user(user_from_answers(answers))
+        machine_dir = os.path.join(output_dir, name)
+        os.makedirs(machine_dir, exist_ok=True)
+        for install_step in INSTALL_STEPS:
+            write_curtin_config(
+                os.path.join(
+                    machine_dir,
+                    'subiquity-curtin-%s.conf' % (install_step,)),
+                model.render(install_step=install_step))
+    except (AutoinstallError, NoSpaceError, ProberException, KeyError,
+            OSError, yaml.YAMLError) as e:
+        return machine_config, "{}: {}".format(type(e).__name__, e)
+    return machine_config, None
+
+
+def compile_all(machine_configs, answers, output_dir, uefi=False,
+                netplan_root=None, jobs=None):
+    """Call compile_machine for each machine config in a process pool.
+
+    Yields (machine_config, error) pairs in the order of machine_configs.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    # Hand out work in batches: a config takes milliseconds, so sending
+    # them one at a time would mostly measure the pool's overhead.
+    chunksize = max(1, len(machine_configs) // (jobs * 4))
+    with futures.ProcessPoolExecutor(jobs) as executor:
+        yield from executor.map(
+            compile_machine, machine_configs,
+            [answers] * len(machine_configs),
+            [output_dir] * len(machine_configs),
+            [uefi] * len(machine_configs),
+            [netplan_root] * len(machine_configs),
+            chunksize=chunksize)
+
+
+def parse_options(argv):
+    parser = argparse.ArgumentParser(
+        description='Write the curtin configs subiquity would use for each '
+                    'machine config in a directory',
+        prog='subiquity-compile-configs')
+    parser.add_argument('machine_config_dir', metavar='MACHINE_CONFIG_DIR',
+                        help='directory of machine configs')
+    parser.add_argument('--answers', required=True,
+                        help='answers file to apply to every machine')
+    parser.add_argument('--output', metavar='DIR', default='curtin-configs',
+                        help='where to write the configs (default: '
+                             '%(default)s)')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='number of processes (default: one per core)')
+    parser.add_argument('--netplan-root', metavar='DIR', dest='netplan_root',
+                        help='use the netplan config under DIR (as found on '
+                             'the install media) for the network config')
+    parser.add_argument('--uefi', action='store_true',
+                        help='lay out disks for booting with UEFI')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_options(sys.argv[1:] if argv is None else argv)
+    with open(opts.answers) as fp:
+        answers = yaml.safe_load(fp) or {}
+    missing = [m for m in missing_answers(answers)
+               if not m.startswith('Network:')]
+    if missing:
+        print("answers file is missing: " + ", ".join(missing))
+        return 1
+    machine_configs = find_machine_configs(opts.machine_config_dir)
+    failed = 0
+    for machine_config, error in compile_all(
+            machine_configs, answers, opts.output, opts.uefi,
+            opts.netplan_root, opts.jobs):
+        if error is not None:
+            failed += 1
+            print("{}: {}".format(machine_config, error))
+    print("wrote configs for {} of {} machines to {}".format(
+        len(machine_configs) - failed, len(machine_configs), opts.output))
+    return 1 if failed else 0
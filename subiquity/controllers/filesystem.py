@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from functools import partial
 import logging
 import os
 
@@ -21,28 +22,17 @@ from subiquitycore.ui.dummy import DummyView
 from subiquitycore.ui.error import ErrorView
 
 from subiquity.models.filesystem import humanize_size
-from subiquity.ui.views import (
-    BcacheView,
-    DiskInfoView,
-    DiskPartitionView,
-    FilesystemView,
-    FormatEntireView,
-    GuidedDiskSelectionView,
-    GuidedFilesystemView,
-    LVMVolumeGroupView,
-    PartitionView,
-    RaidView,
-    )
+# Each view is imported the first time it is used.
+from subiquity.ui import views
 
 
 log = logging.getLogger("subiquitycore.controller.filesystem")
 
-BIOS_GRUB_SIZE_BYTES = 2 * 1024 * 1024   # 2MiB
-UEFI_GRUB_SIZE_BYTES = 512 * 1024 * 1024  # 512MiB EFI partition
-
 
 class FilesystemController(BaseController):
 
+    probe_scopes = ('storage.block-only',)
+
     def __init__(self, common):
         super().__init__(common)
         self.model = self.base_model.filesystem
@@ -53,13 +43,42 @@ class FilesystemController(BaseController):
         # self.iscsi_model = IscsiDiskModel()
         # self.ceph_model = CephDiskModel()
         self.model.probe()  # probe before we complete
+        # The application normally started watching block devices before
+        # this controller was created; this just subscribes to that.
+        self.block_observer, fds = self.prober.probe_storage_events(self)
+        for fd in fds:
+            self.loop.watch_file(fd, partial(self.block_observer.data_ready, fd))
+
+    def block_device_changed(self, path, data):
+        self.model.block_device_changed(path, data)
+        self._refresh_view()
+
+    def block_device_removed(self, path):
+        disk = self.model.block_device_removed(path)
+        if disk is None:
+            self._refresh_view()
+            return
+        if getattr(self.ui.frame.body, 'disk', None) is disk:
+            # The screen was for the disk that has gone.
+            self.manual()
+        else:
+            self._refresh_view()
+        self.ui.set_footer(
+            _("{} was removed, so the partitions and filesystems on it "
+              "have been removed from the configuration").format(path))
+
+    def _refresh_view(self):
+        v = self.ui.frame.body
+        if getattr(v, 'controller', None) is self \
+          and hasattr(v, 'refresh_model_inputs'):
+            v.refresh_model_inputs()
 
     def default(self):
         title = _("Filesystem setup")
         footer = (_("Choose guided or manual partitioning"))
         self.ui.set_header(title)
         self.ui.set_footer(footer)
-        self.ui.set_body(GuidedFilesystemView(self.model, self))
+        self.ui.set_body(views.GuidedFilesystemView(self.model, self))
         if self.answers['guided']:
             self.guided()
         elif self.answers['manual']:
@@ -70,7 +89,7 @@ class FilesystemController(BaseController):
         footer = (_("Select available disks to format and mount"))
         self.ui.set_header(title)
         self.ui.set_footer(footer)
-        self.ui.set_body(FilesystemView(self.model, self))
+        self.ui.set_body(views.FilesystemView(self.model, self))
         if self.answers['guided']:
             self.finish()
 
@@ -79,7 +98,7 @@ class FilesystemController(BaseController):
         footer = (_("Choose the installation target"))
         self.ui.set_header(title)
         self.ui.set_footer(footer)
-        v = GuidedDiskSelectionView(self.model, self)
+        v = views.GuidedDiskSelectionView(self.model, self)
         self.ui.set_body(v)
         if self.answers['guided']:
             index = self.answers['guided-index']
@@ -116,7 +135,7 @@ class FilesystemController(BaseController):
                   "without partitions"))
         self.ui.set_header(title)
         self.ui.set_footer(footer)
-        dp_view = DiskPartitionView(self.model, self, disk)
+        dp_view = views.DiskPartitionView(self.model, self, disk)
 
         self.ui.set_body(dp_view)
 
@@ -124,63 +143,61 @@ class FilesystemController(BaseController):
         log.debug("Adding partition to {}".format(disk))
         footer = _("Select whole disk, or partition, to format and mount.")
         self.ui.set_footer(footer)
-        adp_view = PartitionView(self.model, self, disk)
+        adp_view = views.PartitionView(self.model, self, disk)
         self.ui.set_body(adp_view)
 
     def edit_partition(self, disk, partition):
         log.debug("Editing partition {}".format(partition))
         footer = _("Edit partition details format and mount.")
         self.ui.set_footer(footer)
-        adp_view = PartitionView(self.model, self, disk, partition)
+        adp_view = views.PartitionView(self.model, self, disk, partition)
         self.ui.set_body(adp_view)
 
     def delete_partition(self, part):
-        old_fs = part.fs()
-        if old_fs is not None:
-            self.model._filesystems.remove(old_fs)
-            part._fs = None
-            mount = old_fs.mount()
-            if mount is not None:
-                old_fs._mount = None
-                self.model._mounts.remove(mount)
-        part.device.partitions().remove(part)
-        self.model._partitions.remove(part)
+        self.model.remove_partition(part)
         self.partition_disk(part.device)
 
+    def _add_mount(self, fs, path):
+        """Mount fs at path, unless something already is.
+
+        The forms do not offer a path that is in use, so this should not
+        happen, but if it does the filesystem is left unmounted and the
+        returned message says why.
+        """
+        existing = self.model.get_mount(path)
+        if existing is None:
+            self.model.add_mount(fs, path)
+            return None
+        log.warning(
+            "not mounting %s at %s: %s is already mounted there",
+            fs.volume.path, path, existing.device.volume.path)
+        return _("{} is already mounted at {}, so {} was not mounted").format(
+            existing.device.volume.path, path, fs.volume.path)
+
     def partition_disk_handler(self, disk, partition, spec):
         log.debug('spec: {}'.format(spec))
         log.debug('disk.freespace: {}'.format(disk.free))
 
+        error = None
         if partition is not None:
-            partition.number = spec['partnum']
-            partition.size = spec['size']
+            self.model.renumber_partition(partition, spec['partnum'])
+            self.model.resize_partition(partition, spec['size'])
             old_fs = partition.fs()
             if old_fs is not None:
-                self.model._filesystems.remove(old_fs)
-                partition._fs = None
-                mount = old_fs.mount()
-                if mount is not None:
-                    old_fs._mount = None
-                    self.model._mounts.remove(mount)
+                self.model.remove_filesystem(old_fs)
             if spec['fstype'].label is not None:
                 fs = self.model.add_filesystem(partition, spec['fstype'].label)
                 if spec['mount']:
-                  self.model.add_mount(fs, spec['mount'])
+                  error = self._add_mount(fs, spec['mount'])
             self.partition_disk(disk)
+            if error is not None:
+                self.ui.set_footer(error)
             return
 
         system_bootable = self.model.bootable()
         log.debug('model has bootable device? {}'.format(system_bootable))
         if not system_bootable and len(disk.partitions()) == 0:
-            if self.is_uefi():
-                log.debug('Adding EFI partition first')
-                part = self.model.add_partition(disk=disk, partnum=1, size=UEFI_GRUB_SIZE_BYTES, flag='boot')
-                fs = self.model.add_filesystem(part, 'fat32')
-                self.model.add_mount(fs, '/boot/efi')
-            else:
-                log.debug('Adding grub_bios gpt partition first')
-                part = self.model.add_partition(disk=disk, partnum=1, size=BIOS_GRUB_SIZE_BYTES, flag='bios_grub')
-            disk.grub_device = True
+            part = self.model.add_boot_partition(disk, self.is_uefi())
 
             # adjust downward the partition size to accommodate
             # the offset and bios/grub partition
@@ -195,26 +212,26 @@ class FilesystemController(BaseController):
         if spec['fstype'].label is not None:
             fs = self.model.add_filesystem(part, spec['fstype'].label)
             if spec['mount']:
-                self.model.add_mount(fs, spec['mount'])
+                error = self._add_mount(fs, spec['mount'])
 
         log.info("Successfully added partition")
         self.partition_disk(disk)
+        if error is not None:
+            self.ui.set_footer(error)
 
     def add_format_handler(self, volume, spec, back):
         log.debug('add_format_handler')
+        error = None
         old_fs = volume.fs()
         if old_fs is not None:
-            self.model._filesystems.remove(old_fs)
-            volume._fs = None
-            mount = old_fs.mount()
-            if mount is not None:
-                old_fs._mount = None
-                self.model._mounts.remove(mount)
+            self.model.remove_filesystem(old_fs)
         if spec['fstype'].label is not None:
             fs = self.model.add_filesystem(volume, spec['fstype'].label)
             if spec['mount']:
-                self.model.add_mount(fs, spec['mount'])
+                error = self._add_mount(fs, spec['mount'])
         back()
+        if error is not None:
+            self.ui.set_footer(error)
 
     def connect_iscsi_disk(self, *args, **kwargs):
         # title = ("Disk and filesystem setup")
@@ -243,7 +260,7 @@ class FilesystemController(BaseController):
                    "and then specify the Volume Group name. ")
         self.ui.set_header(title, excerpt)
         self.ui.set_footer(footer)
-        self.ui.set_body(LVMVolumeGroupView(self.model, self.signal))
+        self.ui.set_body(views.LVMVolumeGroupView(self.model, self.signal))
 
     def create_raid(self, *args, **kwargs):
         title = ("Create software RAID (\"MD\") disk")
@@ -255,8 +272,8 @@ class FilesystemController(BaseController):
                    "the same size and speed.")
         self.ui.set_header(title, excerpt)
         self.ui.set_footer(footer)
-        self.ui.set_body(RaidView(self.model,
-                                  self.signal))
+        self.ui.set_body(views.RaidView(self.model,
+                                        self.signal))
 
     def create_bcache(self, *args, **kwargs):
         title = ("Create hierarchical storage (\"bcache\") disk")
@@ -267,8 +284,8 @@ class FilesystemController(BaseController):
 
         self.ui.set_header(title, excerpt)
         self.ui.set_footer(footer)
-        self.ui.set_body(BcacheView(self.model,
-                                    self.signal))
+        self.ui.set_body(views.BcacheView(self.model,
+                                          self.signal))
 
     def add_raid_dev(self, result):
         log.debug('add_raid_dev: result={}'.format(result))
@@ -281,7 +298,7 @@ class FilesystemController(BaseController):
         footer = _("Format or mount whole disk.")
         self.ui.set_header(header)
         self.ui.set_footer(footer)
-        afv_view = FormatEntireView(self.model, self, disk, lambda : self.partition_disk(disk))
+        afv_view = views.FormatEntireView(self.model, self, disk, lambda : self.partition_disk(disk))
         self.ui.set_body(afv_view)
 
     def format_mount_partition(self, partition):
@@ -294,7 +311,7 @@ class FilesystemController(BaseController):
             footer = _("Format and mount partition.")
         self.ui.set_header(header)
         self.ui.set_footer(footer)
-        afv_view = FormatEntireView(self.model, self, partition, self.manual)
+        afv_view = views.FormatEntireView(self.model, self, partition, self.manual)
         self.ui.set_body(afv_view)
 
     def show_disk_information_next(self, disk):
@@ -355,7 +372,7 @@ class FilesystemController(BaseController):
 """
         result = template.format(**dinfo)
         log.debug('calling DiskInfoView()')
-        disk_info_view = DiskInfoView(self.model, self, disk, result)
+        disk_info_view = views.DiskInfoView(self.model, self, disk, result)
         footer = _('Select next or previous disks with n and p')
         self.ui.set_footer(footer)
         self.ui.set_body(disk_info_view)
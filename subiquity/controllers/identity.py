@@ -19,7 +19,7 @@ import logging
 from subiquitycore.controller import BaseController
 from subiquitycore.user import create_user
 
-from subiquity.ui.views import IdentityView
+from subiquity.ui.views.identity import IdentityView
 
 log = logging.getLogger('subiquity.controllers.identity')
 
@@ -21,7 +21,7 @@ from subiquitycore.controller import BaseController
 from subiquitycore.ui.dummy import DummyView
 
 from subiquity.models.installpath import InstallpathModel
-from subiquity.ui.views import InstallpathView
+from subiquity.ui.views.installpath import InstallpathView
 
 log = logging.getLogger('subiquity.controller.installpath')
 
@@ -13,7 +13,6 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import datetime
 import fcntl
 import logging
 import os
@@ -21,19 +20,16 @@ import random
 import subprocess
 import sys
 
-import yaml
-
-from systemd import journal
-
 from subiquitycore import utils
 from subiquitycore.controller import BaseController
 
 from subiquity.curtin import (
     CURTIN_INSTALL_LOG,
     CURTIN_POSTINSTALL_LOG,
+    curtin_config_path,
     curtin_install_cmd,
+    write_curtin_config,
     )
-from subiquity.ui.views import ProgressView
 
 
 log = logging.getLogger("subiquitycore.controller.installprogress")
@@ -55,6 +51,10 @@ class InstallProgressController(BaseController):
         ('installprogress:identity-config-done',   'identity_config_done'),
     ]
 
+    # Must be listening for filesystem-config-done before the
+    # Filesystem screen is finished.
+    prewarm = True
+
     def __init__(self, common):
         super().__init__(common)
         self.answers = self.all_answers.get('InstallProgress', {})
@@ -113,6 +113,7 @@ class InstallProgressController(BaseController):
         self.ui.set_footer("Running install... %s" % (desc,))
 
     def start_journald_listener(self, identifier, callback):
+        from systemd import journal
         reader = journal.Reader()
         reader.seek_tail()
         reader.add_match("SYSLOG_IDENTIFIER={}".format(identifier))
@@ -123,30 +124,21 @@ class InstallProgressController(BaseController):
                 callback(event)
         self.loop.watch_file(reader.fileno(), watch)
 
-    def _write_config(self, path, config):
-        with open(path, 'w') as conf:
-            datestr = '# Autogenerated by SUbiquity: {} UTC\n'.format(
-                str(datetime.datetime.utcnow()))
-            conf.write(datestr)
-            conf.write(yaml.dump(config))
-
     def _get_curtin_command(self, install_step):
-        config_file_name = 'subiquity-curtin-%s.conf' % (install_step,)
+        config_location = curtin_config_path(install_step, self.opts.dry_run)
 
         if self.opts.dry_run:
-            config_location = os.path.join('.subiquity/', config_file_name)
             log.debug("Installprogress: this is a dry-run")
             curtin_cmd = [
                 "python3", "scripts/replay-curtin-log.py",
                 self.reporting_url, "examples/curtin-events-%s.json" % (install_step,),
                 ]
         else:
-            config_location = os.path.join('/tmp', config_file_name)
             log.debug("Installprogress: this is the *REAL* thing")
             configs = [config_location]
             curtin_cmd = curtin_install_cmd(configs)
 
-        self._write_config(
+        write_curtin_config(
             config_location,
             self.base_model.render(
                 install_step=install_step, reporting_url=self.reporting_url))
@@ -163,7 +155,9 @@ class InstallProgressController(BaseController):
         curtin_cmd = self._get_curtin_command("install")
 
         log.debug('Curtin install cmd: {}'.format(curtin_cmd))
-        self.run_in_bg(lambda: self.run_command_logged(curtin_cmd, CURTIN_INSTALL_LOG), self.curtin_install_completed)
+        self.run_in_bg(
+            lambda: self.run_command_logged(curtin_cmd, CURTIN_INSTALL_LOG),
+            self.curtin_install_completed, lane='install')
 
     def curtin_install_completed(self, fut):
         returncode = fut.result()
@@ -198,7 +192,9 @@ class InstallProgressController(BaseController):
         curtin_cmd = self._get_curtin_command("postinstall")
 
         log.debug('Curtin postinstall cmd: {}'.format(curtin_cmd))
-        self.run_in_bg(lambda: self.run_command_logged(curtin_cmd, CURTIN_POSTINSTALL_LOG), self.curtin_postinstall_completed)
+        self.run_in_bg(
+            lambda: self.run_command_logged(curtin_cmd, CURTIN_POSTINSTALL_LOG),
+            self.curtin_postinstall_completed, lane='install')
 
     def curtin_postinstall_completed(self, fut):
         returncode = fut.result()
@@ -215,6 +211,8 @@ class InstallProgressController(BaseController):
         self.ui.set_footer("")
         self.progress_view.set_status(_("Finished install!"))
         self.progress_view.show_complete()
+        if self.memory is not None:
+            self.memory.snapshot("install-complete")
         if self.answers['reboot']:
             self.loop.set_alarm_in(0.01, lambda loop, userdata: self.reboot())
 
@@ -273,6 +271,7 @@ class InstallProgressController(BaseController):
 
     def default(self):
         log.debug('show_progress called')
+        from subiquity.ui.views.installprogress import ProgressView
         title = _("Installing system")
         excerpt = _("Please wait for the installation to finish.")
         footer = _("Thank you for using Ubuntu!")
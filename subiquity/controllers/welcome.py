@@ -17,7 +17,7 @@ import logging
 
 from subiquitycore.controller import BaseController
 
-from subiquity.ui.views import WelcomeView
+from subiquity.ui.views.welcome import WelcomeView
 
 log = logging.getLogger('subiquity.controllers.welcome')
 
@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from collections import OrderedDict
+import datetime
 import logging
 import os
 
@@ -68,3 +69,21 @@ def curtin_install_cmd(configs):
     log.info('curtin install command: {}'.format(" ".join(install_cmd)))
 
     return install_cmd
+
+
+def curtin_config_path(install_step, dry_run):
+    """Return where the curtin config for install_step is written."""
+    if dry_run:
+        config_dir = '.subiquity'
+    else:
+        config_dir = '/tmp'
+    return os.path.join(
+        config_dir, 'subiquity-curtin-%s.conf' % (install_step,))
+
+
+def write_curtin_config(path, config):
+    with open(path, 'w') as conf:
+        datestr = '# Autogenerated by SUbiquity: {} UTC\n'.format(
+            str(datetime.datetime.utcnow()))
+        conf.write(datestr)
+        conf.write(yaml.dump(config))
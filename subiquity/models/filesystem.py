@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
 import collections
 import glob
 import logging
@@ -26,6 +27,9 @@ import attr
 HUMAN_UNITS = ['B', 'K', 'M', 'G', 'T', 'P']
 log = logging.getLogger('subiquity.models.filesystem')
 
+BIOS_GRUB_SIZE_BYTES = 2 * 1024 * 1024   # 2MiB
+UEFI_GRUB_SIZE_BYTES = 512 * 1024 * 1024  # 512MiB EFI partition
+
 
 @attr.s
 class FS:
@@ -124,10 +128,18 @@ class Disk:
     name = attr.ib(default="")
     grub_device = attr.ib(default=False)
 
-    _partitions = attr.ib(default=attr.Factory(list), repr=False) # [Partition]
+    _partitions = attr.ib(default=attr.Factory(collections.OrderedDict), repr=False) # id -> Partition
     _fs = attr.ib(default=None, repr=False) # Filesystem
+    # The sum of the sizes of _partitions, kept up to date by
+    # FilesystemModel so that used and free do not have to add them up.
+    _partitions_size = attr.ib(default=0, repr=False)
+    # The free space on the disk, created when the first partition is
+    # added.
+    _extents = attr.ib(default=None, repr=False) # ExtentMap
     def partitions(self):
-        return self._partitions
+        # A live view: copy it before removing partitions while
+        # iterating over it.
+        return self._partitions.values()
     def fs(self):
         return self._fs
 
@@ -146,8 +158,10 @@ class Disk:
         self.preserve = False
         self.name = ''
         self.grub_device = ''
-        self._partitions = []
+        self._partitions = collections.OrderedDict()
         self._fs = None
+        self._partitions_size = 0
+        self._extents = None
 
     @property
     def available(self):
@@ -156,16 +170,23 @@ class Disk:
     @property
     def next_partnum(self):
         partnums = set()
-        for p in self._partitions:
+        for p in self._partitions.values():
             partnums.add(p.number)
         i = 1
         while i in partnums:
             i += 1
         return i
 
+    @property
+    def partition_end(self):
+        """The offset every partition must end at or before."""
+        return self._info.size - LAST_PARTITION_GAP
+
     @property
     def size(self):
-        return self._info.size - (2<<20) # The first and last megabyte of the disk are not usable.
+        # The space partitions can use, between the reserved first and
+        # last megabytes.
+        return self.partition_end - FIRST_PARTITION_OFFSET
 
     def desc(self):
         return "local disk"
@@ -174,15 +195,27 @@ class Disk:
     def used(self):
         if self._fs is not None:
             return self.size
-        r = 0
-        for p in self._partitions:
-            r += p.size
-        return r
+        return self._partitions_size
 
     @property
     def free(self):
         return self.size - self.used
 
+    @property
+    def largest_free(self):
+        """The size of the largest partition that can be added."""
+        if self._fs is not None:
+            return 0
+        if self._extents is None:
+            return self.size
+        return self._extents.largest()
+
+    def free_after(self, partition):
+        """How much partition can grow by."""
+        if self._extents is None:
+            return 0
+        return self._extents.gap_at(partition.offset + partition.size)
+
 
 @attr.s
 class Partition:
@@ -192,6 +225,7 @@ class Partition:
     number = attr.ib(default=0)
     device = attr.ib(default=None) # Disk
     size = attr.ib(default=None)
+    offset = attr.ib(default=None)
     wipe = attr.ib(default=None)
     flag = attr.ib(default=None)
     preserve = attr.ib(default=False)
@@ -243,10 +277,146 @@ class Mount:
     path = attr.ib(default=None)
 
 
+# The first and last megabyte of a disk are not used for partitions.
+FIRST_PARTITION_OFFSET = 1 << 20
+LAST_PARTITION_GAP = 1 << 20
+
+
+class NoSpaceError(Exception):
+    """There is not enough free space on a disk for a partition."""
+
+
 def align_up(size, block_size=1 << 20):
     return (size + block_size - 1) & ~(block_size - 1)
 
 
+class ExtentMap:
+    """The free space on a disk, as a set of gaps.
+
+    Each gap is kept in two sorted lists: by offset, to find the gaps
+    either side of space that is freed so they can be merged, and by
+    (size, offset), to find the smallest gap a new partition fits in.
+    Both are searched with bisect.  Partitions start on a multiple of
+    alignment and their sizes are rounded up to one, except that a
+    partition can take the whole of the rest of a gap.
+    """
+
+    def __init__(self, start, end, alignment=1 << 20):
+        self.alignment = alignment
+        self._offsets = []  # gap offsets, sorted
+        self._sizes = {}  # gap offset -> gap size
+        self._by_size = []  # (gap size, gap offset), sorted
+        self._add_gap(start, end - start)
+
+    def _add_gap(self, offset, size):
+        if size <= 0:
+            return
+        bisect.insort(self._offsets, offset)
+        self._sizes[offset] = size
+        bisect.insort(self._by_size, (size, offset))
+
+    def _remove_gap(self, offset):
+        size = self._sizes.pop(offset)
+        del self._offsets[bisect.bisect_left(self._offsets, offset)]
+        del self._by_size[bisect.bisect_left(self._by_size, (size, offset))]
+        return size
+
+    def _usable(self, offset, size):
+        """Return where an aligned partition in a gap starts and how much
+        of the gap it could have."""
+        start = align_up(offset, self.alignment)
+        return start, offset + size - start
+
+    def gaps(self):
+        return [(offset, self._sizes[offset]) for offset in self._offsets]
+
+    def largest(self):
+        """Return the size of the largest partition that would fit."""
+        best = 0
+        for size, offset in reversed(self._by_size):
+            if size <= best:
+                break
+            best = max(best, self._usable(offset, size)[1])
+        return best
+
+    def gap_at(self, offset):
+        """Return the size of the gap starting at offset, or 0."""
+        return self._sizes.get(offset, 0)
+
+    def allocate(self, size, offset=None):
+        """Take space for a partition of size bytes.
+
+        The partition goes at offset if that is given and in the
+        smallest gap it fits in if not.  Returns (offset, size), where
+        size is what was actually taken.
+        """
+        if offset is None:
+            i = bisect.bisect_left(self._by_size, (size, -1))
+            for gap_size, gap_offset in self._by_size[i:]:
+                start, usable = self._usable(gap_offset, gap_size)
+                if usable >= size:
+                    break
+            else:
+                raise NoSpaceError(
+                    "no gap of {} bytes to put a partition in".format(size))
+            offset = start
+        else:
+            i = bisect.bisect_right(self._offsets, offset) - 1
+            if i < 0:
+                raise NoSpaceError("{} is not free".format(offset))
+            gap_offset = self._offsets[i]
+            gap_size = self._sizes[gap_offset]
+            usable = gap_offset + gap_size - offset
+            if usable < size:
+                raise NoSpaceError(
+                    "no room for {} bytes at {}".format(size, offset))
+        size = min(align_up(size, self.alignment), usable)
+        self._remove_gap(gap_offset)
+        self._add_gap(gap_offset, offset - gap_offset)
+        self._add_gap(offset + size, gap_offset + gap_size - offset - size)
+        if offset - gap_offset:
+            log.debug(
+                "%s bytes before %s lost to alignment",
+                offset - gap_offset, offset)
+        return offset, size
+
+    def free(self, offset, size):
+        """Give back space, merging it with the gaps either side."""
+        i = bisect.bisect_left(self._offsets, offset)
+        if i > 0:
+            before = self._offsets[i - 1]
+            if before + self._sizes[before] == offset:
+                size += offset - before
+                offset = before
+                self._remove_gap(before)
+        after = offset + size
+        if after in self._sizes:
+            size += self._remove_gap(after)
+        self._add_gap(offset, size)
+
+    def resize(self, offset, old_size, new_size):
+        """Grow or shrink the partition at offset in place.
+
+        Returns the new size, which is rounded up like the size of a new
+        partition.  A shrink that would free less than one alignment unit
+        leaves the partition as it is, as that space could never be used
+        by another partition.
+        """
+        if new_size <= old_size:
+            new_size = align_up(new_size, self.alignment)
+            if old_size - new_size < self.alignment:
+                return old_size
+            self.free(offset + new_size, old_size - new_size)
+            return new_size
+        grow = new_size - old_size
+        end = offset + old_size
+        if self.gap_at(end) < grow:
+            raise NoSpaceError(
+                "no room to grow the partition at {} to {} bytes".format(
+                    offset, new_size))
+        return old_size + self.allocate(grow, end)[1]
+
+
 class FilesystemModel(object):
 
     supported_filesystems = [
@@ -272,16 +442,28 @@ class FilesystemModel(object):
                     longest_fs_name = len(fs.label)
             fs_by_name[fs.label] = fs
 
-    def __init__(self, prober):
+    def __init__(self, prober, check_accounting=False, alignment=1 << 20):
         self.prober = prober
+        # Partitions start on a multiple of this many bytes.
+        self.alignment = alignment
+        # If set, check the used space of a disk is right every time it
+        # changes, which makes every change O(partitions on the disk).
+        self.check_accounting = check_accounting
         self._available_disks = {} # keyed by path, eg /dev/sda
         self.reset()
 
     def reset(self):
-        self._disks = collections.OrderedDict() # only gets populated when something uses the disk
-        self._filesystems = []
-        self._partitions = []
-        self._mounts = []
+        # The objects in the configuration, keyed by id, apart from the
+        # disks which are keyed by path and only get added when
+        # something uses them.
+        self._disks = collections.OrderedDict()
+        self._partitions = collections.OrderedDict()
+        self._filesystems = collections.OrderedDict()
+        self._mounts = collections.OrderedDict()
+        # Indexes into the above.
+        self._mounts_by_path = {}
+        self._volumes_by_path = {} # the disks and partitions
+        self._boot_partitions = set() # ids
         for k, d in self._available_disks.items():
             self._available_disks[k].reset()
 
@@ -289,11 +471,11 @@ class FilesystemModel(object):
         r = []
         for d in self._disks.values():
             r.append(asdict(d))
-        for p in self._partitions:
+        for p in self._partitions.values():
             r.append(asdict(p))
-        for f in self._filesystems:
+        for f in self._filesystems.values():
             r.append(asdict(f))
-        for m in sorted(self._mounts, key=lambda m:len(m.path)):
+        for m in sorted(self._mounts.values(), key=lambda m:len(m.path)):
             r.append(asdict(m))
         return r
 
@@ -315,45 +497,176 @@ class FilesystemModel(object):
                     mounted_disks.add('/dev/' + paths[0].split('/')[3])
         return mounted_disks
 
-    def probe(self):
+    def probe(self, exclude_mounted=True):
+        """Find the disks that can be installed to.
+
+        Disks mounted on this system are skipped unless exclude_mounted
+        is false (which makes sense when the storage data was captured
+        on a different machine).
+        """
         storage = self.prober.get_storage()
-        currently_mounted = self._get_system_mounted_disks()
+        currently_mounted = set()
+        if exclude_mounted:
+            currently_mounted = self._get_system_mounted_disks()
         for path, data in storage.items():
             log.debug("fs probe %s", path)
             if path in currently_mounted:
                 continue
-            if data['DEVTYPE'] == 'disk' \
-              and not data["DEVPATH"].startswith('/devices/virtual') \
-              and data["MAJOR"] != "2" \
-              and data['attrs'].get('ro') != "1":
+            if self._can_install_to(data):
                 #log.debug('disk={}\n{}'.format(
                 #    path, json.dumps(data, indent=4, sort_keys=True)))
                 info = self.prober.get_storage_info(path)
                 self._available_disks[path] = Disk.from_info(info)
 
+    @staticmethod
+    def _can_install_to(data):
+        return 'unprobed' not in data \
+          and data['DEVTYPE'] == 'disk' \
+          and not data["DEVPATH"].startswith('/devices/virtual') \
+          and data["MAJOR"] != "2" \
+          and data['attrs'].get('ro') != "1"
+
+    # Called by the prober's block device observer, after it has updated
+    # the storage data.
+
+    def block_device_changed(self, path, data):
+        if not self._can_install_to(data) \
+          or path in self._get_system_mounted_disks():
+            self.block_device_removed(path)
+            return
+        info = self.prober.get_storage_info(path)
+        disk = self._available_disks.get(path)
+        if disk is None:
+            log.debug("disk %s appeared", path)
+            self._available_disks[path] = Disk.from_info(info)
+        else:
+            log.debug("disk %s changed", path)
+            disk._info = info
+
+    def block_device_removed(self, path):
+        """Forget the disk at path.
+
+        If the disk was part of the configuration, everything on it is
+        removed from the configuration too, and the disk is returned.
+        """
+        disk = self._available_disks.pop(path, None)
+        if disk is None:
+            return None
+        log.debug("disk %s went away", path)
+        if self.get_volume(path) is not disk:
+            return None
+        log.warning("%s went away, removing it from the configuration", path)
+        for partition in list(disk.partitions()):
+            self.remove_partition(partition)
+        if disk._fs is not None:
+            self.remove_filesystem(disk._fs)
+        del self._disks[path]
+        del self._volumes_by_path[path]
+        return disk
+
     def _use_disk(self, disk):
         if disk.path not in self._disks:
             self._disks[disk.path] = disk
+            self._volumes_by_path[disk.path] = disk
 
     def all_disks(self):
         return sorted(self._available_disks.values(), key=lambda x:x.serial)
 
+    def all_filesystems(self):
+        return list(self._filesystems.values())
+
+    def all_mounts(self):
+        return list(self._mounts.values())
+
     def get_disk(self, path):
         return self._available_disks.get(path)
 
-    def add_partition(self, disk, partnum, size, flag=""):
-        if size > disk.free:
-            raise Exception("%s > %s", size, disk.free)
-        real_size = align_up(size)
-        log.debug("add_partition: rounded size from %s to %s", size, real_size)
-        self._use_disk(disk)
+    def get_volume(self, path):
+        """Return the disk or partition in the configuration at path."""
+        return self._volumes_by_path.get(path)
+
+    def get_mount(self, path):
+        """Return the mount at path (/boot, say), or None."""
+        return self._mounts_by_path.get(path)
+
+    def _extents(self, disk):
+        if disk._extents is None:
+            disk._extents = ExtentMap(
+                FIRST_PARTITION_OFFSET, disk.partition_end,
+                self.alignment)
+        return disk._extents
+
+    def add_partition(self, disk, partnum, size, flag="", offset=None):
+        if size <= 0 or size > disk.free:
+            raise NoSpaceError(
+                "cannot add a partition of {} bytes to {}, which has {} "
+                "bytes free".format(size, disk.path, disk.free))
         if disk._fs is not None:
             raise Exception("%s is already formatted" % (disk.path,))
-        p = Partition(device=disk, number=partnum, size=real_size, flag=flag)
-        disk._partitions.append(p)
-        self._partitions.append(p)
+        offset, real_size = self._extents(disk).allocate(size, offset)
+        log.debug("add_partition: rounded size from %s to %s", size, real_size)
+        self._use_disk(disk)
+        p = Partition(
+            device=disk, number=partnum, size=real_size, flag=flag,
+            offset=offset)
+        disk._partitions[p.id] = p
+        disk._partitions_size += real_size
+        self._partitions[p.id] = p
+        self._volumes_by_path[p.path] = p
+        if flag in ('bios_grub', 'boot'):
+            self._boot_partitions.add(p.id)
+        self._check_accounting(disk)
         return p
 
+    def renumber_partition(self, partition, number):
+        del self._volumes_by_path[partition.path]
+        partition.number = number
+        self._volumes_by_path[partition.path] = partition
+
+    def resize_partition(self, partition, size):
+        """Resize partition in place, to at most as far as it can grow.
+
+        Sizes typed into the UI are rounded, so a size a little larger
+        than there is room for means "as large as possible".
+        """
+        disk = partition.device
+        size = min(size, partition.size + disk.free_after(partition))
+        if size == partition.size:
+            return
+        size = self._extents(disk).resize(
+            partition.offset, partition.size, size)
+        disk._partitions_size += size - partition.size
+        partition.size = size
+        self._check_accounting(disk)
+
+    def remove_partition(self, partition):
+        """Remove partition, and any filesystem and mount on it."""
+        if partition._fs is not None:
+            self.remove_filesystem(partition._fs)
+        disk = partition.device
+        del disk._partitions[partition.id]
+        disk._partitions_size -= partition.size
+        self._extents(disk).free(partition.offset, partition.size)
+        del self._partitions[partition.id]
+        del self._volumes_by_path[partition.path]
+        self._boot_partitions.discard(partition.id)
+        self._check_accounting(disk)
+
+    def _check_accounting(self, disk):
+        if not self.check_accounting:
+            return
+        expected = sum(p.size for p in disk._partitions.values())
+        if disk._partitions_size != expected:
+            raise Exception(
+                "{}: partitions recorded as using {} bytes but add up to "
+                "{}".format(disk.path, disk._partitions_size, expected))
+        if disk._extents is not None:
+            gaps = sum(size for offset, size in disk._extents.gaps())
+            if gaps + expected != disk.size:
+                raise Exception(
+                    "{}: {} bytes free and {} used but the disk has {}".format(
+                        disk.path, gaps, expected, disk.size))
+
     def add_filesystem(self, volume, fstype):
         log.debug("adding %s to %s", fstype, volume)
         if not volume.available:
@@ -364,20 +677,40 @@ class FilesystemModel(object):
         if volume._fs is not None:
             raise Exception("%s is already formatted")
         volume._fs = fs = Filesystem(volume=volume, fstype=fstype)
-        self._filesystems.append(fs)
+        self._filesystems[fs.id] = fs
         return fs
 
+    def remove_filesystem(self, fs):
+        """Remove fs, and its mount if it has one."""
+        if fs._mount is not None:
+            self.remove_mount(fs._mount)
+        fs.volume._fs = None
+        del self._filesystems[fs.id]
+
     def add_mount(self, fs, path):
         if fs._mount is not None:
             raise Exception("%s is already mounted")
+        if path in self._mounts_by_path:
+            raise Exception("something is already mounted at %s" % (path,))
         fs._mount = m = Mount(device=fs, path=path)
-        self._mounts.append(m)
+        self._mounts[m.id] = m
+        self._mounts_by_path[path] = m
         return m
 
-    def get_mountpoint_to_devpath_mapping(self):
+    def remove_mount(self, mount):
+        mount.device._mount = None
+        del self._mounts[mount.id]
+        del self._mounts_by_path[mount.path]
+
+    def get_mountpoint_to_devpath_mapping(self, exclude=None):
+        """Map each mount path to the device mounted there.
+
+        The mount exclude, if given, is left out.
+        """
         r = {}
-        for m in self._mounts:
-            r[m.path] = m.device.volume.path
+        for path, m in self._mounts_by_path.items():
+            if m is not exclude:
+                r[path] = m.device.volume.path
         return r
 
     def any_configuration_done(self):
@@ -385,14 +718,41 @@ class FilesystemModel(object):
 
     def can_install(self):
         # Do we need to check that there is a disk with the boot flag?
-        return '/' in self.get_mountpoint_to_devpath_mapping() and self.bootable()
+        return '/' in self._mounts_by_path and self.bootable()
+
+    def add_boot_partition(self, disk, uefi):
+        """Add the partition needed to boot from disk as partition 1.
+
+        This is an ESP on UEFI systems and a bios_grub partition
+        otherwise.
+        """
+        if uefi:
+            log.debug('Adding EFI partition first')
+            part = self.add_partition(disk=disk, partnum=1, size=UEFI_GRUB_SIZE_BYTES, flag='boot')
+            fs = self.add_filesystem(part, 'fat32')
+            self.add_mount(fs, '/boot/efi')
+        else:
+            log.debug('Adding grub_bios gpt partition first')
+            part = self.add_partition(disk=disk, partnum=1, size=BIOS_GRUB_SIZE_BYTES, flag='bios_grub')
+        disk.grub_device = True
+        return part
+
+    def add_guided_layout(self, disk, uefi, fstype='ext4'):
+        """Replace any configuration with one that installs to all of disk."""
+        self.reset()
+        size = disk.free
+        partnum = 1
+        if not self.bootable():
+            size -= self.add_boot_partition(disk, uefi).size
+            partnum = 2
+        part = self.add_partition(disk=disk, partnum=partnum, size=size)
+        fs = self.add_filesystem(part, fstype)
+        self.add_mount(fs, '/')
+        return part
 
     def bootable(self):
         ''' true if one disk has a boot partition '''
-        for p in self._partitions:
-            if p.flag == 'bios_grub' or p.flag == 'boot':
-                return True
-        return False
+        return len(self._boot_partitions) > 0
 
 
 ## class AttrDict(dict):
@@ -13,7 +13,6 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import gettext
 import logging
 from subiquitycore import i18n
 
@@ -37,15 +36,11 @@ class LocaleModel(object):
 
     def get_languages(self):
         languages = []
+        cur_lang = i18n.get_translation('iso_639_3')
         for code, name in self.supported_languages:
-            label = name
-            native = name
-            if gettext.find('iso_639_3'):
-                cur_lang = gettext.translation('iso_639_3')
-                label = cur_lang.gettext(name).capitalize()
-            if gettext.find('iso_639_3', languages=[code]):
-                native_lang = gettext.translation('iso_639_3', languages=[code])
-                native = native_lang.gettext(name).capitalize()
+            label = cur_lang.gettext(name).capitalize()
+            native_lang = i18n.get_translation('iso_639_3', code)
+            native = native_lang.gettext(name).capitalize()
             languages.append((code, label, native))
         return languages
 
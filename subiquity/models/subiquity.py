@@ -30,7 +30,10 @@ class SubiquityModel:
     def __init__(self, common):
         self.locale = LocaleModel()
         self.network = NetworkModel()
-        self.filesystem = FilesystemModel(common['prober'])
+        # dry-run is for development, where checking is worth the cost.
+        self.filesystem = FilesystemModel(
+            common['prober'],
+            check_accounting=getattr(common.get('opts'), 'dry_run', False))
         self.identity = IdentityModel()
 
     def _cloud_init_config(self):
@@ -1,7 +1,14 @@
 
 import unittest
 
-from subiquity.models.filesystem import dehumanize_size
+from subiquity.models.filesystem import (
+    dehumanize_size,
+    Disk,
+    ExtentMap,
+    FilesystemModel,
+    humanize_size,
+    )
+from subiquitycore.synthetic_machine import generate_machine_config
 
 class TestDehumanizeSize(unittest.TestCase):
 
@@ -62,3 +69,377 @@ class TestDehumanizeSize(unittest.TestCase):
                 else:
                     self.fail("dehumanize_size({!r}) did not error".format(input))
                 self.assertEqual(expected_error, actual_error)
+
+
+class FakeStorageInfo:
+
+    def __init__(self, size, name='/dev/sda'):
+        self.name = name
+        self.serial = 'serial'
+        self.model = 'model'
+        self.size = size
+
+
+class TestGuidedLayout(unittest.TestCase):
+
+    def make_model_and_disk(self):
+        model = FilesystemModel(prober=None)
+        disk = Disk.from_info(FakeStorageInfo(10 * 2**30))
+        model._available_disks[disk.path] = disk
+        return model, disk
+
+    def test_bios(self):
+        model, disk = self.make_model_and_disk()
+        model.add_guided_layout(disk, uefi=False)
+        self.assertEqual(
+            [p.flag for p in disk.partitions()], ['bios_grub', ''])
+        self.assertEqual(
+            model.get_mountpoint_to_devpath_mapping(), {'/': '/dev/sda2'})
+        self.assertTrue(model.can_install())
+        self.assertEqual(disk.free, 0)
+
+    def test_uefi(self):
+        model, disk = self.make_model_and_disk()
+        model.add_guided_layout(disk, uefi=True)
+        self.assertEqual([p.flag for p in disk.partitions()], ['boot', ''])
+        self.assertEqual(
+            sorted(model.get_mountpoint_to_devpath_mapping()),
+            ['/', '/boot/efi'])
+
+    def test_partitions_end_before_last_megabyte(self):
+        for size in 10 * 2**30, 20 * 10**9 + 12345:
+            for uefi in False, True:
+                with self.subTest(size=size, uefi=uefi):
+                    model = FilesystemModel(prober=None)
+                    disk = Disk.from_info(FakeStorageInfo(size))
+                    model._available_disks[disk.path] = disk
+                    model.add_guided_layout(disk, uefi=uefi)
+                    self.assertEqual(disk.free, 0)
+                    for p in disk.partitions():
+                        self.assertGreaterEqual(p.offset, MiB)
+                        self.assertLessEqual(p.offset + p.size, size - MiB)
+
+    def test_replaces_existing_config(self):
+        model, disk = self.make_model_and_disk()
+        model.add_guided_layout(disk, uefi=False)
+        model.add_guided_layout(disk, uefi=False)
+        self.assertEqual(len(disk.partitions()), 2)
+        self.assertEqual(len(model._mounts), 1)
+
+
+class TestAccounting(unittest.TestCase):
+
+    def setUp(self):
+        self.model = FilesystemModel(prober=None, check_accounting=True)
+        self.disk = Disk.from_info(FakeStorageInfo(10 * 2**30))
+        self.model._available_disks[self.disk.path] = self.disk
+
+    def test_add_and_remove(self):
+        p1 = self.model.add_partition(self.disk, 1, 2**30)
+        p2 = self.model.add_partition(self.disk, 2, 2**20 + 1)
+        self.assertEqual(self.disk.used, 2**30 + 2**21)
+        fs = self.model.add_filesystem(p1, 'ext4')
+        self.model.add_mount(fs, '/')
+        self.model.remove_partition(p1)
+        self.assertEqual(self.disk.used, 2**21)
+        self.assertEqual(self.disk.free, self.disk.size - 2**21)
+        self.assertEqual(self.model.all_filesystems(), [])
+        self.assertEqual(self.model.all_mounts(), [])
+        self.model.resize_partition(p2, 2**22)
+        self.assertEqual(self.disk.used, 2**22)
+
+    def test_formatted_disk_is_full(self):
+        self.model.add_filesystem(self.disk, 'ext4')
+        self.assertEqual(self.disk.used, self.disk.size)
+        self.assertFalse(self.disk.available)
+
+    def test_reset(self):
+        self.model.add_partition(self.disk, 1, 2**30)
+        self.model.reset()
+        self.assertEqual(self.disk.used, 0)
+
+    def test_check_finds_drift(self):
+        p = self.model.add_partition(self.disk, 1, 2**30)
+        p.size = 2**31
+        with self.assertRaises(Exception):
+            self.model.add_partition(self.disk, 2, 2**20)
+
+
+MiB = 1 << 20
+
+
+class TestExtentMap(unittest.TestCase):
+
+    def test_allocate_in_order(self):
+        extents = ExtentMap(MiB, 101 * MiB)
+        self.assertEqual(extents.allocate(10 * MiB), (MiB, 10 * MiB))
+        self.assertEqual(extents.allocate(MiB + 1), (11 * MiB, 2 * MiB))
+        self.assertEqual(extents.gaps(), [(13 * MiB, 88 * MiB)])
+
+    def test_alignment(self):
+        extents = ExtentMap(MiB, 101 * MiB, alignment=4 * MiB)
+        self.assertEqual(extents.allocate(MiB), (4 * MiB, 4 * MiB))
+        self.assertEqual(
+            extents.gaps(), [(MiB, 3 * MiB), (8 * MiB, 93 * MiB)])
+        self.assertEqual(extents.largest(), 93 * MiB)
+
+    def test_takes_unaligned_end(self):
+        extents = ExtentMap(MiB, 10 * MiB + 512)
+        self.assertEqual(
+            extents.allocate(9 * MiB + 512), (MiB, 9 * MiB + 512))
+        self.assertEqual(extents.gaps(), [])
+
+    def test_free_merges(self):
+        extents = ExtentMap(MiB, 101 * MiB)
+        a = extents.allocate(10 * MiB)
+        b = extents.allocate(10 * MiB)
+        c = extents.allocate(10 * MiB)
+        extents.free(*a)
+        extents.free(*c)
+        self.assertEqual(
+            extents.gaps(), [(MiB, 10 * MiB), (21 * MiB, 80 * MiB)])
+        extents.free(*b)
+        self.assertEqual(extents.gaps(), [(MiB, 100 * MiB)])
+
+    def test_best_fit(self):
+        extents = ExtentMap(MiB, 101 * MiB)
+        a = extents.allocate(5 * MiB)
+        extents.allocate(10 * MiB)
+        extents.free(*a)
+        # A small partition goes in the small gap, leaving the big one.
+        self.assertEqual(extents.allocate(2 * MiB), (MiB, 2 * MiB))
+        self.assertEqual(extents.largest(), 85 * MiB)
+
+    def test_no_room(self):
+        extents = ExtentMap(MiB, 11 * MiB)
+        extents.allocate(6 * MiB)
+        with self.assertRaises(Exception):
+            extents.allocate(6 * MiB)
+
+    def test_resize(self):
+        extents = ExtentMap(MiB, 101 * MiB)
+        offset, size = extents.allocate(10 * MiB)
+        extents.allocate(10 * MiB, 50 * MiB)
+        self.assertEqual(extents.resize(offset, size, 49 * MiB), 49 * MiB)
+        with self.assertRaises(Exception):
+            extents.resize(offset, 49 * MiB, 50 * MiB)
+        self.assertEqual(extents.resize(offset, 49 * MiB, 5 * MiB), 5 * MiB)
+        self.assertEqual(extents.gap_at(6 * MiB), 44 * MiB)
+
+    def test_shrink_by_less_than_alignment(self):
+        extents = ExtentMap(MiB, 10 * MiB + 512)
+        offset, size = extents.allocate(9 * MiB + 512)
+        self.assertEqual(extents.resize(offset, size, 9 * MiB), size)
+        self.assertEqual(extents.gaps(), [])
+
+
+class TestPartitionOffsets(unittest.TestCase):
+
+    def setUp(self):
+        self.model = FilesystemModel(prober=None, check_accounting=True)
+        self.disk = Disk.from_info(FakeStorageInfo(100 * MiB))
+        self.model._available_disks[self.disk.path] = self.disk
+
+    def test_deleted_partition_reused(self):
+        p1 = self.model.add_partition(self.disk, 1, 10 * MiB)
+        p2 = self.model.add_partition(self.disk, 2, 20 * MiB)
+        p3 = self.model.add_partition(self.disk, 3, 10 * MiB)
+        self.assertEqual(
+            [p.offset for p in (p1, p2, p3)], [MiB, 11 * MiB, 31 * MiB])
+        self.model.remove_partition(p2)
+        p4 = self.model.add_partition(self.disk, 2, 15 * MiB)
+        self.assertEqual(p4.offset, 11 * MiB)
+        self.assertEqual(self.disk.largest_free, 58 * MiB)
+        self.assertEqual(self.disk.free_after(p4), 5 * MiB)
+
+    def test_edit_full_disk_partition_unchanged(self):
+        # The size the partition screen shows rounds up for the first
+        # disk and down for the second.
+        for extra in 7919000, 12345:
+            disk = Disk.from_info(FakeStorageInfo(20 * 10**9 + extra))
+            self.model._available_disks[disk.path] = disk
+            part = self.model.add_partition(disk, 1, disk.largest_free)
+            size = part.size
+            shown = dehumanize_size(humanize_size(size))
+            self.assertNotEqual(shown, size)
+            self.model.resize_partition(part, shown)
+            self.assertEqual(part.size, size)
+
+    def test_partitions_end_before_last_megabyte(self):
+        disk = Disk.from_info(FakeStorageInfo(100 * MiB + 12345))
+        self.model._available_disks[disk.path] = disk
+        p1 = self.model.add_partition(disk, 1, 10 * MiB)
+        p2 = self.model.add_partition(disk, 2, disk.largest_free)
+        self.assertEqual(disk.free, 0)
+        self.assertEqual(p1.size + p2.size, disk.size)
+        self.assertEqual(p2.offset + p2.size, disk._info.size - MiB)
+        self.model.remove_partition(p2)
+        with self.assertRaises(Exception):
+            self.model.add_partition(disk, 2, 2 * MiB, offset=98 * MiB)
+
+    def test_resize_clamped(self):
+        p1 = self.model.add_partition(self.disk, 1, 10 * MiB)
+        self.model.add_partition(self.disk, 2, 10 * MiB, offset=50 * MiB)
+        self.model.resize_partition(p1, 60 * MiB)
+        self.assertEqual(p1.size, 49 * MiB)
+
+    def test_offset_rendered(self):
+        self.model.add_partition(self.disk, 1, 10 * MiB)
+        [part] = [a for a in self.model.render() if a['type'] == 'partition']
+        self.assertEqual(part['offset'], MiB)
+
+
+class TestIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.model = FilesystemModel(prober=None)
+        self.disk = Disk.from_info(FakeStorageInfo(10 * 2**30))
+        self.model._available_disks[self.disk.path] = self.disk
+
+    def test_lookups(self):
+        boot = self.model.add_boot_partition(self.disk, uefi=True)
+        part = self.model.add_partition(self.disk, 2, 2**30)
+        fs = self.model.add_filesystem(part, 'ext4')
+        mount = self.model.add_mount(fs, '/')
+        self.assertIs(self.model.get_mount('/'), mount)
+        self.assertIs(self.model.get_volume('/dev/sda2'), part)
+        self.assertIs(self.model.get_volume('/dev/sda'), self.disk)
+        self.assertTrue(self.model.bootable())
+        self.model.remove_partition(boot)
+        self.assertIsNone(self.model.get_mount('/boot/efi'))
+        self.assertIsNone(self.model.get_volume('/dev/sda1'))
+        self.assertEqual(list(self.disk.partitions()), [part])
+        self.assertFalse(self.model.bootable())
+
+    def test_remove_mount(self):
+        part = self.model.add_partition(self.disk, 1, 2**30)
+        fs = self.model.add_filesystem(part, 'ext4')
+        mount = self.model.add_mount(fs, '/srv')
+        self.model.remove_mount(mount)
+        self.assertIsNone(fs.mount())
+        self.assertEqual(self.model.get_mountpoint_to_devpath_mapping(), {})
+        self.assertEqual(self.model.all_filesystems(), [fs])
+
+    def test_mount_path_taken(self):
+        for number in 1, 2:
+            part = self.model.add_partition(self.disk, number, 2**30)
+            fs = self.model.add_filesystem(part, 'ext4')
+            if number == 1:
+                self.model.add_mount(fs, '/srv')
+        with self.assertRaises(Exception):
+            self.model.add_mount(fs, '/srv')
+
+    def test_renumber(self):
+        part = self.model.add_partition(self.disk, 1, 2**30)
+        self.model.renumber_partition(part, 3)
+        self.assertIsNone(self.model.get_volume('/dev/sda1'))
+        self.assertIs(self.model.get_volume('/dev/sda3'), part)
+
+    def test_mapping_exclude(self):
+        mounts = []
+        for number, path in (1, '/'), (2, '/srv'):
+            part = self.model.add_partition(self.disk, number, 2**30)
+            fs = self.model.add_filesystem(part, 'ext4')
+            mounts.append(self.model.add_mount(fs, path))
+        self.assertEqual(
+            self.model.get_mountpoint_to_devpath_mapping(exclude=mounts[1]),
+            {'/': '/dev/sda1'})
+
+    def test_partitions_is_live(self):
+        partitions = self.disk.partitions()
+        part = self.model.add_partition(self.disk, 1, 2**30)
+        self.assertEqual(list(partitions), [part])
+        self.model.remove_partition(part)
+        self.assertEqual(len(partitions), 0)
+
+    def test_render_order(self):
+        parts = [
+            self.model.add_partition(self.disk, n, 2**20) for n in (1, 2, 3)]
+        self.model.remove_partition(parts[1])
+        self.assertEqual(
+            [a['number'] for a in self.model.render()
+             if a['type'] == 'partition'],
+            [1, 3])
+
+
+class FakeProber:
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def get_storage(self):
+        return self.storage
+
+    def get_storage_info(self, path):
+        return FakeStorageInfo(int(self.storage[path]['attrs']['size']), path)
+
+
+def disk_data(size=10 * 2**30):
+    return {
+        'DEVTYPE': 'disk',
+        'DEVPATH': '/devices/pci0000:00/block/sdx',
+        'MAJOR': '8',
+        'attrs': {'size': str(size), 'ro': '0'},
+        }
+
+
+class TestBlockDeviceEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = {'/dev/sda': disk_data()}
+        self.model = FilesystemModel(FakeProber(self.storage))
+        self.model._get_system_mounted_disks = lambda: set()
+        self.model.probe()
+
+    def test_disk_appears(self):
+        self.storage['/dev/sdb'] = disk_data()
+        self.model.block_device_changed('/dev/sdb', self.storage['/dev/sdb'])
+        self.assertEqual(
+            sorted(self.model._available_disks), ['/dev/sda', '/dev/sdb'])
+
+    def test_disk_changes(self):
+        disk = self.model.get_disk('/dev/sda')
+        self.storage['/dev/sda'] = disk_data(20 * 2**30)
+        self.model.block_device_changed('/dev/sda', self.storage['/dev/sda'])
+        self.assertIs(self.model.get_disk('/dev/sda'), disk)
+        self.assertEqual(disk.size, 20 * 2**30 - (2 << 20))
+
+    def test_disk_becomes_read_only(self):
+        data = disk_data()
+        data['attrs']['ro'] = '1'
+        self.model.block_device_changed('/dev/sda', data)
+        self.assertEqual(self.model._available_disks, {})
+
+    def test_partition_ignored(self):
+        data = disk_data()
+        data['DEVTYPE'] = 'partition'
+        self.model.block_device_changed('/dev/sda1', data)
+        self.assertEqual(list(self.model._available_disks), ['/dev/sda'])
+
+    def test_disk_removed(self):
+        self.assertIsNone(self.model.block_device_removed('/dev/sda'))
+        self.assertEqual(self.model._available_disks, {})
+
+    def test_disk_in_use_removed(self):
+        disk = self.model.get_disk('/dev/sda')
+        self.model.add_guided_layout(disk, uefi=True)
+        self.assertIs(self.model.block_device_removed('/dev/sda'), disk)
+        self.assertEqual(self.model.render(), [])
+        self.assertEqual(len(disk.partitions()), 0)
+        self.assertIsNone(self.model.get_volume('/dev/sda'))
+        self.assertIsNone(self.model.get_volume('/dev/sda1'))
+        self.assertEqual(self.model.get_mountpoint_to_devpath_mapping(), {})
+        self.assertFalse(self.model.bootable())
+
+
+class TestProbeAtScale(unittest.TestCase):
+
+    def test_many_disks(self):
+        storage = generate_machine_config(
+            disks=500, partitions=4, multipath=8)['storage']
+        model = FilesystemModel(FakeProber(storage))
+        model.probe(exclude_mounted=False)
+        # Each multipath LUN is offered once per path, and the dm device
+        # joining the paths is not offered at all.
+        self.assertEqual(len(model.all_disks()), 500 + 2 * 8)
+        self.assertNotIn('/dev/dm-0', model._available_disks)
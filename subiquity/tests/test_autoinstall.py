@@ -0,0 +1,104 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from subiquity.autoinstall import missing_answers, run_headless
+
+EXAMPLES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))), 'examples')
+
+
+def _importable(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+class TestMissingAnswers(unittest.TestCase):
+
+    def test_example_answers_are_complete(self):
+        with open(os.path.join(EXAMPLES, 'answers.yaml')) as fp:
+            answers = yaml.safe_load(fp)
+        self.assertEqual(missing_answers(answers), [])
+
+    def test_empty(self):
+        self.assertEqual(
+            missing_answers({}),
+            ['Network: accept-default', 'Filesystem: guided',
+             'Identity: realname', 'Identity: username',
+             'Identity: hostname', 'Identity: password'])
+
+    def test_manual_partitioning(self):
+        answers = {
+            'Network': {'accept-default': True},
+            'Filesystem': {'manual': True},
+            'Identity': {
+                'realname': 'Ubuntu', 'username': 'ubuntu',
+                'hostname': 'ubuntu-server', 'password': '$6$...',
+                },
+            }
+        self.assertEqual(missing_answers(answers), ['Filesystem: guided'])
+
+
+@unittest.skipUnless(_importable('probert'), "probert is not installed")
+class TestHeadlessInstall(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmpdir)
+
+    def test_dry_run(self):
+        opts = argparse.Namespace(
+            answers=os.path.join(EXAMPLES, 'answers.yaml'),
+            machine_config=os.path.join(EXAMPLES, 'mwhudson.json'),
+            dry_run=True, uefi=False)
+        output = io.StringIO()
+        self.assertEqual(run_headless(opts, output), 0, output.getvalue())
+        self.assertIn("Installation complete", output.getvalue())
+        with open('.subiquity/etc/netplan/00-installer-config.yaml') as fp:
+            self.assertIn('network', yaml.safe_load(fp))
+        for step in 'install', 'postinstall':
+            path = '.subiquity/subiquity-curtin-%s.conf' % (step,)
+            with open(path) as fp:
+                config = yaml.safe_load(fp)
+            self.assertIn('/', [
+                action.get('path')
+                for action in config['storage']['config']])
+
+    def run_with_machine_config(self, machine_config):
+        opts = argparse.Namespace(
+            answers=os.path.join(EXAMPLES, 'answers.yaml'),
+            machine_config=machine_config, dry_run=True, uefi=False)
+        output = io.StringIO()
+        self.assertEqual(run_headless(opts, output), 1, output.getvalue())
+        return output.getvalue()
+
+    def test_disk_too_small(self):
+        with open(os.path.join(EXAMPLES, 'mwhudson.json')) as fp:
+            config = json.load(fp)
+        for data in config['storage'].values():
+            data['attrs']['size'] = str(2 * 1024 * 1024)
+        with open('small.json', 'w') as fp:
+            json.dump(config, fp)
+        with self.assertLogs('subiquity.autoinstall', 'ERROR'):
+            output = self.run_with_machine_config('small.json')
+        self.assertIn("Installation failed: cannot add a partition", output)
+        self.assertFalse(
+            os.path.exists('.subiquity/subiquity-curtin-install.conf'))
+
+    def test_malformed_machine_config(self):
+        with open('bad.yaml', 'w') as fp:
+            fp.write('{"storage": {bad')
+        output = self.run_with_machine_config('bad.yaml')
+        self.assertIn("failed", output)
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from subiquity.compile_configs import (
+    compile_all,
+    compile_machine,
+    find_machine_configs,
+    )
+
+EXAMPLES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))), 'examples')
+
+
+def _importable(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+class TestCompileConfigs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_find_machine_configs(self):
+        for name in 'b.json', 'a.yaml', 'a.yaml.snapshot.pickle', 'README':
+            open(os.path.join(self.tmpdir, name), 'w').close()
+        self.assertEqual(
+            find_machine_configs(self.tmpdir),
+            [os.path.join(self.tmpdir, 'a.yaml'),
+             os.path.join(self.tmpdir, 'b.json')])
+
+    def test_missing_machine_config(self):
+        machine_config, error = compile_machine(
+            os.path.join(self.tmpdir, 'nope.json'), {}, self.tmpdir)
+        self.assertIsNotNone(error)
+
+    def write_malformed_config(self):
+        path = os.path.join(self.tmpdir, 'bad.yaml')
+        with open(path, 'w') as fp:
+            fp.write('{"storage": {bad')
+        return path
+
+    def test_malformed_machine_config(self):
+        machine_config = self.write_malformed_config()
+        machine_config, error = compile_machine(
+            machine_config, {}, self.tmpdir)
+        self.assertIn('ProberException', error)
+
+    def test_errors_reported_per_machine(self):
+        bad = self.write_malformed_config()
+        missing = os.path.join(self.tmpdir, 'nope.json')
+        results = list(compile_all([bad, missing], {}, self.tmpdir, jobs=2))
+        self.assertEqual([r[0] for r in results], [bad, missing])
+        self.assertIn('ProberException', results[0][1])
+        self.assertIsNotNone(results[1][1])
+
+    @unittest.skipUnless(_importable('probert'), "probert is not installed")
+    def test_malformed_machine_config_in_batch(self):
+        with open(os.path.join(EXAMPLES, 'answers.yaml')) as fp:
+            answers = yaml.safe_load(fp)
+        bad = self.write_malformed_config()
+        good = os.path.join(EXAMPLES, 'mwhudson.json')
+        results = list(compile_all([bad, good], answers, self.tmpdir, jobs=2))
+        self.assertEqual([r[0] for r in results], [bad, good])
+        self.assertIsNotNone(results[0][1])
+        self.assertIsNone(results[1][1])
+
+    @unittest.skipUnless(_importable('probert'), "probert is not installed")
+    def test_undersized_machine_in_batch(self):
+        with open(os.path.join(EXAMPLES, 'answers.yaml')) as fp:
+            answers = yaml.safe_load(fp)
+        good = os.path.join(EXAMPLES, 'mwhudson.json')
+        with open(good) as fp:
+            config = json.load(fp)
+        for data in config['storage'].values():
+            data['attrs']['size'] = str(2 * 1024 * 1024)
+        small = os.path.join(self.tmpdir, 'small.json')
+        with open(small, 'w') as fp:
+            json.dump(config, fp)
+        results = list(compile_all(
+            [good, small], answers, self.tmpdir, jobs=2))
+        self.assertEqual(results[0], (good, None))
+        self.assertEqual(results[1][0], small)
+        self.assertIn('NoSpaceError', results[1][1])
+
+    @unittest.skipUnless(_importable('probert'), "probert is not installed")
+    def test_compile_machine(self):
+        with open(os.path.join(EXAMPLES, 'answers.yaml')) as fp:
+            answers = yaml.safe_load(fp)
+        machine_config = os.path.join(EXAMPLES, 'mwhudson.json')
+        self.assertEqual(
+            compile_machine(machine_config, answers, self.tmpdir),
+            (machine_config, None))
+        for step in 'install', 'postinstall':
+            path = os.path.join(
+                self.tmpdir, 'mwhudson', 'subiquity-curtin-%s.conf' % step)
+            with open(path) as fp:
+                config = yaml.safe_load(fp)
+            self.assertIn('/', [
+                action.get('path') for action in config['storage']['config']])
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# Modules that should only be imported once they are needed, by either
+# entry point.
+DEFERRED_MODULES = [
+    'probert.storage',
+    'systemd.journal',
+    'subiquity.ui.views.filesystem',
+    'subiquity.ui.views.installprogress',
+    'subiquitycore.ui.views.network_configure_interface',
+    ]
+
+# Total import time budget, in milliseconds.
+DEFAULT_BUDGET_MS = 1500
+
+
+def _importable(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+def import_times(modules):
+    """Import modules in a new interpreter and return its -X importtime data.
+
+    The result maps module name to cumulative import time in
+    microseconds.
+    """
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + env.get('PYTHONPATH', '').split(os.pathsep))
+    code = ''.join('import {}\n'.format(m) for m in modules)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, env=env, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            continue  # the header line
+        times[fields[2].strip()] = cumulative
+    return times
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime needs Python 3.7")
+class ImportBudgetTests:
+
+    # What gets imported before the first screen is shown.  The
+    # controllers package is included because Application.probe_scopes
+    # imports it at startup to read each controller's probe_scopes.
+    startup_modules = []
+    # What startup_modules need to be importable at all.
+    dependencies = ['urwid', 'probert']
+
+    def setUp(self):
+        for name in self.dependencies:
+            if not _importable(name):
+                self.skipTest("{} is not installed".format(name))
+        self.times = import_times(self.startup_modules)
+
+    def test_deferred_modules_not_imported(self):
+        for module in DEFERRED_MODULES:
+            self.assertNotIn(module, self.times)
+
+    def test_budget(self):
+        budget = int(os.environ.get(
+            'SUBIQUITY_IMPORT_BUDGET_MS', DEFAULT_BUDGET_MS))
+        # Only top level imports are counted, as the cumulative time of
+        # a nested import is already included in its parent's.
+        total = sum(self.times[m] for m in self.startup_modules) / 1000
+        self.assertLess(total, budget)
+
+
+class TestSubiquityImportBudget(ImportBudgetTests, unittest.TestCase):
+
+    startup_modules = ['subiquity.core', 'subiquity.controllers']
+    dependencies = ImportBudgetTests.dependencies + ['lsb_release']
+
+
+class TestConsoleConfImportBudget(ImportBudgetTests, unittest.TestCase):
+
+    startup_modules = ['console_conf.core', 'console_conf.controllers']
@@ -13,19 +13,23 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from .filesystem import (FilesystemView,  # NOQA
-                         PartitionView,
-                         FormatEntireView,
-                         DiskPartitionView,
-                         DiskInfoView,
-                         GuidedDiskSelectionView,
-                         GuidedFilesystemView)
-from .bcache import BcacheView  # NOQA
-from .raid import RaidView  # NOQA
-from .ceph import CephDiskView  # NOQA
-from .iscsi import IscsiDiskView  # NOQA
-from .lvm import LVMVolumeGroupView  # NOQA
-from .identity import IdentityView  # NOQA
-from .installpath import InstallpathView  # NOQA
-from .installprogress import ProgressView  # NOQA
-from .welcome import WelcomeView
+from subiquitycore.lazy import lazy_attributes
+
+lazy_attributes(__name__, {
+    'FilesystemView': '.filesystem',
+    'PartitionView': '.filesystem',
+    'FormatEntireView': '.filesystem',
+    'DiskPartitionView': '.filesystem',
+    'DiskInfoView': '.filesystem',
+    'GuidedDiskSelectionView': '.filesystem',
+    'GuidedFilesystemView': '.filesystem',
+    'BcacheView': '.bcache',
+    'RaidView': '.raid',
+    'CephDiskView': '.ceph',
+    'IscsiDiskView': '.iscsi',
+    'LVMVolumeGroupView': '.lvm',
+    'IdentityView': '.identity',
+    'InstallpathView': '.installpath',
+    'ProgressView': '.installprogress',
+    'WelcomeView': '.welcome',
+    })
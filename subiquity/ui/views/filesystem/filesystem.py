@@ -27,6 +27,7 @@ from urwid import (
     WidgetWrap,
     )
 
+from subiquitycore.i18n import lazy_gettext
 from subiquitycore.ui.buttons import (
     back_btn,
     cancel_btn,
@@ -45,7 +46,7 @@ from subiquity.models.filesystem import humanize_size
 log = logging.getLogger('subiquity.ui.filesystem.filesystem')
 
 
-confirmation_text = _("""\
+confirmation_text = lazy_gettext("""\
 Selecting Continue below will begin the installation process and \
 result in the loss of data on the disks selected to be formatted.
 
@@ -57,7 +58,7 @@ class FilesystemConfirmationView(WidgetWrap):
         self.parent = parent
         self.controller = controller
         pile = Pile([
-            UrwidPadding(Text(confirmation_text), left=2, right=2),
+            UrwidPadding(Text(str(confirmation_text)), left=2, right=2),
             button_pile([
                 cancel_btn(_("No"), on_press=self.cancel),
                 danger_btn(_("Continue"), on_press=self.ok)]),
@@ -79,6 +80,7 @@ class FilesystemView(BaseView):
         self.model = model
         self.controller = controller
         self.items = []
+        self.available_inputs = Pile(self._build_available_inputs())
         self.body = [
             Text(_("FILE SYSTEM SUMMARY")),
             Text(""),
@@ -86,7 +88,7 @@ class FilesystemView(BaseView):
             Text(""),
             Text(_("AVAILABLE DEVICES")),
             Text(""),
-            Padding.push_4(self._build_available_inputs()),
+            Padding.push_4(self.available_inputs),
             #self._build_menu(),
             #Text(""),
             #Text("USED DISKS"),
@@ -117,7 +119,7 @@ class FilesystemView(BaseView):
         log.debug('FileSystemView: building part list')
         cols = []
         longest_path = len("MOUNT POINT")
-        for m in sorted(self.model._mounts, key=lambda m:m.path):
+        for m in sorted(self.model.all_mounts(), key=lambda m:m.path):
             path = m.path
             longest_path = max(longest_path, len(path))
             for p, *_ in reversed(cols):
@@ -125,7 +127,7 @@ class FilesystemView(BaseView):
                     path = [('info_minor', p), path[len(p):]]
                     break
             cols.append((m.path, path, humanize_size(m.device.volume.size), m.device.fstype, m.device.volume.desc()))
-        for fs in self.model._filesystems:
+        for fs in self.model.all_filesystems():
             if fs.fstype == 'swap':
                 cols.append((None, 'SWAP', humanize_size(fs.volume.size), fs.fstype, fs.volume.desc()))
 
@@ -223,10 +225,13 @@ class FilesystemView(BaseView):
                 Text(size))
 
         if len(inputs) == 1:
-            return Pile([Color.info_minor(
-                Text(_("No disks available.")))])
+            return [Color.info_minor(Text(_("No disks available.")))]
+
+        return inputs
 
-        return Pile(inputs)
+    def refresh_model_inputs(self):
+        self.available_inputs.contents = [
+            (obj, ('pack', None)) for obj in self._build_available_inputs()]
 
     def click_disk(self, sender, disk):
         self.controller.partition_disk(disk)
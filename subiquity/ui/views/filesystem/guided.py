@@ -17,6 +17,7 @@ from urwid import (
     Text,
     )
 
+from subiquitycore.i18n import lazy_gettext
 from subiquitycore.ui.utils import button_pile, Padding
 from subiquitycore.ui.buttons import (
     back_btn,
@@ -30,7 +31,7 @@ from subiquitycore.view import BaseView
 from subiquity.models.filesystem import humanize_size
 
 
-text = _("""The installer can guide you through partitioning a disk or, if \
+text = lazy_gettext("""The installer can guide you through partitioning a disk or, if \
 you prefer, you can do it manually. If you choose guided partitioning you \
 will still have a chance to review and modify the results.""")
 
@@ -44,7 +45,7 @@ class GuidedFilesystemView(BaseView):
         back = back_btn(_("Back"), on_press=self.cancel)
         lb = ListBox([
             Padding.center_70(Text("")),
-            Padding.center_70(Text(text)),
+            Padding.center_70(Text(str(text))),
             Padding.center_70(Text("")),
             button_pile([guided, manual, back]),
             ])
@@ -66,32 +67,33 @@ class GuidedDiskSelectionView(BaseView):
         self.model = model
         self.controller = controller
         cancel = cancel_btn("Cancel", on_press=self.cancel)
-        disks = []
-        for disk in self.model.all_disks():
-            disk_btn = forward_btn(
-                "%-40s %s"%(disk.serial, humanize_size(disk.size).rjust(9)),
-                on_press=self.choose_disk, user_arg=disk)
-            disks.append(disk_btn)
+        self.disks = Pile(self._build_disk_buttons())
         lb = ListBox([
             Padding.center_70(Text("")),
             Padding.center_70(Text(_("Choose the disk to install to:"))),
             Padding.center_70(Text("")),
-            Padding.center_70(Pile(disks)),
+            Padding.center_70(self.disks),
             Padding.center_70(Text("")),
             button_pile([cancel]),
             ])
         super().__init__(lb)
 
+    def _build_disk_buttons(self):
+        disks = []
+        for disk in self.model.all_disks():
+            disk_btn = forward_btn(
+                "%-40s %s"%(disk.serial, humanize_size(disk.size).rjust(9)),
+                on_press=self.choose_disk, user_arg=disk)
+            disks.append(disk_btn)
+        return disks
+
+    def refresh_model_inputs(self):
+        self.disks.contents = [
+            (obj, ('pack', None)) for obj in self._build_disk_buttons()]
+
     def cancel(self, btn=None):
         self.controller.default()
 
     def choose_disk(self, btn, disk):
-        self.model.reset()
-        result = {
-            "partnum": 1,
-            "size": disk.free,
-            "fstype": self.model.fs_by_name["ext4"],
-            "mount": "/",
-        }
-        self.controller.partition_disk_handler(disk, None, result)
+        self.model.add_guided_layout(disk, self.controller.is_uefi())
         self.controller.manual()
@@ -104,8 +104,15 @@ class PartitionForm(Form):
         suffixes = ''.join(HUMAN_UNITS) + ''.join(HUMAN_UNITS).lower()
         if val[-1] not in suffixes:
             val += self.size_str[-1]
+        if val == self.size_str:
+            # size_str is rounded, so can dehumanize to more than max_size.
+            return self.max_size
         return dehumanize_size(val)
 
+    def validate_size(self):
+        if self.size.value > self.max_size:
+            return "Size is larger than the %s available"%(self.size_str,)
+
     def clean_mount(self, val):
         if self.fstype.value.is_mounted:
             return val
@@ -130,7 +137,7 @@ class PartitionFormatView(BaseView):
 
     def __init__(self, size, existing, initial, back):
 
-        mountpoint_to_devpath_mapping = self.model.get_mountpoint_to_devpath_mapping()
+        mount = None
         if existing is not None:
             fs = existing.fs()
             if fs is not None:
@@ -138,10 +145,11 @@ class PartitionFormatView(BaseView):
                 mount = fs.mount()
                 if mount is not None:
                     initial['mount'] = mount.path
-                    if mount.path in mountpoint_to_devpath_mapping:
-                        del mountpoint_to_devpath_mapping[mount.path]
             else:
                 initial['fstype'] = self.model.fs_by_name[None]
+        # The existing mount's path can be kept.
+        mountpoint_to_devpath_mapping = self.model.get_mountpoint_to_devpath_mapping(
+            exclude=mount)
         self.form = self.form_cls(mountpoint_to_devpath_mapping, size, initial)
         self.back = back
 
@@ -177,12 +185,12 @@ class PartitionView(PartitionFormatView):
         self.disk = disk
         self.partition = partition
 
-        max_size = disk.free
         if partition is None:
+            max_size = disk.largest_free
             initial = {'partnum': disk.next_partnum}
             label = _("Create")
         else:
-            max_size += partition.size
+            max_size = partition.size + disk.free_after(partition)
             initial = {
                 'partnum': partition.number,
                 'size': humanize_size(partition.size),
@@ -211,8 +219,13 @@ class PartitionView(PartitionFormatView):
         self.controller.delete_partition(self.partition)
 
     def done(self, form):
-        log.debug("Add Partition Result: {}".format(form.as_data()))
-        self.controller.partition_disk_handler(self.disk, self.partition, form.as_data())
+        data = form.as_data()
+        log.debug("Add Partition Result: {}".format(data))
+        if self.partition is not None:
+            if form.size.widget.value == humanize_size(self.partition.size):
+                # The size shown was not edited: keep it exactly.
+                data['size'] = self.partition.size
+        self.controller.partition_disk_handler(self.disk, self.partition, data)
 
 
 class FormatEntireView(PartitionFormatView):
@@ -22,6 +22,7 @@ from urwid import (
     WidgetWrap,
     )
 
+from subiquitycore.i18n import lazy_gettext
 from subiquitycore.ui.interactive import (
     EmailEditor,
     PasswordEditor,
@@ -138,14 +139,14 @@ SSHImportField = simple_field(SSHImport)
 
 class IdentityForm(Form):
 
-    realname = RealnameField(_("Your name:"))
+    realname = RealnameField(lazy_gettext("Your name:"))
     hostname = UsernameField(
-        _("Your server's name:"),
-        help=_("The name it uses when it talks to other computers."))
-    username = UsernameField(_("Pick a username:"))
-    password = PasswordField(_("Choose a password:"))
-    confirm_password = PasswordField(_("Confirm your password:"))
-    ssh_import_id = SSHImportField(_("Import SSH identity:"))
+        lazy_gettext("Your server's name:"),
+        help=lazy_gettext("The name it uses when it talks to other computers."))
+    username = UsernameField(lazy_gettext("Pick a username:"))
+    password = PasswordField(lazy_gettext("Choose a password:"))
+    confirm_password = PasswordField(lazy_gettext("Confirm your password:"))
+    ssh_import_id = SSHImportField(lazy_gettext("Import SSH identity:"))
 
     def validate_realname(self):
         if len(self.realname.value) < 1:
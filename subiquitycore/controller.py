@@ -15,8 +15,10 @@
 
 
 from abc import ABC, abstractmethod
+import asyncio
 import logging
-import os
+
+from subiquitycore.utils import arun_command
 
 log = logging.getLogger("subiquitycore.controller")
 
@@ -26,16 +28,28 @@ class BaseController(ABC):
 
     signals = []
 
+    # Set to True in a subclass to have the controller constructed when
+    # the application starts rather than when its screen is first shown.
+    prewarm = False
+
+    # The probe scopes (see subiquitycore.prober.PROBE_SCOPES) whose
+    # results the controller uses.  Only the scopes some controller of
+    # the application needs are probed at startup.
+    probe_scopes = ()
+
     def __init__(self, common):
         self.ui = common['ui']
         self.signal = common['signal']
         self.opts = common['opts']
         self.loop = common['loop']
+        self.aio_loop = common['aio_loop']
         self.prober = common['prober']
         self.controllers = common['controllers']
-        self.pool = common['pool']
+        self.scheduler = common['scheduler']
+        self.dispatcher = common['dispatcher']
         self.base_model = common['base_model']
         self.all_answers = common['answers']
+        self.memory = common['memory']
 
     def register_signals(self):
         """Defines signals associated with controller from model."""
@@ -44,23 +58,67 @@ class BaseController(ABC):
             signals.append((sig, getattr(self, cb)))
         self.signal.connect_signals(signals)
 
-    def run_in_bg(self, func, callback):
+    def run_in_bg(self, func, callback, lane='ui'):
         """Run func() in a thread and call callback on UI thread.
 
+        func is run by a worker from the named lane of the scheduler
+        (see subiquitycore.scheduler.DEFAULT_LANES).
+
         callback will be passed a concurrent.futures.Future containing
         the result of func(). The result of callback is discarded. Any
         exception will be logged.
         """
-        fut = self.pool.submit(func)
-        def in_main_thread(ignored):
-            try:
-                callback(fut)
-            except:
-                log.exception("callback %s after calling %s failed", callback, func)
-        pipe = self.loop.watch_pipe(in_main_thread)
-        def in_random_thread(ignored):
-            os.write(pipe, b'x')
-        fut.add_done_callback(in_random_thread)
+        fut = self.scheduler.submit(lane, func)
+        self.dispatcher.add(fut, callback, func)
+
+    def run_coroutine(self, coro, callback=None):
+        """Run coro on the UI event loop.
+
+        Unlike run_in_bg this does not use a thread, so coro must not
+        block; it should await things like arun_command, sleep and
+        wait_readable instead.
+
+        If callback is not None it is called on the UI thread with the
+        finished asyncio.Task, which has the same result() and
+        exception() methods as a concurrent.futures.Future. Any
+        exception will be logged.
+        """
+        task = asyncio.ensure_future(coro, loop=self.aio_loop)
+        def done(task):
+            if callback is not None:
+                try:
+                    callback(task)
+                except:
+                    log.exception(
+                        "callback %s after running %s failed", callback, coro)
+            elif not task.cancelled() and task.exception() is not None:
+                log.error("running %s failed", coro,
+                          exc_info=task.exception())
+        task.add_done_callback(done)
+        return task
+
+    async def arun_command(self, cmd, shell=False):
+        """Run cmd in a subprocess, returning a run_command-style dict."""
+        return await arun_command(cmd, shell=shell)
+
+    async def sleep(self, duration):
+        await asyncio.sleep(duration)
+
+    def wait_readable(self, fd):
+        """Return a future that completes when fd becomes readable.
+
+        Useful for waiting on journald (journal.Reader.fileno()) or
+        netlink sockets.  Do not use this on an fd that is also
+        watched with loop.watch_file.
+        """
+        fut = self.aio_loop.create_future()
+        def ready():
+            if not fut.done():
+                fut.set_result(None)
+        # Also stop watching fd if the future is cancelled.
+        fut.add_done_callback(lambda fut: self.aio_loop.remove_reader(fd))
+        self.aio_loop.add_reader(fd, ready)
+        return fut
 
     @abstractmethod
     def cancel(self):
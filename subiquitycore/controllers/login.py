@@ -14,7 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from subiquitycore.ui.views import LoginView
+from subiquitycore.ui.views.login import LoginView
 from subiquitycore.models import LoginModel
 from subiquitycore.controller import BaseController
 
@@ -13,28 +13,29 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import copy
 from functools import partial
 import logging
 import os
-import random
-import select
 import socket
 import subprocess
 
 import yaml
 
-from probert.network import NetworkEventReceiver
-
-from subiquitycore.models import NetworkModel
-from subiquitycore.ui.views import (NetworkView,
-                                    NetworkSetDefaultRouteView,
-                                    NetworkBondInterfacesView,
-                                    NetworkConfigureInterfaceView,
-                                    NetworkConfigureIPv4InterfaceView,
-                                    NetworkConfigureIPv6InterfaceView,
-                                    NetworkConfigureWLANView)
-from subiquitycore.ui.views.network import ApplyingConfigWidget
+from subiquitycore.models.network import (
+    DEFAULT_ROUTE_TIMEOUT,
+    NETPLAN_APPLY_COMMANDS,
+    netplan_config_path,
+    NetworkModelReceiver,
+    write_dry_run_netplan,
+    write_netplan_config,
+    )
+from subiquitycore.ui import views
+from subiquitycore.ui.views.network import (
+    ApplyingConfigWidget,
+    NetworkView,
+    )
 from subiquitycore.ui.dummy import DummyView
 from subiquitycore.controller import BaseController
 from subiquitycore.utils import run_command_start, run_command_summarize
@@ -56,6 +57,10 @@ class BackgroundTask:
         """Run the task.
 
         This is called on an arbitrary thread so don't do UI stuff!
+
+        Alternatively, run can be a coroutine, in which case it is run
+        on the UI event loop without using a thread and so must not
+        block.
         """
         raise NotImplementedError(self.run)
 
@@ -64,7 +69,8 @@ class BackgroundTask:
 
         This is called on the UI thread.
 
-        fut is a concurrent.futures.Future holding the result of running run.
+        fut is a concurrent.futures.Future (or asyncio.Task, if run is
+        a coroutine) holding the result of running run.
         """
         raise NotImplementedError(self.end)
 
@@ -114,20 +120,20 @@ class PythonSleep(BackgroundTask):
 
     def __init__(self, duration):
         self.duration = duration
-        self.r, self.w = os.pipe()
+        self.canceled = None
 
     def __repr__(self):
         return 'PythonSleep(%r)'%(self.duration,)
 
     def start(self):
-        pass
+        self.canceled = asyncio.get_event_loop().create_future()
 
-    def run(self):
-        r, _, _ = select.select([self.r], [], [], self.duration)
-        if not r:
+    async def run(self):
+        try:
+            await asyncio.wait_for(self.canceled, self.duration)
+        except asyncio.TimeoutError:
             return True
-        os.close(self.r)
-        os.close(self.w)
+        return False
 
     def end(self, observer, fut):
         if fut.result():
@@ -136,7 +142,8 @@ class PythonSleep(BackgroundTask):
             observer.task_failed()
 
     def cancel(self):
-        os.write(self.w, b'x')
+        if not self.canceled.done():
+            self.canceled.set_result(None)
 
 
 class WaitForDefaultRouteTask(BackgroundTask):
@@ -144,27 +151,28 @@ class WaitForDefaultRouteTask(BackgroundTask):
     def __init__(self, timeout, event_receiver):
         self.timeout = timeout
         self.event_receiver = event_receiver
+        self.result = None
 
     def __repr__(self):
         return 'WaitForDefaultRouteTask(%r)'%(self.timeout,)
 
+    def _set_result(self, value):
+        if not self.result.done():
+            self.result.set_result(value)
+
     def got_route(self):
-        os.write(self.success_w, b'x')
+        self._set_result(True)
 
     def start(self):
-        self.fail_r, self.fail_w = os.pipe()
-        self.success_r, self.success_w = os.pipe()
+        self.result = asyncio.get_event_loop().create_future()
         self.event_receiver.add_default_route_waiter(self.got_route)
 
-    def run(self):
+    async def run(self):
         try:
-            r, _, _ = select.select([self.fail_r, self.success_r], [], [], self.timeout)
-            return self.success_r in r
-        finally:
-            os.close(self.fail_r)
-            os.close(self.fail_w)
-            os.close(self.success_r)
-            os.close(self.success_w)
+            return await asyncio.wait_for(
+                asyncio.shield(self.result), self.timeout)
+        except asyncio.TimeoutError:
+            return False
 
     def end(self, observer, fut):
         if fut.result():
@@ -173,12 +181,13 @@ class WaitForDefaultRouteTask(BackgroundTask):
             observer.task_failed('timeout')
 
     def cancel(self):
-        os.write(self.fail_w, b'x')
+        self._set_result(False)
 
 
 class TaskSequence:
-    def __init__(self, run_in_bg, tasks, watcher):
+    def __init__(self, run_in_bg, run_coroutine, tasks, watcher):
         self.run_in_bg = run_in_bg
+        self.run_coroutine = run_coroutine
         self.tasks = tasks
         self.watcher = watcher
         self.canceled = False
@@ -199,7 +208,12 @@ class TaskSequence:
         self.tasks = self.tasks[1:]
         log.debug('running %s for stage %s', self.curtask, self.stage)
         self.curtask.start()
-        self.run_in_bg(self.curtask.run, lambda fut:self.curtask.end(self, fut))
+        if asyncio.iscoroutinefunction(self.curtask.run):
+            self.run_coroutine(
+                self.curtask.run(), lambda fut:self.curtask.end(self, fut))
+        else:
+            self.run_in_bg(
+                self.curtask.run, lambda fut:self.curtask.end(self, fut))
 
     def task_succeeded(self):
         if self.canceled:
@@ -226,70 +240,6 @@ def sanitize_config(config):
     return config
 
 
-class SubiquityNetworkEventReceiver(NetworkEventReceiver):
-    def __init__(self, model):
-        self.model = model
-        self.default_route_waiter = None
-        self.default_routes = set()
-
-    def new_link(self, ifindex, link):
-        self.model.new_link(ifindex, link)
-
-    def del_link(self, ifindex):
-        self.model.del_link(ifindex)
-        if ifindex in self.default_routes:
-            self.default_routes.remove(ifindex)
-
-    def update_link(self, ifindex):
-        self.model.update_link(ifindex)
-
-    def route_change(self, action, data):
-        super().route_change(action, data)
-        if data['dst'] != 'default':
-            return
-        if data['table'] != 254:
-            return
-        ifindex = data['ifindex']
-        if action == "NEW" or action == "CHANGE":
-            self.default_routes.add(ifindex)
-            if self.default_route_waiter:
-                self.default_route_waiter()
-        elif action == "DEL" and ifindex in self.default_routes:
-            self.default_routes.remove(ifindex)
-        log.debug('default routes %s', self.default_routes)
-
-    def add_default_route_waiter(self, waiter):
-        if self.default_routes:
-            waiter()
-        else:
-            self.default_route_waiter = waiter
-
-
-default_netplan = '''
-network:
-  version: 2
-  ethernets:
-    "en*":
-       addresses:
-         - 10.0.2.15/24
-       gateway4: 10.0.2.2
-       nameservers:
-         addresses:
-           - 8.8.8.8
-           - 8.4.8.4
-         search:
-           - foo
-           - bar
-    "eth*":
-       dhcp4: true
-  wifis:
-    "wl*":
-       dhcp4: true
-       access-points:
-         "some-ap":
-            password: password
-'''
-
 class NetworkController(BaseController):
     signals = [
         ('menu:network:main:set-default-v4-route',     'set_default_v4_route'),
@@ -297,6 +247,7 @@ class NetworkController(BaseController):
     ]
 
     root = "/"
+    probe_scopes = ('network.links', 'network.wlan')
 
     def __init__(self, common):
         super().__init__(common)
@@ -305,17 +256,10 @@ class NetworkController(BaseController):
         if self.opts.dry_run:
             self.root = os.path.abspath(".subiquity")
             self.tried_once = False
-            netplan_path = self.netplan_path
-            netplan_dir = os.path.dirname(netplan_path)
-            if os.path.exists(netplan_dir):
-                import shutil
-                shutil.rmtree(netplan_dir)
-            os.makedirs(netplan_dir)
-            with open(netplan_path, 'w') as fp:
-                fp.write(default_netplan)
+            write_dry_run_netplan(self.netplan_path)
         self.model.parse_netplan_configs(self.root)
 
-        self.network_event_receiver = SubiquityNetworkEventReceiver(self.model)
+        self.network_event_receiver = NetworkModelReceiver(self.model)
         self.observer, fds = self.prober.probe_network(self.network_event_receiver)
         for fd in fds:
             self.loop.watch_file(fd, partial(self._data_ready, fd))
@@ -351,29 +295,13 @@ class NetworkController(BaseController):
 
     @property
     def netplan_path(self):
-        if self.opts.project == "subiquity":
-            netplan_config_file_name = '00-installer-config.yaml'
-        else:
-            netplan_config_file_name = '00-snapd-config.yaml'
-        return os.path.join(self.root, 'etc/netplan', netplan_config_file_name)
+        return netplan_config_path(self.root, self.opts.project)
 
     def network_finish(self, config):
-        log.debug("network config: \n%s", yaml.dump(sanitize_config(config), default_flow_style=False))
-
-        netplan_path = self.netplan_path
-        while True:
-            try:
-                tmppath = '%s.%s' % (netplan_path, random.randrange(0, 1000))
-                fd = os.open(tmppath, os.O_WRONLY | os.O_EXCL | os.O_CREAT, 0o0600)
-            except FileExistsError:
-                continue
-            else:
-                break
-        w = os.fdopen(fd, 'w')
-        with w:
-            w.write("# This is the network config written by '{}'\n".format(self.opts.project))
-            w.write(yaml.dump(config))
-        os.rename(tmppath, netplan_path)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("network config: \n%s", yaml.dump(sanitize_config(config), default_flow_style=False))
+
+        write_netplan_config(self.netplan_path, config, self.opts.project)
         self.model.parse_netplan_configs(self.root)
         if self.opts.dry_run:
             tasks = [
@@ -391,10 +319,12 @@ class NetworkController(BaseController):
                 self.tried_once = True
         else:
             tasks = [
-                ('generate', BackgroundProcess(['/lib/netplan/generate'])),
-                ('apply', BackgroundProcess(['netplan', 'apply'])),
-                ('timeout', WaitForDefaultRouteTask(30, self.network_event_receiver)),
+                (stage, BackgroundProcess(cmd))
+                for stage, cmd in NETPLAN_APPLY_COMMANDS
                 ]
+            tasks.append(
+                ('timeout', WaitForDefaultRouteTask(
+                    DEFAULT_ROUTE_TIMEOUT, self.network_event_receiver)))
 
         def cancel():
             self.cs.cancel()
@@ -402,7 +332,7 @@ class NetworkController(BaseController):
         self.acw = ApplyingConfigWidget(len(tasks), cancel)
         self.ui.frame.body.show_overlay(self.acw, min_width=60)
 
-        self.cs = TaskSequence(self.run_in_bg, tasks, self)
+        self.cs = TaskSequence(self.run_in_bg, self.run_coroutine, tasks, self)
         self.cs.run()
 
     def task_complete(self, stage):
@@ -420,38 +350,38 @@ class NetworkController(BaseController):
 
     def set_default_v4_route(self):
         self.ui.set_header("Default route")
-        self.ui.set_body(NetworkSetDefaultRouteView(self.model, socket.AF_INET, self))
+        self.ui.set_body(views.NetworkSetDefaultRouteView(self.model, socket.AF_INET, self))
 
     def set_default_v6_route(self):
         self.ui.set_header("Default route")
-        self.ui.set_body(NetworkSetDefaultRouteView(self.model, socket.AF_INET6, self))
+        self.ui.set_body(views.NetworkSetDefaultRouteView(self.model, socket.AF_INET6, self))
 
     def bond_interfaces(self):
         self.ui.set_header("Bond interfaces")
-        self.ui.set_body(NetworkBondInterfacesView(self.model, self))
+        self.ui.set_body(views.NetworkBondInterfacesView(self.model, self))
 
     def network_configure_interface(self, iface):
         self.ui.set_header("Network interface {}".format(iface))
         self.ui.set_footer("")
-        self.ui.set_body(NetworkConfigureInterfaceView(self.model, self, iface))
+        self.ui.set_body(views.NetworkConfigureInterfaceView(self.model, self, iface))
 
     def network_configure_ipv4_interface(self, iface):
         self.ui.set_header("Network interface {} manual IPv4 "
                            "configuration".format(iface))
         self.ui.set_footer("")
-        self.ui.set_body(NetworkConfigureIPv4InterfaceView(self.model, self, iface))
+        self.ui.set_body(views.NetworkConfigureIPv4InterfaceView(self.model, self, iface))
 
     def network_configure_wlan_interface(self, iface):
         self.ui.set_header("Network interface {} WIFI "
                            "configuration".format(iface))
         self.ui.set_footer("")
-        self.ui.set_body(NetworkConfigureWLANView(self.model, self, iface))
+        self.ui.set_body(views.NetworkConfigureWLANView(self.model, self, iface))
 
     def network_configure_ipv6_interface(self, iface):
         self.ui.set_header("Network interface {} manual IPv6 "
                            "configuration".format(iface))
         self.ui.set_footer("")
-        self.ui.set_body(NetworkConfigureIPv6InterfaceView(self.model, self, iface))
+        self.ui.set_body(views.NetworkConfigureIPv6InterfaceView(self.model, self, iface))
 
     def install_network_driver(self):
         self.ui.set_body(DummyView(self))
@@ -13,16 +13,26 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from concurrent import futures
+import asyncio
 import fcntl
+from functools import partial
 import logging
 import sys
 
 import urwid
 import yaml
 
+from subiquitycore.memory import MemoryTracer
 from subiquitycore.signals import Signal
 from subiquitycore.prober import Prober, ProberException
+from subiquitycore.profiler import DEFAULT_INTERVAL, SamplingProfiler
+from subiquitycore.scheduler import (
+    CompletionDispatcher,
+    parse_lane_spec,
+    Scheduler,
+    SchedulerError,
+    )
+from subiquitycore.startup import timer as startup_timer
 
 log = logging.getLogger('subiquitycore.core')
 
@@ -116,6 +126,28 @@ def setup_screen(colors, styles):
         return ISO_8613_3_Screen(_urwid_name_to_rgb), urwid_palette
 
 
+class ControllerRegistry(dict):
+    """Map controller names to controllers, building them on first access.
+
+    Constructing a controller can be expensive (FilesystemController
+    probes storage, NetworkController parses netplan and starts the
+    network observer) so a controller is only created when something --
+    usually next_screen or prev_screen -- first looks it up.  Use "name
+    in registry" to check whether a controller has been built yet.
+    """
+
+    def __init__(self, app, names):
+        super().__init__()
+        self.app = app
+        self.names = list(names)
+
+    def __missing__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        controller = self[name] = self.app.make_controller(name)
+        return controller
+
+
 class Application:
 
     # A concrete subclass must set project and controllers attributes, e.g.:
@@ -133,15 +165,43 @@ class Application:
     # The 'next-screen' and 'prev-screen' signals move through the list of
     # controllers in order, calling the default method on the controller
     # instance.
+    #
+    # Controllers are constructed lazily, the first time they are needed
+    # (see ControllerRegistry), except for those that set prewarm = True,
+    # which are constructed before the main loop starts.
 
     def __init__(self, ui, opts):
+        # Start tracing first so that the probe data is included.
+        memory = None
+        memory_dir = getattr(opts, 'memory_dir', None)
+        if memory_dir is not None:
+            memory = MemoryTracer(memory_dir)
+            memory.start()
+
+        try:
+            lanes = parse_lane_spec(getattr(opts, 'workers', []))
+        except SchedulerError as e:
+            raise ApplicationError(str(e))
+        scheduler = Scheduler(lanes)
+
         try:
-            prober = Prober(opts)
+            with startup_timer.timed("Prober init"):
+                prober = Prober(opts)
         except ProberException as e:
             err = "Prober init failed: {}".format(e)
             log.exception(err)
             raise ApplicationError(err)
 
+        if opts.screens:
+            self.controllers = [c for c in self.controllers if c in opts.screens]
+        self.controllers_mod = None
+
+        try:
+            prober.start_probing(
+                scheduler.lane('probe'), self.probe_scopes(opts))
+        except ProberException as e:
+            raise ApplicationError(str(e))
+
         opts.project = self.project
 
         answers = {}
@@ -152,18 +212,65 @@ class Application:
         self.common = {
             "ui": ui,
             "opts": opts,
-            "signal": Signal(),
+            "signal": Signal(stats=getattr(opts, 'signal_stats', False)),
             "prober": prober,
             "loop": None,
-            "pool": futures.ThreadPoolExecutor(1),
+            "aio_loop": None,
+            "scheduler": scheduler,
+            "dispatcher": None,
             "answers": answers,
+            "memory": memory,
         }
-        if opts.screens:
-            self.controllers = [c for c in self.controllers if c in opts.screens]
         ui.progress_completion = len(self.controllers)
-        self.common['controllers'] = dict.fromkeys(self.controllers)
+        self.common['controllers'] = ControllerRegistry(self, self.controllers)
         self.controller_index = -1
 
+        self.profiler = None
+        profile_dir = getattr(opts, 'profile_dir', None)
+        if profile_dir is not None:
+            self.profiler = SamplingProfiler(
+                profile_dir,
+                getattr(opts, 'profile_interval', None) or DEFAULT_INTERVAL)
+
+    def controller_class(self, name):
+        if self.controllers_mod is None:
+            self.controllers_mod = __import__(
+                '%s.controllers' % self.project, None, None, [''])
+        return getattr(self.controllers_mod, name + "Controller")
+
+    def probe_scopes(self, opts):
+        """Return what to probe: what --probe-scope says or, if it was
+        not used, what the controllers need."""
+        scopes = getattr(opts, 'probe_scopes', [])
+        if scopes:
+            return scopes
+        # This imports the controllers package before the first frame
+        # (constructing the controllers is what is deferred, not
+        # importing them); test_import_budget counts the cost.
+        scopes = set()
+        for name in self.controllers:
+            scopes.update(self.controller_class(name).probe_scopes)
+        return scopes
+
+    def make_controller(self, name):
+        log.debug("Constructing controller: %s", name)
+        klass = self.controller_class(name)
+        with startup_timer.timed("%s.__init__" % klass.__name__):
+            controller = klass(self.common)
+        controller.register_signals()
+        return controller
+
+    def prewarm_controllers(self):
+        """Construct the controllers that need to exist from the start.
+
+        A controller that must receive signals before its screen is
+        reached (InstallProgress starts curtin when the filesystem
+        config is done, for example) sets prewarm = True.
+        """
+        for name in self.controllers:
+            if self.controller_class(name).prewarm:
+                self.common['controllers'][name]
+
     def _connect_base_signals(self):
         """ Connect signals used in the core controller
         """
@@ -176,12 +283,15 @@ class Application:
         signals.append(('next-screen', self.next_screen))
         signals.append(('prev-screen', self.prev_screen))
         self.common['signal'].connect_signals(signals)
-
-        # Registers signals from each controller
-        for controller, controller_class in self.common['controllers'].items():
-            controller_class.register_signals()
         log.debug(self.common['signal'])
 
+    def _screen_changed(self, controller_name, direction):
+        if self.profiler is not None:
+            self.profiler.set_section(controller_name)
+        memory = self.common['memory']
+        if memory is not None:
+            memory.snapshot("{}-{}".format(direction, controller_name))
+
     def next_screen(self, *args):
         self.controller_index += 1
         if self.controller_index >= len(self.controllers):
@@ -189,6 +299,7 @@ class Application:
         self.common['ui'].progress_current += 1
         controller_name = self.controllers[self.controller_index]
         log.debug("moving to screen %s", controller_name)
+        self._screen_changed(controller_name, "next")
         next_controller = self.common['controllers'][controller_name]
         next_controller.default()
 
@@ -200,6 +311,7 @@ class Application:
             self.exit()
         self.common['ui'].progress_current -= 1
         controller_name = self.controllers[self.controller_index]
+        self._screen_changed(controller_name, "prev")
         next_controller = self.common['controllers'][controller_name]
         next_controller.default()
 
@@ -212,9 +324,54 @@ class Application:
                 log.critical("Redraw screen error: {}".format(e))
 
     def exit(self):
+        self.common['scheduler'].log_stats()
+        self.common['signal'].dump_stats()
         raise urwid.ExitMainLoop()
 
+    def _time_first_frame(self, loop):
+        # Wrap loop.draw_screen until the first screen that shows a
+        # controller's view has been drawn, timing that draw.
+        draw_screen = loop.draw_screen
+
+        def timed_draw_screen():
+            if self.controller_index < 0:
+                draw_screen()
+                return
+            try:
+                with startup_timer.timed("first frame"):
+                    draw_screen()
+            finally:
+                startup_timer.finish()
+                loop.draw_screen = draw_screen
+        loop.draw_screen = timed_draw_screen
+
+    def _watch_block_devices(self, fut):
+        """Start reading the events of the prober's block device observer.
+
+        This is done from the start, whatever the first screen is, so
+        that disks added before the filesystem screen are seen.
+        """
+        if fut.exception() is not None:
+            return
+        prober = self.common['prober']
+        for fd in prober.block_fds:
+            self.common['loop'].watch_file(
+                fd, partial(prober.block_data_ready, fd))
+
     def run(self):
+        memory = self.common['memory']
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            self._run()
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+            if memory is not None:
+                memory.snapshot("exit")
+                memory.stop()
+
+    def _run(self):
         if not hasattr(self, 'loop'):
             if self.common['opts'].run_on_serial:
                 palette = self.STYLES_MONO
@@ -222,23 +379,30 @@ class Application:
             else:
                 screen, palette = setup_screen(self.COLORS, self.STYLES)
 
+            self.common['aio_loop'] = asyncio.get_event_loop()
             self.common['loop'] = urwid.MainLoop(
                 self.common['ui'], palette=palette, screen=screen,
-                handle_mouse=False, pop_ups=True)
+                handle_mouse=False, pop_ups=True,
+                event_loop=urwid.AsyncioEventLoop(
+                    loop=self.common['aio_loop']))
             log.debug("Running event loop: {}".format(
                 self.common['loop'].event_loop))
+            self._time_first_frame(self.common['loop'])
+            self.common['dispatcher'] = CompletionDispatcher(
+                self.common['loop'])
+            prober = self.common['prober']
+            if prober.storage_future is not None:
+                self.common['dispatcher'].add(
+                    prober.storage_future, self._watch_block_devices)
 
-            self.common['base_model'] = self.model_class(self.common)
+            with startup_timer.timed("model_class construction"):
+                self.common['base_model'] = self.model_class(self.common)
 
         try:
             self.common['loop'].set_alarm_in(0.05, self.next_screen)
-            controllers_mod = __import__('%s.controllers' % self.project, None, None, [''])
-            for k in self.controllers:
-                log.debug("Importing controller: {}".format(k))
-                klass = getattr(controllers_mod, k+"Controller")
-                self.common['controllers'][k] = klass(self.common)
-            log.debug("*** %s", self.common['controllers'])
             self._connect_base_signals()
+            self.prewarm_controllers()
+            log.debug("*** %s", self.common['controllers'])
             self.common['loop'].run()
         except:
             log.exception("Exception in controller.run():")
@@ -14,27 +14,92 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import builtins
+import functools
 import gettext
+import logging
 import os
-import syslog
 
-syslog.syslog('i18n file is ' + __file__)
-localedir = '/usr/share/locale'
-if __file__.startswith('/snap/'):
-    localedir = os.path.realpath(__file__ + '/../../../../../share/locale')
-build_mo = os.path.realpath(__file__ + '/../../build/mo/')
-if os.path.isdir(build_mo):
-    localedir = build_mo
-syslog.syslog('Final localedir is ' + localedir)
+log = logging.getLogger('subiquitycore.i18n')
+
+# (domain, language, localedir) -> translation.  Catalogs are only read
+# the first time they are needed and never again.
+_translations = {}
+
+_current_language = 'en_US'
+_current_translation = None
+
+
+@functools.lru_cache()
+def get_localedir():
+    localedir = '/usr/share/locale'
+    if __file__.startswith('/snap/'):
+        localedir = os.path.realpath(__file__ + '/../../../../../share/locale')
+    build_mo = os.path.realpath(__file__ + '/../../build/mo/')
+    if os.path.isdir(build_mo):
+        localedir = build_mo
+    log.debug('Final localedir is %s', localedir)
+    return localedir
+
+
+def get_translation(domain, language=None, localedir=None):
+    """Return the (cached) catalog for domain in language.
+
+    If language is None, the usual environment variables decide the
+    language.  A NullTranslations is returned if there is no catalog.
+    """
+    key = (domain, language, localedir)
+    translation = _translations.get(key)
+    if translation is None:
+        languages = None
+        if language is not None:
+            languages = [language]
+        translation = gettext.translation(
+            domain, localedir=localedir, languages=languages, fallback=True)
+        _translations[key] = translation
+    return translation
+
+
+def _gettext(message):
+    global _current_translation
+    if _current_translation is None:
+        _current_translation = get_translation(
+            'subiquity', _current_language, get_localedir())
+    return _current_translation.gettext(message)
+
+
+class lazy_gettext:
+    """A message that is only translated when it is used.
+
+    Use this for strings defined at import time: they are translated
+    into whatever language is current when they are shown, and cost
+    nothing if they never are.  Pass str(message) to widgets.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return builtins._(self.message)
+
+    def __repr__(self):
+        return 'lazy_gettext(%r)' % (self.message,)
+
 
 def switch_language(code='en_US'):
+    global _current_language, _current_translation
     if code != 'en_US' and 'FAKE_TRANSLATE' in os.environ:
-        import builtins
         builtins.__dict__['_'] = lambda a: '_(%s)' % a
     elif code:
-        translation = gettext.translation('subiquity', localedir=localedir, languages=[code])
-        translation.install()
+        _current_language = code
+        _current_translation = None
+        builtins.__dict__['_'] = _gettext
 
 switch_language()
 
-__all__ = ['switch_language']
+__all__ = [
+    'get_localedir',
+    'get_translation',
+    'lazy_gettext',
+    'switch_language',
+    ]
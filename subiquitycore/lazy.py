@@ -0,0 +1,56 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Import a package's attributes from its submodules on first use.
+
+This is used by the views packages so that importing one view does not
+import all of them.  Module level __getattr__ (PEP 562) needs Python
+3.7, so instead the package's module object is given a subclass of
+ModuleType as its class, which works from Python 3.5.
+"""
+
+import importlib
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+
+    def __getattr__(self, name):
+        # Only called when normal lookup fails.
+        try:
+            submodule = self.__dict__['_lazy_attributes'][name]
+        except KeyError:
+            raise AttributeError(
+                "module {!r} has no attribute {!r}".format(
+                    self.__name__, name))
+        value = getattr(
+            importlib.import_module(submodule, self.__name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._lazy_attributes))
+
+
+def lazy_attributes(module_name, attributes):
+    """Make the module called module_name import attributes when used.
+
+    attributes maps the name of each attribute to the submodule (which
+    may be relative to module_name) it is defined in.
+    """
+    module = sys.modules[module_name]
+    module._lazy_attributes = attributes
+    module.__class__ = _LazyModule
@@ -13,13 +13,63 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import atexit
+import collections.abc
+import copy
 import logging
 import os
+import queue
 import sys
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    TimedRotatingFileHandler,
+    )
+
+
+# Arguments of these types cannot change after the logging call, so
+# they can be left for the listener thread to format.
+_IMMUTABLE_ARG_TYPES = (
+    str, bytes, int, float, complex, bool, type(None), frozenset)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """A QueueHandler that leaves formatting to the listener.
+
+    The stock prepare() formats the message on the thread that made
+    the logging call.  This one leaves msg and args alone when all the
+    args are immutable, which is the common case.  Otherwise one of them
+    could be mutated before the listener gets to it, so the message is
+    formatted here, once, as prepare() would.  Tracebacks are always
+    formatted here, as they keep frames alive.
+    """
+
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        args = record.args or ()
+        if isinstance(args, collections.abc.Mapping):
+            args = args.values()
+        if not isinstance(record.msg, str) or not all(
+                isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exc_formatter.formatException(
+                    record.exc_info)
+            record.exc_info = None
+        return record
 
 
 def setup_logger(dir):
+    """Log everything at DEBUG to a file in dir.
+
+    The file is written, and most messages formatted, by a background
+    thread: the logging call only puts the record on a queue, so a slow
+    disk does not stall the UI.
+    """
     LOGFILE = os.path.join(dir, "subiquity-debug.log")
     try:
         os.makedirs(dir, exist_ok=True)
@@ -38,7 +88,13 @@ def setup_logger(dir):
     # log_filter = logging.Filter(name='subiquity')
     # log.addFilter(log_filter)
 
+    log_queue = queue.Queue()
+    listener = QueueListener(log_queue, log, respect_handler_level=True)
+    listener.start()
+    # Flush anything still queued when the process exits.
+    atexit.register(listener.stop)
+
     logger = logging.getLogger('')
     logger.setLevel('DEBUG')
-    logger.addHandler(log)
+    logger.addHandler(DeferredQueueHandler(log_queue))
     return LOGFILE
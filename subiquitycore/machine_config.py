@@ -0,0 +1,113 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Loading of --machine-config files.
+
+Machine configs are usually JSON, which is parsed with the json module.
+Anything else is parsed as YAML, using libyaml when it is available.
+
+When asked to, a pickled snapshot of the parsed data is written next
+to the config file and used instead of parsing next time, for as long
+as the config file's mtime and size stay the same.  Snapshots are
+pickles, so only enable them for config files in directories you trust.
+"""
+
+import json
+import logging
+import os
+import pickle
+
+import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+log = logging.getLogger('subiquitycore.machine_config')
+
+SNAPSHOT_SUFFIX = '.snapshot.pickle'
+SNAPSHOT_VERSION = 1
+
+
+class MachineConfigError(Exception):
+    """ Machine config could not be parsed """
+    pass
+
+
+def parse_machine_config(path):
+    try:
+        with open(path) as fp:
+            content = fp.read()
+        if content.lstrip()[:1] in ('{', '['):
+            try:
+                return json.loads(content)
+            except ValueError:
+                log.debug('%s is not JSON, trying YAML', path)
+        return yaml.load(content, Loader=SafeLoader)
+    except (UnicodeDecodeError, yaml.YAMLError) as e:
+        raise MachineConfigError(str(e))
+
+
+def snapshot_path(path):
+    return path + SNAPSHOT_SUFFIX
+
+
+def _snapshot_key(path):
+    st = os.stat(path)
+    return (SNAPSHOT_VERSION, st.st_mtime_ns, st.st_size)
+
+
+def _load_snapshot(path):
+    try:
+        key = _snapshot_key(path)
+        with open(snapshot_path(path), 'rb') as fp:
+            snapshot_key, data = pickle.load(fp)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        log.exception('reading snapshot of %s failed', path)
+        return None
+    if snapshot_key != key:
+        log.debug('snapshot of %s is stale', path)
+        return None
+    return data
+
+
+def _write_snapshot(path, data):
+    tmppath = '%s.%s' % (snapshot_path(path), os.getpid())
+    try:
+        with open(tmppath, 'wb') as fp:
+            pickle.dump(
+                (_snapshot_key(path), data), fp, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmppath, snapshot_path(path))
+    except OSError:
+        log.exception('writing snapshot of %s failed', path)
+
+
+def load_machine_config(path, snapshot=False):
+    """Return the parsed contents of the machine config at path.
+
+    If snapshot is true, use (and keep up to date) a snapshot of the
+    parsed data in a file next to path.
+    """
+    if snapshot:
+        data = _load_snapshot(path)
+        if data is not None:
+            log.debug('using snapshot of %s', path)
+            return data
+    data = parse_machine_config(path)
+    if snapshot:
+        _write_snapshot(path, data)
+    return data
@@ -0,0 +1,86 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Memory snapshots taken with tracemalloc.
+
+Each snapshot is written to its own file, listing the lines that have
+allocated the most memory that is still alive and how that changed
+since the previous snapshot.
+"""
+
+import logging
+import os
+import tracemalloc
+
+log = logging.getLogger('subiquitycore.memory')
+
+_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    ]
+
+
+class MemoryTracer:
+
+    def __init__(self, dir, frames=10, top=25):
+        self.dir = dir
+        self.frames = frames
+        self.top = top
+        self.count = 0
+        self._previous = None
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        log.debug("tracing allocations, snapshots go to %s", self.dir)
+
+    def stop(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def snapshot(self, label):
+        """Take a snapshot and write a report about it to self.dir."""
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        self.count += 1
+        path = os.path.join(
+            self.dir, "memory-{:03d}-{}.txt".format(self.count, label))
+        log.debug("memory at %s: current=%dKiB peak=%dKiB",
+                  label, current // 1024, peak // 1024)
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            with open(path, 'w') as fp:
+                self._write(fp, label, snapshot, current, peak)
+        except OSError:
+            log.exception("writing memory snapshot to %s failed", path)
+        self._previous = (label, snapshot)
+        return path
+
+    def _write(self, fp, label, snapshot, current, peak):
+        fp.write("{}: current {} KiB, peak {} KiB\n\n".format(
+            label, current // 1024, peak // 1024))
+        fp.write("Top {} allocators:\n".format(self.top))
+        for stat in snapshot.statistics('lineno')[:self.top]:
+            fp.write("{}\n".format(stat))
+        if self._previous is None:
+            return
+        previous_label, previous = self._previous
+        fp.write("\nTop {} changes since {}:\n".format(
+            self.top, previous_label))
+        for stat in snapshot.compare_to(previous, 'lineno')[:self.top]:
+            fp.write("{}\n".format(stat))
@@ -19,6 +19,8 @@ import glob
 import ipaddress
 import logging
 import os
+import random
+import shutil
 from socket import AF_INET, AF_INET6
 
 import yaml, yaml.reader
@@ -545,3 +547,117 @@ class NetworkModel(object):
             config['network']['routes'] = nw_routes
 
         return config
+
+
+class NetworkModelReceiver:
+    """Feed network events into a NetworkModel, keeping track of which
+    links have a default route."""
+
+    def __init__(self, model):
+        self.model = model
+        self.default_route_waiter = None
+        self.default_routes = set()
+
+    def new_link(self, ifindex, link):
+        self.model.new_link(ifindex, link)
+
+    def del_link(self, ifindex):
+        self.model.del_link(ifindex)
+        if ifindex in self.default_routes:
+            self.default_routes.remove(ifindex)
+
+    def update_link(self, ifindex):
+        self.model.update_link(ifindex)
+
+    def route_change(self, action, data):
+        if data['dst'] != 'default':
+            return
+        if data['table'] != 254:
+            return
+        ifindex = data['ifindex']
+        if action == "NEW" or action == "CHANGE":
+            self.default_routes.add(ifindex)
+            if self.default_route_waiter:
+                self.default_route_waiter()
+        elif action == "DEL" and ifindex in self.default_routes:
+            self.default_routes.remove(ifindex)
+        log.debug('default routes %s', self.default_routes)
+
+    def add_default_route_waiter(self, waiter):
+        if self.default_routes:
+            waiter()
+        else:
+            self.default_route_waiter = waiter
+
+
+# How netplan config is applied, as (stage, command) pairs, and how long
+# to wait for a default route afterwards.
+NETPLAN_APPLY_COMMANDS = [
+    ('generate', ['/lib/netplan/generate']),
+    ('apply', ['netplan', 'apply']),
+    ]
+DEFAULT_ROUTE_TIMEOUT = 30
+
+
+def netplan_config_path(root, project):
+    """Return where project writes its netplan config under root."""
+    if project == "subiquity":
+        netplan_config_file_name = '00-installer-config.yaml'
+    else:
+        netplan_config_file_name = '00-snapd-config.yaml'
+    return os.path.join(root, 'etc/netplan', netplan_config_file_name)
+
+
+def write_netplan_config(path, config, project):
+    """Write config to path, readable only by root as it can include
+    wifi passwords."""
+    while True:
+        try:
+            tmppath = '%s.%s' % (path, random.randrange(0, 1000))
+            fd = os.open(tmppath, os.O_WRONLY | os.O_EXCL | os.O_CREAT, 0o0600)
+        except FileExistsError:
+            continue
+        else:
+            break
+    w = os.fdopen(fd, 'w')
+    with w:
+        w.write("# This is the network config written by '{}'\n".format(project))
+        w.write(yaml.dump(config))
+    os.rename(tmppath, path)
+
+
+default_netplan = '''
+network:
+  version: 2
+  ethernets:
+    "en*":
+       addresses:
+         - 10.0.2.15/24
+       gateway4: 10.0.2.2
+       nameservers:
+         addresses:
+           - 8.8.8.8
+           - 8.4.8.4
+         search:
+           - foo
+           - bar
+    "eth*":
+       dhcp4: true
+  wifis:
+    "wl*":
+       dhcp4: true
+       access-points:
+         "some-ap":
+            password: password
+'''
+
+
+def write_dry_run_netplan(path):
+    """Replace the netplan config in the directory of path with
+    default_netplan, for dry runs."""
+    netplan_dir = os.path.dirname(path)
+    if os.path.exists(netplan_dir):
+        shutil.rmtree(netplan_dir)
+    os.makedirs(netplan_dir)
+    with open(path, 'w') as fp:
+        fp.write(default_netplan)
@@ -0,0 +1,244 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Record the network events an observer reports, and replay them.
+
+A recording is a file with one JSON object per line, each with the
+time (in seconds since recording started) and the receiver method that
+was called.  Links are recorded in the form probert's serialize()
+produces, every time they are reported, so that a replay can show the
+link as it was at that moment.  A "started" line marks the point where
+the observer's start() returned: the events before it are the initial
+dump of the links and routes that already existed.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger('subiquitycore.network_events')
+
+STARTED = 'started'
+
+# Flags from linux/if.h.
+IFF_RUNNING = 0x40
+IFF_LOWER_UP = 0x10000
+
+
+def load_network_events(path):
+    with open(path) as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def write_network_events(path, events):
+    with open(path, 'w') as fp:
+        for event in events:
+            fp.write(json.dumps(event, sort_keys=True) + "\n")
+
+
+class NetworkEventRecorder:
+    """Record the events another observer sends to receiver.
+
+    This is an observer itself (it wraps the one make_observer returns)
+    as well as that observer's receiver.  The recording is closed by
+    close() or, failing that, when the process exits.
+    """
+
+    def __init__(self, path, receiver, make_observer, clock=time.monotonic):
+        self.receiver = receiver
+        self.clock = clock
+        self.links = {}
+        self.fp = open(path, 'w')
+        atexit.register(self.close)
+        self.t0 = clock()
+        self.observer = make_observer(self)
+        log.debug("recording network events to %s", path)
+
+    def close(self):
+        """Stop recording.  Events are still passed on to the receiver."""
+        if not self.fp.closed:
+            self.fp.close()
+            atexit.unregister(self.close)
+
+    def _record(self, event, **kw):
+        if self.fp.closed:
+            return
+        kw['event'] = event
+        kw['time'] = round(self.clock() - self.t0, 6)
+        self.fp.write(json.dumps(kw, sort_keys=True) + "\n")
+        self.fp.flush()
+
+    def start(self):
+        fds = self.observer.start()
+        self._record(STARTED)
+        return fds
+
+    def data_ready(self, fd):
+        self.observer.data_ready(fd)
+
+    def trigger_scan(self, ifindex):
+        self._record('trigger_scan', ifindex=ifindex)
+        self.observer.trigger_scan(ifindex)
+
+    def new_link(self, ifindex, link):
+        self.links[ifindex] = link
+        self._record(
+            'new_link', ifindex=ifindex, link=link.serialize())
+        self.receiver.new_link(ifindex, link)
+
+    def del_link(self, ifindex):
+        self.links.pop(ifindex, None)
+        self._record('del_link', ifindex=ifindex)
+        self.receiver.del_link(ifindex)
+
+    def update_link(self, ifindex):
+        link = self.links.get(ifindex)
+        self._record(
+            'update_link', ifindex=ifindex,
+            link=link.serialize() if link is not None else None)
+        self.receiver.update_link(ifindex)
+
+    def route_change(self, action, data):
+        self._record('route_change', action=action, data=data)
+        self.receiver.route_change(action, data)
+
+
+class NetworkEventReplayObserver:
+    """Feed recorded network events to receiver.
+
+    The events up to the "started" line are delivered by start(), as a
+    real observer delivers its initial dump.  The rest are delivered
+    from data_ready, at the pace they were recorded at divided by
+    speed, or as fast as possible if speed is 0.
+    """
+
+    def __init__(self, events, receiver, speed=1.0):
+        self.receiver = receiver
+        self.speed = speed
+        self.links = {}
+        for i, event in enumerate(events):
+            if event['event'] == STARTED:
+                self.initial = events[:i]
+                self.events = events[i + 1:]
+                self.t0 = event['time']
+                break
+        else:
+            self.initial = []
+            self.events = list(events)
+            self.t0 = events[0]['time'] if events else 0
+        self.delivered = 0
+        self.rfd = self.wfd = None
+
+    def start(self):
+        for event in self.initial:
+            self._deliver(event)
+        if not self.events:
+            return []
+        self.rfd, self.wfd = os.pipe()
+        self.started = time.monotonic()
+        threading.Thread(
+            target=self._pace, name='network-replay', daemon=True).start()
+        return [self.rfd]
+
+    def _pace(self):
+        for event in self.events:
+            if self.speed:
+                due = (event['time'] - self.t0) / self.speed
+                delay = self.started + due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            os.write(self.wfd, b'x')
+
+    def data_ready(self, fd):
+        ready = len(os.read(fd, 4096))
+        for event in self.events[self.delivered:self.delivered + ready]:
+            self._deliver(event)
+        self.delivered += ready
+        if self.delivered == len(self.events):
+            log.debug(
+                "replayed %d network events in %.3fs", len(self.events),
+                time.monotonic() - self.started)
+
+    def trigger_scan(self, ifindex):
+        # The scan results, if there were any, are in the recording.
+        pass
+
+    def _make_link(self, data):
+        from probert.network import Link
+        return Link.from_saved_data(data)
+
+    def _deliver(self, event):
+        kind = event['event']
+        ifindex = event.get('ifindex')
+        if kind == 'new_link':
+            link = self.links[ifindex] = self._make_link(event['link'])
+            self.receiver.new_link(ifindex, link)
+        elif kind == 'del_link':
+            self.links.pop(ifindex, None)
+            self.receiver.del_link(ifindex)
+        elif kind == 'update_link':
+            link = self.links.get(ifindex)
+            if link is not None and event['link'] is not None:
+                # The receiver holds on to the link object, so update it
+                # in place, as probert does.
+                vars(link).update(vars(self._make_link(event['link'])))
+            self.receiver.update_link(ifindex)
+        elif kind == 'route_change':
+            self.receiver.route_change(event['action'], event['data'])
+
+
+def flapping_events(network, flaps=10, interval=0.1):
+    """Return a recording of every ethernet link in network flapping.
+
+    network is the network part of a machine config.  Each link goes
+    down and back up flaps times, all of them together, every interval
+    seconds.
+    """
+    events = []
+    for link in network['links']:
+        events.append({
+            'event': 'new_link', 'time': 0.0,
+            'ifindex': link['netlink_data']['ifindex'], 'link': link,
+            })
+    for route in network['routes']:
+        events.append({
+            'event': 'route_change', 'time': 0.0,
+            'action': 'NEW', 'data': route,
+            })
+    events.append({'event': STARTED, 'time': 0.0})
+    eths = [link for link in network['links'] if link['type'] == 'eth']
+    t = 0.0
+    for i in range(flaps * 2):
+        t += interval
+        up = i % 2 == 1
+        for link in eths:
+            link = copy.deepcopy(link)
+            flags = link['netlink_data']['flags']
+            if up:
+                flags |= IFF_RUNNING | IFF_LOWER_UP
+            else:
+                flags &= ~(IFF_RUNNING | IFF_LOWER_UP)
+            link['netlink_data']['flags'] = flags
+            link['udev_data']['attrs']['carrier'] = '1' if up else '0'
+            link['udev_data']['attrs']['operstate'] = 'up' if up else 'down'
+            events.append({
+                'event': 'update_link', 'time': round(t, 6),
+                'ifindex': link['netlink_data']['ifindex'], 'link': link,
+                })
+    return events
@@ -0,0 +1,108 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Probe many devices in parallel, giving up on ones that hang.
+
+A read from sysfs for a dead multipath path or a broken USB reader can
+block for minutes, and a thread stuck in one cannot be interrupted.  So
+the workers are daemon threads (which do not stop the process exiting)
+and when a device takes too long it is abandoned, along with the thread
+probing it, and a new worker is started to take that thread's place.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+log = logging.getLogger('subiquitycore.parallel_probe')
+
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 10.0
+
+TIMED_OUT = 'timed out'
+FAILED = 'failed'
+
+
+def probe_devices(devices, probe, workers=DEFAULT_WORKERS,
+                  timeout=DEFAULT_TIMEOUT):
+    """Call probe(device) for each (name, device) pair in devices.
+
+    Returns (results, timings, unprobed): results maps name to what
+    probe returned, timings maps name to how long probe ran for (in
+    seconds) and unprobed maps the name of each device that took longer
+    than timeout or raised an exception to TIMED_OUT or FAILED.
+    """
+    cond = threading.Condition()
+    queue = collections.deque(devices)
+    running = {}  # name -> time probe started
+    results = {}
+    timings = {}
+    unprobed = {}
+
+    def worker():
+        while True:
+            with cond:
+                if not queue:
+                    return
+                name, device = queue.popleft()
+                running[name] = time.monotonic()
+                cond.notify()
+            try:
+                result = probe(device)
+            except Exception:
+                log.exception("probing %s failed", name)
+                result = None
+                status = FAILED
+            else:
+                status = None
+            with cond:
+                started = running.pop(name, None)
+                if started is None:
+                    # Timed out, and this thread has been replaced.
+                    log.debug("probe of %s finished after timing out", name)
+                    return
+                timings[name] = time.monotonic() - started
+                if status is None:
+                    results[name] = result
+                else:
+                    unprobed[name] = status
+                cond.notify()
+
+    def start_worker():
+        threading.Thread(
+            target=worker, name='probe-device', daemon=True).start()
+
+    for i in range(min(workers, len(queue))):
+        start_worker()
+
+    with cond:
+        while queue or running:
+            now = time.monotonic()
+            for name, started in list(running.items()):
+                if now - started >= timeout:
+                    log.warning(
+                        "probing %s took more than %ss, giving up on it",
+                        name, timeout)
+                    del running[name]
+                    timings[name] = now - started
+                    unprobed[name] = TIMED_OUT
+                    start_worker()
+            if running:
+                wait = min(started + timeout for started in running.values())
+                cond.wait(max(wait - now, 0.01))
+            elif queue:
+                cond.wait(timeout)
+    return results, timings, unprobed
@@ -0,0 +1,184 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" A cache of probe results that survives restarts of the process.
+
+The cache is a JSON file (under /run, so it does not survive a reboot)
+holding one entry per section ("storage", say).  A section holds an item
+per device, each recording a fingerprint of the state the device was
+probed in, and an item is only used if the device's current fingerprint
+matches, so only the devices that changed need probing again.  The
+whole file is thrown away if it was written during a different boot.
+"""
+
+import json
+import logging
+import os
+import threading
+
+log = logging.getLogger('subiquitycore.probe_cache')
+
+CACHE_VERSION = 2
+
+
+def boot_id(path='/proc/sys/kernel/random/boot_id'):
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except OSError:
+        return None
+
+
+def _udev_mtime(udev_data, name):
+    try:
+        return os.stat(os.path.join(udev_data, name)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def block_fingerprint(sysfs='/sys/class/block', udev_data='/run/udev/data'):
+    """Return a cheap summary of the state of each block device.
+
+    The result maps device path to a fingerprint that changes when the
+    device changes size or has its udev database entry rewritten (which
+    happens on every change uevent for it).
+    """
+    fingerprints = {}
+    try:
+        names = sorted(os.listdir(sysfs))
+    except OSError:
+        return None
+    for name in names:
+        try:
+            with open(os.path.join(sysfs, name, 'dev')) as fp:
+                dev = fp.read().strip()
+            with open(os.path.join(sysfs, name, 'size')) as fp:
+                size = fp.read().strip()
+        except OSError:
+            continue
+        # sysfs names have '!' where the device path has '/'.
+        path = '/dev/' + name.replace('!', '/')
+        fingerprints[path] = [dev, size, _udev_mtime(udev_data, 'b' + dev)]
+    return fingerprints
+
+
+def network_fingerprint(sysfs='/sys/class/net', udev_data='/run/udev/data'):
+    """Return a cheap summary of the state of each network link.
+
+    The result maps ifindex (as a string) to a fingerprint that changes
+    when the link is renamed, changes address or has its udev database
+    entry rewritten.
+    """
+    fingerprints = {}
+    try:
+        names = sorted(os.listdir(sysfs))
+    except OSError:
+        return None
+    for name in names:
+        try:
+            with open(os.path.join(sysfs, name, 'ifindex')) as fp:
+                ifindex = fp.read().strip()
+            with open(os.path.join(sysfs, name, 'address')) as fp:
+                address = fp.read().strip()
+        except OSError:
+            continue
+        fingerprints[ifindex] = [
+            name, address, _udev_mtime(udev_data, 'n' + ifindex)]
+    return fingerprints
+
+
+class ProbeCache:
+
+    def __init__(self, path, boot_id=None):
+        self.path = path
+        self.boot_id = boot_id
+        self._lock = threading.Lock()
+        self._sections = None
+
+    def _load(self):
+        if self._sections is not None:
+            return self._sections
+        self._sections = {}
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return self._sections
+        except (OSError, ValueError):
+            log.exception("reading probe cache %s failed", self.path)
+            return self._sections
+        if data.get('version') != CACHE_VERSION:
+            log.debug("probe cache %s has the wrong version", self.path)
+        elif data.get('boot_id') != self.boot_id:
+            log.debug("probe cache %s is from another boot", self.path)
+        else:
+            self._sections = data.get('sections', {})
+        return self._sections
+
+    def get_items(self, section, fingerprints):
+        """Return the cached items of section that are still valid.
+
+        fingerprints maps the key of each current item to its
+        fingerprint.  The result maps the keys whose fingerprint is the
+        one recorded in the cache to the cached data.
+        """
+        with self._lock:
+            entry = self._load().get(section, {})
+        items = {}
+        for key, fingerprint in fingerprints.items():
+            item = entry.get(key)
+            if item is not None and item['fingerprint'] == fingerprint:
+                items[key] = item['data']
+        log.debug(
+            "using cached %s data for %d of %d items", section, len(items),
+            len(fingerprints))
+        return items
+
+    def put_items(self, section, fingerprints, items):
+        """Replace the cached items of section.
+
+        items maps key to data, and is cached with the fingerprint for
+        the key in fingerprints.  Items without a fingerprint are not
+        cached.
+        """
+        entry = {}
+        for key, data in items.items():
+            if key in fingerprints:
+                entry[key] = {
+                    'fingerprint': fingerprints[key],
+                    'data': data,
+                    }
+        with self._lock:
+            sections = self._load()
+            sections[section] = entry
+            self._write(sections)
+
+    def _write(self, sections):
+        tmppath = '%s.%s' % (self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmppath, 'w') as fp:
+                json.dump({
+                    'version': CACHE_VERSION,
+                    'boot_id': self.boot_id,
+                    'sections': sections,
+                    }, fp)
+            os.rename(tmppath, self.path)
+        except (OSError, TypeError, ValueError):
+            log.exception("writing probe cache %s failed", self.path)
+            try:
+                os.unlink(tmppath)
+            except OSError:
+                pass
@@ -14,11 +14,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
-import yaml
-import os
-from probert.network import (StoredDataObserver, UdevObserver)
-from probert.storage import (Storage,
-                             StorageInfo)
+
+from subiquitycore.machine_config import (
+    load_machine_config,
+    MachineConfigError,
+    )
+from subiquitycore.network_events import (
+    load_network_events,
+    NetworkEventRecorder,
+    NetworkEventReplayObserver,
+    )
+from subiquitycore.parallel_probe import probe_devices
+from subiquitycore.probe_cache import (
+    block_fingerprint,
+    boot_id,
+    network_fingerprint,
+    ProbeCache,
+    )
 
 log = logging.getLogger('subiquitycore.prober')
 
@@ -28,50 +40,477 @@ class ProberException(Exception):
     pass
 
 
+# probert is imported where it is used: probert.network and
+# probert.storage are slow to import and not every entry point needs
+# both.
+
+
+class _BufferingEventReceiver:
+    """Queue network or block device events until the real receiver is
+    attached.
+
+    This lets the initial network dump happen, and block devices come
+    and go, before the controller that consumes the events has been
+    created.
+    """
+
+    def __init__(self):
+        self.receiver = None
+        self.events = []
+
+    def attach(self, receiver):
+        self.receiver = receiver
+        events, self.events = self.events, []
+        for meth, args in events:
+            getattr(receiver, meth)(*args)
+
+    def _event(self, meth, *args):
+        if self.receiver is None:
+            self.events.append((meth, args))
+        else:
+            getattr(self.receiver, meth)(*args)
+
+    def new_link(self, ifindex, link):
+        self._event('new_link', ifindex, link)
+
+    def del_link(self, ifindex):
+        self._event('del_link', ifindex)
+
+    def update_link(self, ifindex):
+        self._event('update_link', ifindex)
+
+    def route_change(self, action, data):
+        self._event('route_change', action, data)
+
+    def block_device_changed(self, path, data):
+        self._event('block_device_changed', path, data)
+
+    def block_device_removed(self, path):
+        self._event('block_device_removed', path)
+
+
+# What can be probed.  storage.block-only reads the udev properties of
+# each block device and just the sysfs attributes in BLOCK_ONLY_ATTRS,
+# storage.full reads every attribute.  network.links watches the
+# network links and network.wlan listens for wifi scan results too.
+PROBE_SCOPES = (
+    'storage.block-only',
+    'storage.full',
+    'network.links',
+    'network.wlan',
+    )
+_IMPLIED_SCOPES = {
+    'storage.full': 'storage.block-only',
+    'network.wlan': 'network.links',
+    }
+# The attributes the filesystem model and probert's StorageInfo use.
+BLOCK_ONLY_ATTRS = ('size', 'ro', 'removable')
+
+
+def expand_scopes(scopes):
+    """Return the set of scopes plus the scopes they imply."""
+    expanded = set()
+    for scope in scopes:
+        if scope not in PROBE_SCOPES:
+            raise ProberException(
+                "unknown probe scope {!r}, expected one of {}".format(
+                    scope, ", ".join(PROBE_SCOPES)))
+        expanded.add(scope)
+        if scope in _IMPLIED_SCOPES:
+            expanded.add(_IMPLIED_SCOPES[scope])
+    return expanded
+
+
+# Block devices with these major numbers are ram disks and loop devices,
+# which are not reported, as in probert's storage probe.
+IGNORED_BLOCK_MAJORS = ('1', '7')
+
+
+def block_device_data(device, attr_names=None):
+    """Return the storage data for a pyudev device, in probert's format.
+
+    Only the sysfs attributes in attr_names are read, if it is given.
+    """
+    data = dict(device.properties)
+    attrs = {}
+    names = device.attributes.available_attributes
+    if attr_names is not None:
+        names = [name for name in names if name in attr_names]
+    for name in names:
+        try:
+            attrs[name] = device.attributes.asstring(name)
+        except (KeyError, OSError, UnicodeDecodeError):
+            continue
+    # sysfs reports the size in 512 byte sectors, probert in bytes.
+    attrs['size'] = str(int(attrs.get('size', '0')) * 512)
+    data['attrs'] = attrs
+    return data
+
+
+class BlockDeviceObserver:
+    """Keep storage data up to date as block devices come and go.
+
+    This is driven like probert's network observers: start() returns
+    file descriptors to watch and data_ready(fd) should be called when
+    one is readable.  The receiver's block_device_changed(path, data)
+    or block_device_removed(path) is called for each udev event, after
+    storage has been updated.
+    """
+
+    def __init__(self, storage, receiver, attr_names=None):
+        self.storage = storage
+        self.receiver = receiver
+        self.attr_names = attr_names
+        self.monitor = None
+
+    def start(self):
+        import pyudev
+        context = pyudev.Context()
+        self.monitor = pyudev.Monitor.from_netlink(context)
+        self.monitor.filter_by(subsystem='block')
+        self.monitor.start()
+        return [self.monitor.fileno()]
+
+    def data_ready(self, fd):
+        while True:
+            device = self.monitor.poll(timeout=0)
+            if device is None:
+                return
+            self.handle_event(device.action, device)
+
+    def handle_event(self, action, device):
+        path = device.device_node
+        if path is None or device.get('MAJOR') in IGNORED_BLOCK_MAJORS:
+            return
+        log.debug('block device event: %s %s', action, path)
+        if action == 'remove':
+            self.storage.pop(path, None)
+            self.receiver.block_device_removed(path)
+        elif action in ('add', 'change'):
+            data = block_device_data(device, self.attr_names)
+            self.storage[path] = data
+            self.receiver.block_device_changed(path, data)
+
+
+class _CachedUdevDevice(dict):
+    """Enough of a pyudev Device for probert's UdevObserver."""
+
+    def __init__(self, properties, attrs):
+        super().__init__(properties)
+        self.properties = properties
+        self.attributes = _CachedUdevAttributes(attrs)
+
+
+class _CachedUdevAttributes:
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.available_attributes = list(attrs)
+
+    def __iter__(self):
+        return iter(self.attrs)
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+
+class CachingUdevContext:
+    """Answer probert's udev lookups for network links from a cache.
+
+    probert's UdevObserver looks up each link it is told about with
+    list_devices(IFINDEX=...).  Links in items (which maps ifindex to
+    udev properties and attributes) are answered from there; the udev
+    data of other links is read as usual and added to items, so that it
+    can be cached in turn.
+    """
+
+    def __init__(self, context, items):
+        self.context = context
+        self.items = items
+
+    def list_devices(self, **kw):
+        if list(kw) != ['IFINDEX']:
+            return self.context.list_devices(**kw)
+        ifindex = str(kw['IFINDEX'])
+        data = self.items.get(ifindex)
+        if data is None:
+            devices = list(self.context.list_devices(**kw))
+            if not devices:
+                return []
+            device = devices[0]
+            attrs = {}
+            for name in device.attributes.available_attributes:
+                value = device.attributes.get(name)
+                if isinstance(value, bytes):
+                    value = value.decode('utf-8', 'replace')
+                attrs[name] = value
+            data = self.items[ifindex] = {
+                'properties': dict(device.properties),
+                'attrs': attrs,
+                }
+        return [_CachedUdevDevice(data['properties'], data['attrs'])]
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+
 class Prober():
     def __init__(self, opts):
         self.opts = opts
 
         self.probe_data = {}
         self.saved_config = None
+        self.storage_future = None
+        self.network_future = None
+        # The block device observer start_probing starts, the fds it
+        # wants watched and the receiver buffering its events.
+        self.block_observer = None
+        self.block_fds = []
+        self._block_receiver = None
+        self.cache = None
+        # (fingerprints, CachingUdevContext) until the network cache
+        # has been written.
+        self._network_cache = None
+        self.scopes = set(PROBE_SCOPES)
+        self.storage_timings = {}
+        # device -> (the storage data it was made from, StorageInfo)
+        self._storage_info = {}
 
         if self.opts.machine_config:
-            log.debug('User specified machine_config: {}'.format(
-                      self.opts.machine_config))
+            log.debug('User specified machine_config: %s',
+                      self.opts.machine_config)
             self.saved_config = \
               self._load_machine_config(self.opts.machine_config)
             self.probe_data = self.saved_config
-        log.debug('Prober() init finished, data:{}'.format(self.saved_config))
+        elif getattr(self.opts, 'probe_cache', None) is not None:
+            self.cache = ProbeCache(self.opts.probe_cache, boot_id())
+        # The machine config can be huge, so don't log all of it.
+        log.debug('Prober() init finished, data for: %s',
+                  sorted(self.probe_data))
 
     def _load_machine_config(self, machine_config):
-        with open(machine_config) as mc:
-            try:
-                data = yaml.safe_load(mc)
-            except (UnicodeDecodeError, yaml.reader.ReaderError):
-                err = 'Failed to parse machine config'
-                log.exception(err)
-                raise ProberException(err)
+        try:
+            data = load_machine_config(
+                machine_config,
+                snapshot=getattr(self.opts, 'machine_config_snapshot', False))
+        except MachineConfigError:
+            err = 'Failed to parse machine config'
+            log.exception(err)
+            raise ProberException(err)
 
         return data
 
-    def probe_network(self, receiver):
+    def start_probing(self, executor, scopes=None):
+        """Start probing storage and the network on executor.
+
+        Only what is in scopes (all of PROBE_SCOPES by default) is
+        probed.  storage_future and network_future can be waited on by
+        anyone who needs the results; get_storage() and probe_network()
+        wait for them rather than probing a second time, and probe on
+        demand if they were not started.
+
+        Block devices are watched from before storage is probed, so that
+        none that appear later are missed.  Once storage_future is done,
+        block_fds should be watched and block_data_ready called when one
+        is readable.
+        """
+        if scopes is not None:
+            self.scopes = expand_scopes(scopes)
+        log.debug('starting background probes for %s', sorted(self.scopes))
+        if 'storage.block-only' in self.scopes:
+            self.storage_future = executor.submit(
+                self._watch_and_probe_storage)
+        if 'network.links' in self.scopes:
+            self.network_future = executor.submit(
+                self._start_network_observer)
+
+    def _storage_attrs(self):
+        """Return the sysfs attributes to read, or None for all of them."""
+        if 'storage.block-only' in self.scopes \
+          and 'storage.full' not in self.scopes:
+            return BLOCK_ONLY_ATTRS
+        return None
+
+    def _storage_cache_section(self):
+        if self._storage_attrs() is None:
+            return 'storage'
+        return 'storage.block-only'
+
+    def _make_network_observer(self, receiver):
+        from probert.network import StoredDataObserver
+        replay = getattr(self.opts, 'replay_network_events', None)
+        if replay is not None:
+            return NetworkEventReplayObserver(
+                load_network_events(replay), receiver,
+                speed=getattr(self.opts, 'replay_speed', 1.0))
         if self.opts.machine_config:
-            observer = StoredDataObserver(
-                self.saved_config['network'], receiver)
-        else:
+            return StoredDataObserver(self.saved_config['network'], receiver)
+        record = getattr(self.opts, 'record_network_events', None)
+        if record is not None:
+            return NetworkEventRecorder(
+                record, receiver, self._make_udev_observer)
+        return self._make_udev_observer(receiver)
+
+    def _make_udev_observer(self, receiver):
+        from probert.network import UdevObserver
+        if 'network.wlan' in self.scopes:
             observer = UdevObserver(receiver)
-        return observer, observer.start()
+        else:
+            try:
+                observer = UdevObserver(receiver, with_wlan_listener=False)
+            except TypeError:
+                # This probert always listens for wlan events.
+                observer = UdevObserver(receiver)
+        if self.cache is not None and hasattr(observer, 'context'):
+            fingerprints = network_fingerprint()
+            if fingerprints is not None:
+                observer.context = CachingUdevContext(
+                    observer.context,
+                    self.cache.get_items('network', fingerprints))
+                self._network_cache = fingerprints, observer.context
+        return observer
 
-    def get_storage(self):
-        ''' Load a StorageInfo class.  Probe if it's not present '''
+    def _start_observer(self, observer):
+        """Start observer, which reports the links that exist now, and
+        cache the udev data of those links."""
+        fds = observer.start()
+        if self._network_cache is not None:
+            fingerprints, context = self._network_cache
+            self._network_cache = None
+            self.cache.put_items('network', fingerprints, context.items)
+        return fds
+
+    def _start_network_observer(self):
+        receiver = _BufferingEventReceiver()
+        observer = self._make_network_observer(receiver)
+        return receiver, observer, self._start_observer(observer)
+
+    def probe_network(self, receiver):
+        if self.network_future is not None:
+            buffering_receiver, observer, fds = self.network_future.result()
+            # The observer can only feed one receiver.
+            self.network_future = None
+            buffering_receiver.attach(receiver)
+            return observer, fds
+        observer = self._make_network_observer(receiver)
+        return observer, self._start_observer(observer)
+
+    def _watch_and_probe_storage(self):
+        observer = None
+        if not self.opts.machine_config:
+            self._block_receiver = _BufferingEventReceiver()
+            observer = BlockDeviceObserver(
+                {}, self._block_receiver, self._storage_attrs())
+            self.block_fds = observer.start()
+            self.block_observer = observer
+        storage = self._probe_storage()
+        if observer is not None:
+            # Events that arrived while probing are read once block_fds
+            # are watched, and replayed on top of this.
+            observer.storage = storage
+        return storage
+
+    def block_data_ready(self, fd):
+        self.block_observer.data_ready(fd)
+
+    def _probe_storage(self):
         if 'storage' not in self.probe_data:
+            fingerprints = None
+            cached = {}
+            if self.cache is not None:
+                fingerprints = block_fingerprint()
+                if fingerprints is not None:
+                    cached = self.cache.get_items(
+                        self._storage_cache_section(), fingerprints)
             log.debug('get_storage: no storage in probe_data, fetching')
-            storage = Storage()
-            results = storage.probe()
+            results = self._probe_block_devices(cached)
             self.probe_data['storage'] = results
+            if fingerprints is not None:
+                self.cache.put_items(
+                    self._storage_cache_section(), fingerprints,
+                    {path: data for path, data in results.items()
+                     if 'unprobed' not in data})
 
         return self.probe_data['storage']
 
+    def _probe_block_devices(self, cached=None):
+        """Probe each block device in parallel, as probert's Storage would.
+
+        The devices in cached (a dict of already probed data) are not
+        probed again.  A device that cannot be probed in time gets only
+        its udev properties, no attrs and an 'unprobed' key saying why.
+        """
+        import pyudev
+        if cached is None:
+            cached = {}
+        devices = []
+        for device in pyudev.Context().list_devices(subsystem='block'):
+            path = device.device_node
+            if path is None or device.get('MAJOR') in IGNORED_BLOCK_MAJORS:
+                continue
+            devices.append((path, device))
+        attr_names = self._storage_attrs()
+        results, timings, unprobed = probe_devices(
+            [(path, device) for path, device in devices
+             if path not in cached],
+            lambda device: block_device_data(device, attr_names),
+            timeout=getattr(self.opts, 'storage_probe_timeout', 10.0))
+        storage = {}
+        for path, device in devices:
+            if path in cached:
+                storage[path] = cached[path]
+            elif path in results:
+                storage[path] = results[path]
+            else:
+                data = dict(device.properties)
+                data['attrs'] = {}
+                data['unprobed'] = unprobed[path]
+                storage[path] = data
+        self.storage_timings = timings
+        for path, duration in sorted(
+                timings.items(), key=lambda item: -item[1])[:5]:
+            log.debug('probing %s took %.3fs', path, duration)
+        if unprobed:
+            log.warning('could not probe %s', ', '.join(sorted(unprobed)))
+        return storage
+
+    def get_storage(self):
+        ''' Load a StorageInfo class.  Probe if it's not present '''
+        if self.storage_future is not None:
+            return self.storage_future.result()
+        return self._probe_storage()
+
+    def probe_storage_events(self, receiver):
+        """Start watching for block devices being added, changed or removed.
+
+        Returns (observer, fds), like probe_network.  There are no
+        events to watch for when a machine config is being used.  If
+        start_probing is already watching block devices, receiver is
+        subscribed to that observer, is sent the events it has seen so
+        far and there are no more fds to watch.
+        """
+        if self.opts.machine_config:
+            return None, []
+        if self.storage_future is not None:
+            self.storage_future.result()
+            if self._block_receiver is not None:
+                self._block_receiver.attach(receiver)
+                return self.block_observer, []
+        observer = BlockDeviceObserver(
+            self.get_storage(), receiver, self._storage_attrs())
+        return observer, observer.start()
+
     def get_storage_info(self, device):
-        ''' Load a StorageInfo class for specified device '''
-        return StorageInfo({device: self.get_storage().get(device)})
+        ''' Load a StorageInfo class for specified device
+
+        The same object is returned each time until the storage data for
+        the device is replaced (by BlockDeviceObserver, for example).
+        '''
+        data = self.get_storage().get(device)
+        cached = self._storage_info.get(device)
+        if cached is not None and cached[0] is data:
+            return cached[1]
+        from probert.storage import StorageInfo
+        info = StorageInfo({device: data})
+        self._storage_info[device] = (data, info)
+        return info
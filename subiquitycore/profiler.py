@@ -0,0 +1,125 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" A sampling profiler for the UI thread.
+
+A background thread looks at the UI thread's stack every interval
+seconds (DEFAULT_INTERVAL unless --profile-interval is passed) and
+counts how often each stack is seen.  The sampling thread holds the GIL
+while it walks the stack, so each sample does stall the UI thread
+briefly; the default interval keeps that small enough to leave on for a
+whole install, and a shorter one trades overhead for detail.
+
+Samples are grouped into sections (the application starts a new
+section for each screen) and written out, one file per section, in the
+"collapsed stack" format that flamegraph.pl and speedscope read:
+
+    subiquitycore.core:run;urwid.main_loop:run;... 42
+"""
+
+import argparse
+import collections
+import logging
+import os
+import sys
+import threading
+
+log = logging.getLogger('subiquitycore.profiler')
+
+DEFAULT_INTERVAL = 0.02
+
+
+def parse_interval(value):
+    """Parse --profile-interval: milliseconds, returned as seconds."""
+    try:
+        ms = float(value)
+    except ValueError:
+        ms = 0
+    # A NaN also fails this, and zero would make the sampler spin.
+    if not ms > 0:
+        raise argparse.ArgumentTypeError(
+            "{!r} is not a positive number of milliseconds".format(value))
+    return ms / 1000
+
+
+def _frame_name(frame):
+    return "{}:{}".format(
+        frame.f_globals.get('__name__', '?'), frame.f_code.co_name)
+
+
+def collapse_stack(frame):
+    """Return frame's stack as a ';' separated string, outermost first."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+
+    def __init__(self, dir, interval=DEFAULT_INTERVAL):
+        if not interval > 0:
+            raise ValueError(
+                "sampling interval must be positive, not {}".format(interval))
+        self.dir = dir
+        self.interval = interval
+        self.section = 'startup'
+        self.samples = collections.defaultdict(collections.Counter)
+        self._thread = None
+        self._target = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start sampling the calling thread."""
+        self._target = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        log.debug("profiling every %.3fs into %s", self.interval, self.dir)
+
+    def set_section(self, section):
+        self.section = section
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            self.samples[self.section][collapse_stack(frame)] += 1
+            del frame
+
+    def stop(self):
+        """Stop sampling and write one file per section to self.dir."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            for section, counts in sorted(self.samples.items()):
+                self._write(section, counts)
+        except OSError:
+            log.exception("writing profile to %s failed", self.dir)
+
+    def _write(self, section, counts):
+        path = os.path.join(self.dir, "profile-{}.folded".format(section))
+        with open(path, 'w') as fp:
+            for stack, count in counts.most_common():
+                fp.write("{} {}\n".format(stack, count))
+        log.debug("wrote %d samples for %s to %s",
+                  sum(counts.values()), section, path)
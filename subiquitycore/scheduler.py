@@ -0,0 +1,202 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Named lanes of worker threads for background work.
+
+Work submitted to one lane never waits for work in another, so a long
+curtin run in the "install" lane cannot hold up a quick probe or a
+task the user is waiting on.
+"""
+
+from concurrent import futures
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger('subiquitycore.scheduler')
+
+# Lane name -> number of worker threads.
+DEFAULT_LANES = {
+    'install': 1,  # long running: curtin install and postinstall
+    'probe': 2,    # probing storage and the network
+    'ui': 2,       # things the user is watching a spinner for
+}
+
+
+class SchedulerError(Exception):
+    """ Problem with the scheduler configuration """
+    pass
+
+
+class Lane:
+    """A pool of workers plus statistics about the work it has run."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        # thread_name_prefix needs Python 3.6, so run() names the
+        # worker threads instead.
+        self._executor = futures.ThreadPoolExecutor(workers)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def submit(self, func, *args, **kwargs):
+        submitted = time.monotonic()
+        with self._lock:
+            self.queued += 1
+
+        def run():
+            started = time.monotonic()
+            threading.current_thread().name = 'lane-' + self.name
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.wait_time += started - submitted
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.run_time += time.monotonic() - started
+
+        try:
+            return self._executor.submit(run)
+        except:
+            # Shut down already, say.
+            with self._lock:
+                self.queued -= 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'wait_time': self.wait_time,
+                'run_time': self.run_time,
+                }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def parse_lane_spec(specs, lanes=None):
+    """Apply a list of 'lane=workers' strings to a lane dict.
+
+    Returns a new dict based on lanes (DEFAULT_LANES if not given).
+    """
+    if lanes is None:
+        lanes = DEFAULT_LANES
+    lanes = dict(lanes)
+    for spec in specs:
+        name, sep, count = spec.partition('=')
+        try:
+            count = int(count)
+        except ValueError:
+            count = 0
+        if not sep or not name or count < 1:
+            raise SchedulerError(
+                "{!r} is not of the form lane=workers".format(spec))
+        lanes[name] = count
+    return lanes
+
+
+class Scheduler:
+    """Run functions in background threads, one pool per named lane."""
+
+    def __init__(self, lanes=None):
+        if lanes is None:
+            lanes = DEFAULT_LANES
+        self.lanes = {}
+        for name, workers in lanes.items():
+            self.lanes[name] = Lane(name, workers)
+
+    def lane(self, name):
+        try:
+            return self.lanes[name]
+        except KeyError:
+            raise SchedulerError("unknown lane {!r}".format(name))
+
+    def submit(self, lane, func, *args, **kwargs):
+        return self.lane(lane).submit(func, *args, **kwargs)
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def log_stats(self):
+        for name, stats in sorted(self.stats().items()):
+            log.debug(
+                "lane %s: workers=%d queued=%d running=%d completed=%d "
+                "wait=%.3fs run=%.3fs", name, stats['workers'],
+                stats['queued'], stats['running'], stats['completed'],
+                stats['wait_time'], stats['run_time'])
+
+    def shutdown(self, wait=True):
+        for lane in self.lanes.values():
+            lane.shutdown(wait=wait)
+
+
+class CompletionDispatcher:
+    """Call back on the UI thread when background work finishes.
+
+    There is one pipe, watched by the main loop, for all completions.
+    Futures that finish before the main loop gets around to reading
+    the pipe are handled in a single wakeup, in the order they
+    finished.
+    """
+
+    def __init__(self, loop):
+        self._lock = threading.Lock()
+        self._completed = []
+        self._wakeup_pending = False
+        self._pipe = loop.watch_pipe(self._dispatch)
+
+    def add(self, fut, callback, func=None):
+        """Arrange for callback(fut) to be called once fut is done.
+
+        func is only used to make log messages more useful.
+        """
+        fut.add_done_callback(
+            lambda fut: self._done(fut, callback, func))
+
+    def _done(self, fut, callback, func):
+        # Called on whichever thread completed fut.
+        with self._lock:
+            self._completed.append((fut, callback, func))
+            if self._wakeup_pending:
+                return
+            self._wakeup_pending = True
+        os.write(self._pipe, b'x')
+
+    def _dispatch(self, ignored):
+        with self._lock:
+            completed, self._completed = self._completed, []
+            self._wakeup_pending = False
+        for fut, callback, func in completed:
+            try:
+                callback(fut)
+            except:
+                log.exception(
+                    "callback %s after calling %s failed", callback, func)
+        # Returning False would make urwid close the pipe.
+        return True
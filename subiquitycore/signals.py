@@ -16,8 +16,8 @@
 
 """ Registers all known signal emitters
 """
-import urwid
 import logging
+import time
 
 log = logging.getLogger('subiquity.signals')
 
@@ -27,72 +27,105 @@ class SignalException(Exception):
 
 
 class Signal:
-    known_signals = []
-    signal_stack = []
+    """Named signals with connected callbacks, and a stack of visited menus.
+
+    Callbacks are called in the order they were connected.  Emitting a
+    "menu:" signal pushes it on signal_stack, or, if that menu is
+    already on the stack, trims the stack back to it.
+
+    If stats is true, the number of times each signal is emitted and
+    the time spent in each callback are recorded; see dump_stats().
+    """
+
+    def __init__(self, stats=False):
+        self.known_signals = set()
+        self._callbacks = {}        # name -> [(cb, user_args, user_arg)]
+        self.signal_stack = []      # [(name, args, kwargs)]
+        self._stack_index = {}      # name -> position in signal_stack
+        self.collect_stats = stats
+        self.emit_counts = {}       # name -> number of emits
+        self.handler_times = {}     # (name, cb) -> [calls, seconds]
 
     def register_signals(self, signals):
         if type(signals) is list:
-            self.known_signals.extend(signals)
+            self.known_signals.update(signals)
         else:
-            self.known_signals.append(signals)
-        urwid.register_signal(Signal, signals)
+            self.known_signals.add(signals)
+
+    def _push(self, entry):
+        self._stack_index[entry[0]] = len(self.signal_stack)
+        self.signal_stack.append(entry)
+
+    def _pop(self):
+        entry = self.signal_stack.pop()
+        del self._stack_index[entry[0]]
+        return entry
+
+    def _trim(self, index):
+        while len(self.signal_stack) > index + 1:
+            self._pop()
 
     def prev_signal(self):
-        log.debug('prev_signal: before: '
-                  'size={} stack={}'.format(len(self.signal_stack),
-                                            self.signal_stack))
+        log.debug('prev_signal: before: size=%s', len(self.signal_stack))
         if len(self.signal_stack) > 1:
-            (current_name, *_) = self.signal_stack.pop()
-            (prev_name, args, kwargs) = self.signal_stack.pop()
-            log.debug('current_name={}'.format(current_name))
-            log.debug('previous={}'.format(prev_name))
+            (current_name, *_) = self._pop()
+            (prev_name, args, kwargs) = self._pop()
+            log.debug('current_name=%s', current_name)
+            log.debug('previous=%s', prev_name)
             while (current_name.count(':') < prev_name.count(':') or
                    current_name == prev_name):
                 log.debug('get next previous')
-                (prev_name, args, kwargs) = self.signal_stack.pop()
-                log.debug('previous={}'.format(prev_name))
-
-            log.debug('prev_signal: after: '
-                      'size={} stack={}'.format(len(self.signal_stack),
-                                                self.signal_stack))
+                (prev_name, args, kwargs) = self._pop()
+                log.debug('previous=%s', prev_name)
 
-            log.debug("PrevEmitter: {}, {}, {}".format(prev_name, args,
-                                                       kwargs))
+            log.debug('prev_signal: after: size=%s', len(self.signal_stack))
             self.emit_signal(prev_name, *args, **kwargs)
         else:
             log.debug('stack empty: emitting menu:welcome:main')
             # FIXME: this should be set by common
-            urwid.emit_signal(self, 'menu:welcome:main')
+            self._dispatch('menu:welcome:main', (), {})
 
     def emit_signal(self, name, *args, **kwargs):
-        # Disabled because it can reveal credentials in the arguments.
-        #log.debug("Emitter: {}, {}, {}".format(name, args, kwargs))
+        # Do not log args, they can include credentials.
         if name.startswith("menu:"):
-            log.debug(" emit: before: "
-                      "size={} stack={}".format(len(self.signal_stack),
-                                                self.signal_stack))
             # only stack *menu* signals, drop signals if we've already
             # visited this level
-            match = [s for s in self.signal_stack if s[0] == name]
-            if len(match) > 0:
-                index = self.signal_stack.index(match.pop())
-                log.debug('Already visited {}, trimming stack'.format(name))
-                self.signal_stack = self.signal_stack[0:index + 1]
+            index = self._stack_index.get(name)
+            if index is not None:
+                log.debug('Already visited %s, trimming stack', name)
+                self._trim(index)
             else:
-                log.debug('New menu for stack: {}'.format(name))
-                self.signal_stack.append((name, args, kwargs))
-
-            log.debug(" emit: after: "
-                      "size={} stack={}".format(len(self.signal_stack),
-                                                self.signal_stack))
-        urwid.emit_signal(self, name, *args, **kwargs)
+                log.debug('New menu for stack: %s', name)
+                self._push((name, args, kwargs))
+            log.debug(" emit: stack size=%s", len(self.signal_stack))
+        return self._dispatch(name, args, kwargs)
+
+    def _dispatch(self, name, args, kwargs):
+        result = False
+        callbacks = self._callbacks.get(name, ())
+        if self.collect_stats:
+            self.emit_counts[name] = self.emit_counts.get(name, 0) + 1
+        for cb, user_args, user_arg in list(callbacks):
+            cb_args = user_args + args
+            if user_arg is not None:
+                cb_args += (user_arg,)
+            if self.collect_stats:
+                start = time.monotonic()
+                r = cb(*cb_args, **kwargs)
+                times = self.handler_times.setdefault((name, cb), [0, 0.0])
+                times[0] += 1
+                times[1] += time.monotonic() - start
+            else:
+                r = cb(*cb_args, **kwargs)
+            result |= bool(r)
+        return result
 
-    def connect_signal(self, name, cb, **kwargs):
-        log.debug(
-            "Emitter Connection: {}, {}, {}".format(name,
-                                                    cb,
-                                                    kwargs))
-        urwid.connect_signal(self, name, cb, **kwargs)
+    def connect_signal(self, name, cb, user_arg=None, user_args=()):
+        log.debug("Emitter Connection: %s, %s", name, cb)
+        if name not in self.known_signals:
+            raise NameError("No such signal %r" % (name,))
+        self._callbacks.setdefault(name, []).append(
+            (cb, tuple(user_args), user_arg))
 
     def connect_signals(self, signal_callback):
         """ Connects a batch of signals
@@ -108,5 +141,17 @@ class Signal:
                 self.register_signals(sig)
             self.connect_signal(sig, cb)
 
+    def dump_stats(self):
+        """Log emit counts and callback timings, most expensive first."""
+        if not self.collect_stats:
+            return
+        for name, count in sorted(self.emit_counts.items(),
+                                  key=lambda x: -x[1]):
+            log.debug("signal %s emitted %d times", name, count)
+        for (name, cb), (calls, total) in sorted(self.handler_times.items(),
+                                                 key=lambda x: -x[1][1]):
+            log.debug("signal %s handler %s: %d calls, %.6fs",
+                      name, getattr(cb, '__qualname__', cb), calls, total)
+
     def __repr__(self):
-        return "Known Signals: {}".format(self.known_signals)
+        return "Known Signals: {}".format(sorted(self.known_signals))
@@ -0,0 +1,135 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Timings for the path from boot to the first frame on screen.
+
+The entry points import this module before anything else so that the
+timer starts as early as possible.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger('subiquitycore.startup')
+
+
+def _process_age():
+    """Return how many seconds ago this process was started, or None."""
+    try:
+        with open('/proc/self/stat') as fp:
+            stat = fp.read()
+        with open('/proc/uptime') as fp:
+            uptime = float(fp.read().split()[0])
+    except (OSError, ValueError):
+        return None
+    # The command name (field 2) can contain spaces, so split after it.
+    fields = stat[stat.rindex(')') + 2:].split()
+    starttime = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    return max(0.0, uptime - starttime)
+
+
+class StartupTimer:
+    """Record how long each phase of startup took.
+
+    Times are in seconds, relative to when the interpreter started
+    (or, if that cannot be determined, to when this module was
+    imported).  Phases can nest; they are listed in the order they
+    started.  Once finish() has been called nothing more is recorded,
+    so controllers that are constructed later, when their screen is
+    first shown, do not appear.
+    """
+
+    def __init__(self):
+        self.t0 = time.monotonic()
+        self.phases = []
+        self.depth = 0
+        self.report_path = None
+        self.finished = False
+        self.total = None
+        age = _process_age()
+        self.offset = 0.0
+        if age is not None:
+            self.offset = age
+            self.phases.append(["interpreter start", 0.0, age, 0])
+
+    def _now(self):
+        return time.monotonic() - self.t0 + self.offset
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        if self.finished:
+            yield
+            return
+        phase = [name, self._now(), None, self.depth]
+        self.phases.append(phase)
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if phase[2] is None:
+                phase[2] = self._now() - phase[1]
+
+    def mark(self, name):
+        if not self.finished:
+            self.phases.append([name, self._now(), 0.0, self.depth])
+
+    def as_dict(self):
+        return {
+            'total': self.total if self.finished else self._now(),
+            'phases': [
+                {'name': name, 'start': start, 'duration': duration,
+                 'depth': depth}
+                for name, start, duration, depth in self.phases
+                ],
+            }
+
+    def finish(self):
+        """Stop recording and write the record to report_path."""
+        if self.finished:
+            return
+        self.finished = True
+        self.total = self._now()
+        # Phases still running are cut off here.
+        for phase in self.phases:
+            if phase[2] is None:
+                phase[2] = self.total - phase[1]
+        if self.report_path is None:
+            return
+        try:
+            with open(self.report_path, 'w') as fp:
+                json.dump(self.as_dict(), fp, indent=4)
+        except OSError:
+            log.exception("writing startup timings to %s failed",
+                          self.report_path)
+        else:
+            log.debug("startup timings written to %s", self.report_path)
+
+    def report(self):
+        lines = ["{:<40} {:>9} {:>9}".format("phase", "start", "duration")]
+        for name, start, duration, depth in self.phases:
+            if duration is None:
+                duration = self._now() - start
+            lines.append("{:<40} {:>9.3f} {:>9.3f}".format(
+                "  " * depth + name, start, duration))
+        total = self.as_dict()['total']
+        lines.append("{:<40} {:>9} {:>9.3f}".format("total", "", total))
+        return "\n".join(lines)
+
+
+timer = StartupTimer()
@@ -0,0 +1,397 @@
+# Copyright 2017 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Make up machine configs for machines much bigger than a laptop.
+
+The configs are in the format probert produces (as in examples/), so
+they can be passed to --machine-config to see how the models and views
+cope with hundreds of disks and dozens of network interfaces.  Only the
+keys subiquity and probert look at are filled in.  The same arguments
+always produce the same config.
+"""
+
+import argparse
+import json
+import random
+import string
+import sys
+
+from subiquitycore.network_events import (
+    flapping_events,
+    write_network_events,
+    )
+
+DISK_KINDS = ('hdd', 'ssd', 'nvme')
+
+# The majors the sd driver uses, 16 disks to each.
+SD_MAJORS = [8] + list(range(65, 72)) + list(range(128, 136))
+NVME_MAJOR = 259
+DM_MAJOR = 252
+
+PARTITION_SIZE = 512 * 2**20
+
+
+def sd_name(index):
+    """Return the kernel's name for the index'th sd disk: sda, ..., sdaa."""
+    letters = ''
+    index += 1
+    while index > 0:
+        index, rem = divmod(index - 1, 26)
+        letters = string.ascii_lowercase[rem] + letters
+    return 'sd' + letters
+
+
+def _uevent(major, minor, name, devtype):
+    return "MAJOR={}\nMINOR={}\nDEVNAME={}\nDEVTYPE={}".format(
+        major, minor, name, devtype)
+
+
+def _block_device(name, devpath, devtype, major, minor, size, props):
+    data = {
+        'DEVNAME': '/dev/' + name,
+        'DEVPATH': devpath,
+        'DEVTYPE': devtype,
+        'MAJOR': str(major),
+        'MINOR': str(minor),
+        'SUBSYSTEM': 'block',
+        'attrs': {
+            'dev': '{}:{}'.format(major, minor),
+            'ro': '0',
+            'removable': '0',
+            'size': str(size),
+            'uevent': _uevent(major, minor, name, devtype),
+            },
+        }
+    data.update(props)
+    return data
+
+
+class _StorageBuilder:
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.storage = {}
+        self.sd_count = 0
+        self.nvme_count = 0
+        self.dm_count = 0
+
+    def _sd_numbers(self):
+        index = self.sd_count
+        self.sd_count += 1
+        major = SD_MAJORS[(index // 16) % len(SD_MAJORS)]
+        # Past 256 disks the kernel uses extended minors.
+        minor = (index % 16) * 16 + (index // 256) * 256
+        return sd_name(index), major, minor
+
+    def _size(self, kind):
+        if kind == 'hdd':
+            gigs = self.rng.choice([500, 1000, 2000, 4000, 8000])
+        else:
+            gigs = self.rng.choice([128, 256, 512, 1024, 2048])
+        return gigs * 10**9
+
+    def add_disk(self, kind, partitions, serial=None, host=None):
+        """Add a disk (and its partitions) and return its props."""
+        if serial is None:
+            serial = 'SYN{:08d}'.format(self.sd_count + self.nvme_count)
+        size = self._size(kind)
+        wwn = '0x5000c500{:08x}'.format(self.rng.getrandbits(32))
+        if kind == 'nvme':
+            controller = self.nvme_count
+            self.nvme_count += 1
+            name = 'nvme{}n1'.format(controller)
+            major, minor = NVME_MAJOR, controller * 16
+            devpath = (
+                '/devices/pci0000:00/0000:00:1d.0/0000:{:02x}:00.0/nvme/'
+                'nvme{}/{}'.format(controller + 1, controller, name))
+            props = {
+                'ID_MODEL': 'Synthetic NVMe SSD',
+                'ID_PATH': 'pci-0000:{:02x}:00.0-nvme-1'.format(
+                    controller + 1),
+                }
+            part_name = name + 'p{}'
+        else:
+            name, major, minor = self._sd_numbers()
+            if host is None:
+                host = self.sd_count - 1
+            devpath = (
+                '/devices/pci0000:00/0000:00:1f.2/ata{0}/host{0}/'
+                'target{0}:0:0/{0}:0:0:0/block/{1}'.format(host, name))
+            props = {
+                'ID_ATA_ROTATION_RATE_RPM': '7200' if kind == 'hdd' else '0',
+                'ID_BUS': 'ata',
+                'ID_MODEL': 'Synthetic_{}'.format(kind.upper()),
+                'ID_PATH': 'pci-0000:00:1f.2-ata-{}'.format(host),
+                }
+            part_name = name + '{}'
+        props.update({
+            'ID_SERIAL': serial,
+            'ID_SERIAL_SHORT': serial,
+            'ID_WWN': wwn,
+            'ID_TYPE': 'disk',
+            })
+        if partitions:
+            props['ID_PART_TABLE_TYPE'] = 'gpt'
+        self.storage['/dev/' + name] = _block_device(
+            name, devpath, 'disk', major, minor, size, props)
+        for number in range(1, partitions + 1):
+            pname = part_name.format(number)
+            pprops = dict(props)
+            pprops.update({
+                'ID_PART_ENTRY_DISK': '{}:{}'.format(major, minor),
+                'ID_PART_ENTRY_NUMBER': str(number),
+                'ID_PART_ENTRY_SIZE': str(PARTITION_SIZE // 512),
+                'ID_PART_ENTRY_SCHEME': 'gpt',
+                'ID_FS_TYPE': 'ext4',
+                })
+            pdata = _block_device(
+                pname, devpath + '/' + pname, 'partition', major,
+                minor + number, PARTITION_SIZE, pprops)
+            pdata['attrs']['partition'] = str(number)
+            self.storage['/dev/' + pname] = pdata
+        return self.storage['/dev/' + name]
+
+    def add_multipath(self, partitions):
+        """Add a LUN seen over two paths, and the dm device joining them."""
+        serial = 'MPATH{:08d}'.format(self.dm_count)
+        first = self.add_disk('hdd', partitions, serial=serial, host=100)
+        second = self.add_disk('hdd', partitions, serial=serial, host=101)
+        # Both paths lead to the same LUN so have the same size and WWN.
+        second['ID_WWN'] = first['ID_WWN']
+        second['attrs']['size'] = first['attrs']['size']
+        name = 'dm-{}'.format(self.dm_count)
+        self.storage['/dev/' + name] = _block_device(
+            name, '/devices/virtual/block/' + name, 'disk', DM_MAJOR,
+            self.dm_count, first['attrs']['size'], {
+                'DM_NAME': 'mpath{}'.format(self.dm_count),
+                'DM_UUID': 'mpath-{}'.format(first['ID_WWN']),
+                'ID_SERIAL': serial,
+                'ID_WWN': first['ID_WWN'],
+                })
+        self.dm_count += 1
+
+
+def _link(ifindex, name, type, devpath, address, extra_udev=None,
+          bond=None):
+    udev_data = {
+        'DEVPATH': devpath,
+        'IFINDEX': str(ifindex),
+        'INTERFACE': name,
+        'SUBSYSTEM': 'net',
+        'attrs': {
+            'address': address,
+            'carrier': '1',
+            'ifindex': str(ifindex),
+            'mtu': '1500',
+            'operstate': 'up',
+            'speed': '10000',
+            'type': '1',
+            'uevent': "INTERFACE={}\nIFINDEX={}".format(name, ifindex),
+            },
+        }
+    if extra_udev:
+        udev_data.update(extra_udev)
+    return {
+        'addresses': [],
+        'bond': bond or {
+            'is_master': False,
+            'is_slave': False,
+            'mode': None,
+            'slaves': [],
+            },
+        'bridge': {
+            'interfaces': [],
+            'is_bridge': False,
+            'is_port': False,
+            'options': {},
+            },
+        'netlink_data': {
+            'arptype': 1,
+            'family': 0,
+            'flags': 69699,
+            'ifindex': ifindex,
+            'name': name,
+            },
+        'type': type,
+        'udev_data': udev_data,
+        }
+
+
+def _network(nics, wlans, bonds, bond_members):
+    if bonds * bond_members > nics:
+        raise ValueError(
+            "{} bonds of {} members need more than {} nics".format(
+                bonds, bond_members, nics))
+    links = []
+    ifindex = 2
+    eth_names = []
+    for i in range(nics):
+        name = 'enp{}s0'.format(i + 1)
+        eth_names.append(name)
+        links.append(_link(
+            ifindex, name, 'eth',
+            '/devices/pci0000:00/0000:00:1c.0/0000:{:02x}:00.0/net/{}'.format(
+                i + 1, name),
+            '52:54:00:00:{:02x}:{:02x}'.format(i // 256, i % 256),
+            extra_udev={
+                'ID_MODEL_FROM_DATABASE': 'Synthetic Ethernet Controller',
+                'ID_NET_DRIVER': 'e1000e',
+                'ID_VENDOR_FROM_DATABASE': 'Synthetic Corporation',
+                }))
+        ifindex += 1
+    for i in range(wlans):
+        name = 'wlp{}s0'.format(i + 1)
+        link = _link(
+            ifindex, name, 'wlan',
+            '/devices/pci0000:00/0000:00:1c.1/0000:{:02x}:00.0/net/{}'.format(
+                i + 0x80, name),
+            '52:54:00:01:{:02x}:{:02x}'.format(i // 256, i % 256),
+            extra_udev={
+                'DEVTYPE': 'wlan',
+                'ID_NET_DRIVER': 'iwlwifi',
+                })
+        link['wlan'] = {
+            'scan_state': None,
+            'ssid': None,
+            'visible_ssids': [],
+            }
+        links.append(link)
+        ifindex += 1
+    for i in range(bonds):
+        name = 'bond{}'.format(i)
+        members = eth_names[i * bond_members:(i + 1) * bond_members]
+        for link in links:
+            if link['netlink_data']['name'] in members:
+                link['bond'] = {
+                    'is_master': False,
+                    'is_slave': True,
+                    'mode': None,
+                    'slaves': [],
+                    }
+        links.append(_link(
+            ifindex, name, 'bond', '/devices/virtual/net/' + name,
+            '52:54:00:02:00:{:02x}'.format(i % 256),
+            bond={
+                'is_master': True,
+                'is_slave': False,
+                'mode': 'active-backup',
+                'slaves': members,
+                }))
+        ifindex += 1
+    # The default route goes via the first nic not in a bond, or the
+    # first bond if every nic is in one.
+    routes = []
+    default = next(
+        (link for link in links if not link['bond']['is_slave']), None)
+    if default is not None:
+        default['addresses'] = [{
+            'address': '10.0.0.2/16',
+            'family': 2,
+            'scope': 'global',
+            'source': 'dhcp',
+            }]
+        routes.append({
+            'dst': 'default',
+            'family': 2,
+            'ifindex': default['netlink_data']['ifindex'],
+            'table': 254,
+            'type': 1,
+            })
+    return {'links': links, 'routes': routes}
+
+
+def generate_machine_config(disks=4, partitions=2, multipath=0, nics=2,
+                            wlans=0, bonds=0, bond_members=2, seed=0):
+    """Return a machine config for a made up machine.
+
+    The machine has disks disks (a mix of spinning disks, SATA SSDs and
+    NVMe drives, each with partitions partitions), multipath LUNs each
+    seen over two sd paths plus the dm device joining them, nics
+    ethernet interfaces, wlans wireless interfaces and bonds bonds made
+    of bond_members of the ethernet interfaces each.
+    """
+    rng = random.Random(seed)
+    storage = _StorageBuilder(rng)
+    for i in range(disks):
+        storage.add_disk(DISK_KINDS[i % len(DISK_KINDS)], partitions)
+    for i in range(multipath):
+        storage.add_multipath(partitions)
+    return {
+        'storage': storage.storage,
+        'network': _network(nics, wlans, bonds, bond_members),
+        }
+
+
+def parse_options(argv):
+    parser = argparse.ArgumentParser(
+        description='Write a probert machine config for a made up machine',
+        prog='subiquity-synthetic-machine')
+    parser.add_argument('--disks', type=int, default=4,
+                        help='number of disks (default: %(default)s)')
+    parser.add_argument('--partitions', type=int, default=2,
+                        help='partitions on each disk (default: '
+                             '%(default)s)')
+    parser.add_argument('--multipath', type=int, default=0,
+                        help='number of LUNs seen over two paths (default: '
+                             '%(default)s)')
+    parser.add_argument('--nics', type=int, default=2,
+                        help='number of ethernet interfaces (default: '
+                             '%(default)s)')
+    parser.add_argument('--wlans', type=int, default=0,
+                        help='number of wireless interfaces (default: '
+                             '%(default)s)')
+    parser.add_argument('--bonds', type=int, default=0,
+                        help='number of bonds (default: %(default)s)')
+    parser.add_argument('--bond-members', type=int, default=2,
+                        dest='bond_members',
+                        help='ethernet interfaces in each bond (default: '
+                             '%(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the disk sizes (default: '
+                             '%(default)s)')
+    parser.add_argument('--output', '-o', metavar='FILE',
+                        help='where to write the config (default: stdout)')
+    parser.add_argument('--network-events', metavar='FILE',
+                        dest='network_events',
+                        help='also write a recording of the ethernet '
+                             'interfaces flapping, for '
+                             '--replay-network-events')
+    parser.add_argument('--flaps', type=int, default=10,
+                        help='times each interface goes down and up in the '
+                             'recording (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_options(sys.argv[1:] if argv is None else argv)
+    try:
+        config = generate_machine_config(
+            disks=opts.disks, partitions=opts.partitions,
+            multipath=opts.multipath, nics=opts.nics, wlans=opts.wlans,
+            bonds=opts.bonds, bond_members=opts.bond_members, seed=opts.seed)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if opts.output is None:
+        json.dump(config, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(opts.output, 'w') as fp:
+            json.dump(config, fp, indent=1, sort_keys=True)
+    if opts.network_events is not None:
+        write_network_events(
+            opts.network_events,
+            flapping_events(config['network'], flaps=opts.flaps))
+    return 0
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from subiquitycore.controller import BaseController
+from subiquitycore.utils import arun_command
+
+
+class Controller(BaseController):
+
+    def cancel(self):
+        pass
+
+    def default(self):
+        pass
+
+
+class TestCoroutineHelpers(unittest.TestCase):
+
+    def setUp(self):
+        self.aio_loop = asyncio.new_event_loop()
+        self.addCleanup(self.aio_loop.close)
+        common = dict.fromkeys([
+            'ui', 'signal', 'opts', 'loop', 'prober', 'controllers',
+            'scheduler', 'dispatcher', 'base_model', 'answers', 'memory',
+            ])
+        common['aio_loop'] = self.aio_loop
+        self.controller = Controller(common)
+        self.finished = []
+
+    def run_until_done(self, task):
+        # Also give the done callbacks a chance to run.
+        try:
+            self.aio_loop.run_until_complete(task)
+        except BaseException:
+            pass
+        self.aio_loop.run_until_complete(asyncio.sleep(0))
+
+    def pipe(self):
+        r, w = os.pipe()
+        self.addCleanup(os.close, r)
+        self.addCleanup(os.close, w)
+        return r, w
+
+    def test_completion(self):
+        async def coro():
+            await self.controller.sleep(0)
+            return 42
+        task = self.controller.run_coroutine(coro(), self.finished.append)
+        self.run_until_done(task)
+        self.assertEqual(self.finished, [task])
+        self.assertEqual(task.result(), 42)
+
+    def test_exception_passed_to_callback(self):
+        async def coro():
+            raise ValueError("boom")
+        task = self.controller.run_coroutine(coro(), self.finished.append)
+        self.run_until_done(task)
+        self.assertEqual(self.finished, [task])
+        self.assertIsInstance(task.exception(), ValueError)
+
+    def test_exception_logged_without_callback(self):
+        async def coro():
+            raise ValueError("boom")
+        with self.assertLogs('subiquitycore.controller', 'ERROR') as cm:
+            task = self.controller.run_coroutine(coro())
+            self.run_until_done(task)
+        self.assertIn('ValueError: boom', cm.output[0])
+
+    def test_failing_callback_logged(self):
+        async def coro():
+            return 1
+        def callback(task):
+            raise ValueError("boom")
+        with self.assertLogs('subiquitycore.controller', 'ERROR') as cm:
+            task = self.controller.run_coroutine(coro(), callback)
+            self.run_until_done(task)
+        self.assertIn('ValueError: boom', cm.output[0])
+
+    def test_cancel(self):
+        started = []
+        async def coro():
+            started.append(True)
+            await self.controller.sleep(60)
+        task = self.controller.run_coroutine(coro(), self.finished.append)
+        self.aio_loop.run_until_complete(asyncio.sleep(0))
+        task.cancel()
+        self.run_until_done(task)
+        self.assertEqual(started, [True])
+        self.assertEqual(self.finished, [task])
+        self.assertTrue(task.cancelled())
+
+    def test_cancel_not_logged(self):
+        async def coro():
+            await self.controller.sleep(60)
+        task = self.controller.run_coroutine(coro())
+        task.cancel()
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('subiquitycore.controller', 'ERROR'):
+                self.run_until_done(task)
+
+    def test_wait_readable(self):
+        r, w = self.pipe()
+        fut = self.controller.wait_readable(r)
+        self.aio_loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(fut.done())
+        os.write(w, b'x')
+        self.aio_loop.run_until_complete(fut)
+        self.assertFalse(self.aio_loop.remove_reader(r))
+
+    def test_wait_readable_cancel(self):
+        r, w = self.pipe()
+        fut = self.controller.wait_readable(r)
+        fut.cancel()
+        self.aio_loop.run_until_complete(asyncio.sleep(0))
+        # The reader was removed, and becoming readable is harmless.
+        self.assertFalse(self.aio_loop.remove_reader(r))
+        os.write(w, b'x')
+        self.aio_loop.run_until_complete(asyncio.sleep(0))
+
+
+class TestArunCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.aio_loop = asyncio.new_event_loop()
+        self.addCleanup(self.aio_loop.close)
+
+    def run_command(self, *args, **kw):
+        return self.aio_loop.run_until_complete(arun_command(*args, **kw))
+
+    def test_output(self):
+        result = self.run_command(
+            ['sh', '-c', 'echo out; echo err >&2; exit 3'])
+        self.assertEqual(
+            result, dict(status=3, output='out\n', err='err\n'))
+
+    def test_shell(self):
+        result = self.run_command('echo $LC_ALL', shell=True)
+        self.assertEqual(result['status'], 0)
+        self.assertEqual(result['output'], 'C\n')
+
+    def test_missing_command(self):
+        result = self.run_command(['/nonexistent/command'])
+        self.assertEqual(result, dict(status=127, output='', err=''))
+
+    def test_cancel(self):
+        fd, pidfile = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, pidfile)
+        task = self.aio_loop.create_task(arun_command(
+            'echo $$ > {}; exec sleep 60'.format(pidfile), shell=True))
+        self.aio_loop.call_later(0.2, task.cancel)
+        with self.assertRaises(asyncio.CancelledError):
+            self.aio_loop.run_until_complete(task)
+        with open(pidfile) as fp:
+            pid = int(fp.read())
+        # The command was killed and reaped.
+        self.assertRaises(ProcessLookupError, os.kill, pid, 0)
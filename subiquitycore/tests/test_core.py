@@ -0,0 +1,90 @@
+import argparse
+import types
+import unittest
+
+
+def _importable(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+def make_controller_class(name, prewarm=False, probe_scopes=()):
+    return type(
+        name + 'Controller', (),
+        {'prewarm': prewarm, 'probe_scopes': probe_scopes})
+
+
+@unittest.skipUnless(_importable('urwid'), "urwid is not installed")
+class TestControllerRegistry(unittest.TestCase):
+
+    def setUp(self):
+        from subiquitycore.core import ControllerRegistry
+        self.made = []
+        self.registry = ControllerRegistry(self, ['Welcome', 'Network'])
+
+    def make_controller(self, name):
+        self.made.append(name)
+        return object()
+
+    def test_built_on_first_access(self):
+        self.assertNotIn('Network', self.registry)
+        self.assertEqual(self.made, [])
+        controller = self.registry['Network']
+        self.assertIn('Network', self.registry)
+        self.assertIs(self.registry['Network'], controller)
+        self.assertEqual(self.made, ['Network'])
+
+    def test_unknown_name(self):
+        with self.assertRaises(KeyError):
+            self.registry['Filesystem']
+        self.assertEqual(self.made, [])
+        self.assertNotIn('Filesystem', self.registry)
+
+
+@unittest.skipUnless(_importable('urwid'), "urwid is not installed")
+class TestApplicationControllers(unittest.TestCase):
+
+    def setUp(self):
+        from subiquitycore.core import Application, ControllerRegistry
+        self.made = []
+
+        class App(Application):
+            project = "test"
+            controllers = ['Welcome', 'Network', 'Identity', 'Progress']
+
+            def make_controller(app, name):
+                self.made.append(name)
+                return object()
+
+        # Application.__init__ starts probing, which these tests do
+        # not need.
+        self.app = App.__new__(App)
+        self.app.controllers_mod = types.SimpleNamespace(
+            WelcomeController=make_controller_class('Welcome'),
+            NetworkController=make_controller_class(
+                'Network', probe_scopes=('network',)),
+            IdentityController=make_controller_class(
+                'Identity', prewarm=True),
+            ProgressController=make_controller_class(
+                'Progress', prewarm=True, probe_scopes=('storage',)),
+            )
+        self.app.common = {
+            'controllers': ControllerRegistry(self.app, App.controllers),
+            }
+
+    def test_prewarm_in_order(self):
+        self.app.prewarm_controllers()
+        self.assertEqual(self.made, ['Identity', 'Progress'])
+        self.app.common['controllers']['Welcome']
+        self.assertEqual(self.made, ['Identity', 'Progress', 'Welcome'])
+
+    def test_probe_scopes(self):
+        opts = argparse.Namespace()
+        self.assertEqual(
+            self.app.probe_scopes(opts), {'network', 'storage'})
+        opts.probe_scopes = ['network']
+        self.assertEqual(self.app.probe_scopes(opts), ['network'])
+        self.assertEqual(self.made, [])
@@ -0,0 +1,40 @@
+import builtins
+import unittest
+from unittest import mock
+
+from subiquitycore import i18n
+
+
+class TestI18n(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(i18n.switch_language)
+
+    def test_catalogs_are_cached(self):
+        with mock.patch('gettext.translation') as translation:
+            i18n._translations.clear()
+            first = i18n.get_translation('subiquity', 'xx_XX')
+            second = i18n.get_translation('subiquity', 'xx_XX')
+        self.assertIs(first, second)
+        self.assertEqual(translation.call_count, 1)
+
+    def test_switch_language_does_not_load_catalog(self):
+        with mock.patch.object(i18n, 'get_translation') as get_translation:
+            i18n.switch_language('ru_RU')
+            self.assertEqual(get_translation.call_count, 0)
+            builtins._("Done")
+            builtins._("Save")
+            self.assertEqual(get_translation.call_count, 1)
+
+    def test_lazy_gettext(self):
+        message = i18n.lazy_gettext("Done")
+        self.assertEqual(str(message), "Done")
+        with mock.patch.dict('os.environ', {'FAKE_TRANSLATE': '1'}):
+            i18n.switch_language('ru_RU')
+        self.assertEqual(str(message), "_(Done)")
+
+    def test_star_import(self):
+        namespace = {}
+        exec('from subiquitycore.i18n import *', namespace)
+        del namespace['__builtins__']
+        self.assertEqual(sorted(namespace), sorted(i18n.__all__))
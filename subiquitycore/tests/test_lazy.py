@@ -0,0 +1,39 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+
+class TestLazyAttributes(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        pkg = os.path.join(tmpdir, 'lazypkg')
+        os.mkdir(pkg)
+        with open(os.path.join(pkg, '__init__.py'), 'w') as fp:
+            fp.write(
+                "from subiquitycore.lazy import lazy_attributes\n"
+                "lazy_attributes(__name__, {'Thing': '.things'})\n")
+        with open(os.path.join(pkg, 'things.py'), 'w') as fp:
+            fp.write("class Thing:\n    pass\n")
+        sys.path.insert(0, tmpdir)
+        self.addCleanup(sys.path.remove, tmpdir)
+        self.addCleanup(sys.modules.pop, 'lazypkg.things', None)
+        self.addCleanup(sys.modules.pop, 'lazypkg', None)
+
+    def test_imported_on_first_use(self):
+        import lazypkg
+        self.assertNotIn('lazypkg.things', sys.modules)
+        self.assertIn('Thing', dir(lazypkg))
+        from lazypkg import Thing
+        self.assertIs(Thing, sys.modules['lazypkg.things'].Thing)
+        self.assertIs(lazypkg.Thing, Thing)
+
+    def test_unknown_attribute(self):
+        import lazypkg
+        with self.assertRaises(AttributeError):
+            lazypkg.Nothing
+        with self.assertRaises(ImportError):
+            from lazypkg import Nothing  # NOQA
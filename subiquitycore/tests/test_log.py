@@ -0,0 +1,67 @@
+import logging
+import queue
+import unittest
+
+from subiquitycore.log import DeferredQueueHandler
+
+
+class TestDeferredQueueHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = queue.Queue()
+        self.logger = logging.Logger('test')
+        self.logger.addHandler(DeferredQueueHandler(self.queue))
+
+    def get(self):
+        return self.queue.get_nowait()
+
+    def test_not_formatted(self):
+        self.logger.warning("%s is %d", "x", 1)
+        record = self.get()
+        self.assertEqual(record.msg, "%s is %d")
+        self.assertEqual(record.args, ("x", 1))
+        self.assertEqual(record.getMessage(), "x is 1")
+
+    def test_mapping_args_not_formatted(self):
+        self.logger.warning("%(a)x", {'a': 255})
+        record = self.get()
+        self.assertEqual(record.args, {'a': 255})
+        self.assertEqual(record.getMessage(), "ff")
+
+    def test_mutable_arg_formatted_once(self):
+        class Counted(list):
+            calls = 0
+            def __str__(self):
+                Counted.calls += 1
+                return super().__str__()
+        data = Counted(['a'])
+        self.logger.warning("%s %d", data, 3)
+        data.append('b')
+        record = self.get()
+        self.assertEqual(record.msg, "['a'] 3")
+        self.assertIsNone(record.args)
+        self.assertEqual(record.getMessage(), "['a'] 3")
+        self.assertEqual(Counted.calls, 1)
+
+    def test_mutable_mapping_arg(self):
+        data = {'k': 'v'}
+        self.logger.warning("%(a)d %(b)r", {'a': 1, 'b': data})
+        data['k'] = 'changed'
+        self.assertEqual(self.get().getMessage(), "1 {'k': 'v'}")
+
+    def test_non_str_msg(self):
+        data = ['a']
+        self.logger.warning(data)
+        data.append('b')
+        self.assertEqual(self.get().getMessage(), "['a']")
+
+    def test_exc_info(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("failed")
+        record = self.get()
+        self.assertIsNone(record.exc_info)
+        self.assertIn("ValueError: boom", record.exc_text)
+        formatted = logging.Formatter().format(record)
+        self.assertTrue(formatted.startswith("failed\nTraceback"))
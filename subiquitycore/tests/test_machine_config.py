@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from subiquitycore.machine_config import (
+    load_machine_config,
+    MachineConfigError,
+    parse_machine_config,
+    snapshot_path,
+    )
+
+
+class TestMachineConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, name, content, mode='w'):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, mode) as fp:
+            fp.write(content)
+        return path
+
+    def test_json(self):
+        data = {'storage': {'/dev/sda': {'DEVTYPE': 'disk'}}}
+        path = self.write('m.json', json.dumps(data))
+        self.assertEqual(parse_machine_config(path), data)
+
+    def test_yaml(self):
+        path = self.write('m.yaml', 'storage:\n  /dev/sda: {DEVTYPE: disk}\n')
+        self.assertEqual(
+            parse_machine_config(path),
+            {'storage': {'/dev/sda': {'DEVTYPE': 'disk'}}})
+
+    def test_bad_encoding(self):
+        path = self.write('m.json', b'\xff\xfe{', 'wb')
+        self.assertRaises(MachineConfigError, parse_machine_config, path)
+
+    def test_bad_yaml(self):
+        for content in '{"storage": {bad', 'storage: [a\n  b: c\n', '\t- x':
+            with self.subTest(content=content):
+                path = self.write('m.yaml', content)
+                self.assertRaises(
+                    MachineConfigError, parse_machine_config, path)
+
+    def test_snapshot(self):
+        path = self.write('m.json', '{"storage": {}}')
+        self.assertEqual(load_machine_config(path, snapshot=True),
+                         {'storage': {}})
+        self.assertTrue(os.path.exists(snapshot_path(path)))
+        with mock.patch('subiquitycore.machine_config.parse_machine_config') \
+                as parse:
+            self.assertEqual(load_machine_config(path, snapshot=True),
+                             {'storage': {}})
+            self.assertEqual(parse.call_count, 0)
+
+    def test_stale_snapshot_is_ignored(self):
+        path = self.write('m.json', '{"storage": {}}')
+        load_machine_config(path, snapshot=True)
+        self.write('m.json', '{"network": {}, "storage": {}}')
+        self.assertEqual(load_machine_config(path, snapshot=True),
+                         {'network': {}, 'storage': {}})
+
+    def test_no_snapshot_by_default(self):
+        path = self.write('m.json', '{}')
+        load_machine_config(path)
+        self.assertFalse(os.path.exists(snapshot_path(path)))
@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from subiquitycore.memory import MemoryTracer
+
+
+class TestMemoryTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_snapshots(self):
+        tracer = MemoryTracer(self.tmpdir, top=5)
+        tracer.start()
+        self.addCleanup(tracer.stop)
+        first = tracer.snapshot('next-Welcome')
+        data = [bytearray(1024) for i in range(100)]  # NOQA
+        second = tracer.snapshot('next-Network')
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir)),
+            ['memory-001-next-Welcome.txt', 'memory-002-next-Network.txt'])
+        with open(first) as fp:
+            self.assertNotIn('changes since', fp.read())
+        with open(second) as fp:
+            report = fp.read()
+        self.assertIn('Top 5 changes since next-Welcome', report)
+        self.assertIn(__file__, report)
+
+    def test_not_tracing(self):
+        tracer = MemoryTracer(self.tmpdir)
+        self.assertIsNone(tracer.snapshot('exit'))
+        self.assertEqual(os.listdir(self.tmpdir), [])
@@ -0,0 +1,146 @@
+import os
+import select
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from subiquitycore.network_events import (
+    flapping_events,
+    load_network_events,
+    NetworkEventRecorder,
+    NetworkEventReplayObserver,
+    )
+from subiquitycore.synthetic_machine import generate_machine_config
+
+
+class FakeLink:
+
+    def __init__(self, data):
+        self.data = data
+        self.name = data.get('name') or data['netlink_data']['name']
+
+    @classmethod
+    def from_saved_data(cls, data):
+        return cls(data)
+
+    def serialize(self):
+        return dict(self.data)
+
+
+class Receiver:
+
+    def __init__(self):
+        self.calls = []
+
+    def new_link(self, ifindex, link):
+        self.calls.append(('new_link', ifindex, link.name))
+
+    def del_link(self, ifindex):
+        self.calls.append(('del_link', ifindex))
+
+    def update_link(self, ifindex):
+        self.calls.append(('update_link', ifindex))
+
+    def route_change(self, action, data):
+        self.calls.append(('route_change', action, data))
+
+
+class FakeObserver:
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self.link = FakeLink({'name': 'eth0'})
+
+    def start(self):
+        self.receiver.new_link(2, self.link)
+        self.receiver.route_change('NEW', {'dst': 'default'})
+        return [7]
+
+    def data_ready(self, fd):
+        self.link.data = {'name': 'eth1'}
+        self.receiver.update_link(2)
+        self.receiver.del_link(2)
+
+
+class TestNetworkEvents(unittest.TestCase):
+
+    def setUp(self):
+        network_module = types.ModuleType('probert.network')
+        network_module.Link = FakeLink
+        patcher = mock.patch.dict(sys.modules, {
+            'probert': types.ModuleType('probert'),
+            'probert.network': network_module,
+            })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'events.jsonl')
+
+    def replay(self, events, receiver):
+        observer = NetworkEventReplayObserver(events, receiver, speed=0)
+        fds = observer.start()
+        while fds and observer.delivered < len(observer.events):
+            select.select(fds, [], [], 5)
+            observer.data_ready(fds[0])
+        return observer
+
+    def test_record_and_replay(self):
+        recorded = Receiver()
+        recorder = NetworkEventRecorder(self.path, recorded, FakeObserver)
+        self.addCleanup(recorder.close)
+        self.assertEqual(recorder.start(), [7])
+        recorder.data_ready(7)
+        events = load_network_events(self.path)
+        self.assertEqual(
+            [e['event'] for e in events],
+            ['new_link', 'route_change', 'started', 'update_link',
+             'del_link'])
+        self.assertEqual(events[3]['link'], {'name': 'eth1'})
+
+        replayed = Receiver()
+        observer = NetworkEventReplayObserver(events, replayed, speed=0)
+        fds = observer.start()
+        # The initial dump is delivered by start().
+        self.assertEqual(replayed.calls, recorded.calls[:2])
+        link = observer.links[2]
+        while observer.delivered < len(observer.events):
+            select.select(fds, [], [], 5)
+            observer.data_ready(fds[0])
+        self.assertEqual(replayed.calls, recorded.calls)
+        # The link the receiver was given was updated in place.
+        self.assertEqual(link.name, 'eth1')
+
+    def test_close(self):
+        recorded = Receiver()
+        recorder = NetworkEventRecorder(self.path, recorded, FakeObserver)
+        recorder.start()
+        recorder.close()
+        self.assertTrue(recorder.fp.closed)
+        # Later events still reach the receiver but are not recorded.
+        recorder.data_ready(7)
+        recorder.close()
+        self.assertEqual(len(recorded.calls), 4)
+        self.assertEqual(
+            [e['event'] for e in load_network_events(self.path)],
+            ['new_link', 'route_change', 'started'])
+
+    def test_closed_at_exit(self):
+        with mock.patch('subiquitycore.network_events.atexit') as m:
+            recorder = NetworkEventRecorder(
+                self.path, Receiver(), FakeObserver)
+            m.register.assert_called_once_with(recorder.close)
+            recorder.close()
+            m.unregister.assert_called_once_with(recorder.close)
+
+    def test_flapping(self):
+        network = generate_machine_config(nics=4, wlans=1)['network']
+        events = flapping_events(network, flaps=3)
+        receiver = Receiver()
+        observer = self.replay(events, receiver)
+        updates = [c for c in receiver.calls if c[0] == 'update_link']
+        self.assertEqual(len(updates), 4 * 3 * 2)
+        last = observer.links[updates[-1][1]].data
+        self.assertEqual(last['udev_data']['attrs']['carrier'], '1')
@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+from subiquitycore.parallel_probe import (
+    FAILED,
+    probe_devices,
+    TIMED_OUT,
+    )
+
+
+class TestProbeDevices(unittest.TestCase):
+
+    def test_results(self):
+        devices = [('/dev/sd' + c, c) for c in 'abcdefghij']
+        results, timings, unprobed = probe_devices(
+            devices, str.upper, workers=3)
+        self.assertEqual(results, {name: c.upper() for name, c in devices})
+        self.assertEqual(sorted(timings), sorted(results))
+        self.assertEqual(unprobed, {})
+
+    def test_no_devices(self):
+        self.assertEqual(probe_devices([], str.upper), ({}, {}, {}))
+
+    def test_failure(self):
+        def probe(device):
+            if device == 'b':
+                raise OSError("no")
+            return device
+        with self.assertLogs('subiquitycore.parallel_probe'):
+            results, timings, unprobed = probe_devices(
+                [('a', 'a'), ('b', 'b')], probe)
+        self.assertEqual(results, {'a': 'a'})
+        self.assertEqual(unprobed, {'b': FAILED})
+
+    def test_hung_device(self):
+        # With a single worker, the devices after the hung one can only
+        # be probed if the hung worker is replaced.
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def probe(device):
+            if device == 'hung':
+                release.wait()
+            return device
+        devices = [('a', 'a'), ('hung', 'hung'), ('b', 'b'), ('c', 'c')]
+        with self.assertLogs('subiquitycore.parallel_probe', 'WARNING'):
+            results, timings, unprobed = probe_devices(
+                devices, probe, workers=1, timeout=0.1)
+        self.assertEqual(results, {'a': 'a', 'b': 'b', 'c': 'c'})
+        self.assertEqual(unprobed, {'hung': TIMED_OUT})
+        self.assertGreaterEqual(timings['hung'], 0.1)
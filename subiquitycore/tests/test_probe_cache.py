@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from subiquitycore.probe_cache import (
+    block_fingerprint,
+    network_fingerprint,
+    ProbeCache,
+    )
+
+
+class TestProbeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'run', 'probe-cache.json')
+
+    def test_roundtrip(self):
+        data = {'/dev/sda': {'DEVTYPE': 'disk'}}
+        fingerprints = {'/dev/sda': ['8:0', '100', 1]}
+        ProbeCache(self.path, 'boot-1').put_items(
+            'storage', fingerprints, data)
+        cache = ProbeCache(self.path, 'boot-1')
+        self.assertEqual(cache.get_items('storage', fingerprints), data)
+        self.assertEqual(cache.get_items('network', fingerprints), {})
+
+    def test_only_changed_items_are_stale(self):
+        ProbeCache(self.path, 'boot-1').put_items(
+            'storage', {'/dev/sda': 1, '/dev/sdb': 1},
+            {'/dev/sda': 'a', '/dev/sdb': 'b'})
+        cache = ProbeCache(self.path, 'boot-1')
+        self.assertEqual(
+            cache.get_items(
+                'storage', {'/dev/sda': 1, '/dev/sdb': 2, '/dev/sdc': 1}),
+            {'/dev/sda': 'a'})
+
+    def test_other_boot(self):
+        ProbeCache(self.path, 'boot-1').put_items('storage', {'a': 1}, {'a': 2})
+        cache = ProbeCache(self.path, 'boot-2')
+        self.assertEqual(cache.get_items('storage', {'a': 1}), {})
+
+    def test_put_keeps_other_sections(self):
+        ProbeCache(self.path, 'boot-1').put_items('storage', {'a': 1}, {'a': 2})
+        ProbeCache(self.path, 'boot-1').put_items('network', {'1': 1}, {'1': 3})
+        cache = ProbeCache(self.path, 'boot-1')
+        self.assertEqual(cache.get_items('storage', {'a': 1}), {'a': 2})
+        self.assertEqual(cache.get_items('network', {'1': 1}), {'1': 3})
+
+    def test_corrupt(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as fp:
+            fp.write('{')
+        cache = ProbeCache(self.path, 'boot-1')
+        with self.assertLogs('subiquitycore.probe_cache'):
+            self.assertEqual(cache.get_items('storage', {'a': 1}), {})
+
+    def test_unserializable(self):
+        cache = ProbeCache(self.path, 'boot-1')
+        with self.assertLogs('subiquitycore.probe_cache'):
+            cache.put_items('storage', {'a': 1}, {'a': object()})
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), [])
+
+
+class TestBlockFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.sysfs = os.path.join(self.tmpdir, 'sys')
+        self.udev = os.path.join(self.tmpdir, 'udev')
+        os.makedirs(self.udev)
+
+    def add_device(self, name, dev, size):
+        os.makedirs(os.path.join(self.sysfs, name))
+        for attr, value in ('dev', dev), ('size', size):
+            with open(os.path.join(self.sysfs, name, attr), 'w') as fp:
+                fp.write(value + '\n')
+        open(os.path.join(self.udev, 'b' + dev), 'w').close()
+
+    def fingerprint(self):
+        # Round trip through JSON as the cache does.
+        return json.loads(json.dumps(block_fingerprint(self.sysfs, self.udev)))
+
+    def test_changes(self):
+        self.add_device('sda', '8:0', '100')
+        first = self.fingerprint()
+        self.assertEqual(first, self.fingerprint())
+        with open(os.path.join(self.sysfs, 'sda', 'size'), 'w') as fp:
+            fp.write('200\n')
+        second = self.fingerprint()
+        self.assertNotEqual(first, second)
+        self.add_device('sdb', '8:16', '100')
+        third = self.fingerprint()
+        self.assertEqual(second['/dev/sda'], third['/dev/sda'])
+        self.assertEqual(sorted(third), ['/dev/sda', '/dev/sdb'])
+
+    def test_device_path(self):
+        self.add_device('cciss!c0d0', '104:0', '100')
+        self.assertEqual(list(self.fingerprint()), ['/dev/cciss/c0d0'])
+
+    def test_udev_update(self):
+        self.add_device('sda', '8:0', '100')
+        first = self.fingerprint()
+        st = os.stat(os.path.join(self.udev, 'b8:0'))
+        os.utime(os.path.join(self.udev, 'b8:0'),
+                 ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        self.assertNotEqual(first, self.fingerprint())
+
+    def test_no_sysfs(self):
+        self.assertIsNone(block_fingerprint(self.sysfs, self.udev))
+
+
+class TestNetworkFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.sysfs = os.path.join(self.tmpdir, 'net')
+        self.udev = os.path.join(self.tmpdir, 'udev')
+        os.makedirs(self.udev)
+
+    def add_link(self, name, ifindex, address):
+        os.makedirs(os.path.join(self.sysfs, name))
+        for attr, value in ('ifindex', ifindex), ('address', address):
+            with open(os.path.join(self.sysfs, name, attr), 'w') as fp:
+                fp.write(value + '\n')
+        open(os.path.join(self.udev, 'n' + ifindex), 'w').close()
+
+    def test_rename(self):
+        self.add_link('eth0', '2', '52:54:00:00:00:01')
+        self.add_link('lo', '1', '00:00:00:00:00:00')
+        first = network_fingerprint(self.sysfs, self.udev)
+        self.assertEqual(sorted(first), ['1', '2'])
+        os.rename(
+            os.path.join(self.sysfs, 'eth0'), os.path.join(self.sysfs, 'ens3'))
+        second = network_fingerprint(self.sysfs, self.udev)
+        self.assertEqual(first['1'], second['1'])
+        self.assertNotEqual(first['2'], second['2'])
@@ -0,0 +1,295 @@
+import argparse
+import concurrent.futures
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from subiquitycore.prober import (
+    BlockDeviceObserver,
+    block_device_data,
+    CachingUdevContext,
+    expand_scopes,
+    Prober,
+    ProberException,
+    )
+
+
+class FakeAttributes:
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.available_attributes = list(attrs)
+
+    def asstring(self, name):
+        value = self.attrs[name]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+
+class FakeDevice(dict):
+
+    def __init__(self, device_node, properties, attrs):
+        super().__init__(properties)
+        self.device_node = device_node
+        self.properties = properties
+        self.attributes = FakeAttributes(attrs)
+
+
+class Receiver:
+
+    def __init__(self):
+        self.calls = []
+
+    def block_device_changed(self, path, data):
+        self.calls.append(('changed', path, data))
+
+    def block_device_removed(self, path):
+        self.calls.append(('removed', path))
+
+
+class TestBlockDeviceObserver(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = {'/dev/sda': {'MAJOR': '8'}}
+        self.receiver = Receiver()
+        self.observer = BlockDeviceObserver(self.storage, self.receiver)
+
+    def test_add(self):
+        device = FakeDevice(
+            '/dev/sdb', {'MAJOR': '8', 'DEVTYPE': 'disk'},
+            {'size': '2048', 'ro': '0', 'bad': UnicodeDecodeError(
+                'utf-8', b'\xff', 0, 1, 'invalid start byte')})
+        self.observer.handle_event('add', device)
+        expected = {
+            'MAJOR': '8',
+            'DEVTYPE': 'disk',
+            'attrs': {'size': str(2048 * 512), 'ro': '0'},
+            }
+        self.assertEqual(self.storage['/dev/sdb'], expected)
+        self.assertEqual(
+            self.receiver.calls, [('changed', '/dev/sdb', expected)])
+
+    def test_remove(self):
+        device = FakeDevice('/dev/sda', {'MAJOR': '8'}, {})
+        self.observer.handle_event('remove', device)
+        self.assertNotIn('/dev/sda', self.storage)
+        self.assertEqual(self.receiver.calls, [('removed', '/dev/sda')])
+
+    def test_loop_devices_ignored(self):
+        device = FakeDevice('/dev/loop0', {'MAJOR': '7'}, {'size': '8'})
+        self.observer.handle_event('add', device)
+        self.assertNotIn('/dev/loop0', self.storage)
+        self.assertEqual(self.receiver.calls, [])
+
+
+class FakeExecutor:
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func):
+        self.submitted.append(func)
+
+
+class TestProbeScopes(unittest.TestCase):
+
+    def setUp(self):
+        self.prober = Prober(argparse.Namespace(machine_config=None))
+        self.executor = FakeExecutor()
+
+    def test_expand(self):
+        self.assertEqual(
+            expand_scopes(['storage.full', 'network.wlan']),
+            {'storage.full', 'storage.block-only',
+             'network.links', 'network.wlan'})
+
+    def test_unknown_scope(self):
+        with self.assertRaises(ProberException):
+            expand_scopes(['storage.everything'])
+
+    def test_network_only(self):
+        self.prober.start_probing(self.executor, ['network.links'])
+        self.assertEqual(
+            self.executor.submitted, [self.prober._start_network_observer])
+        self.assertIsNone(self.prober.storage_future)
+
+    def test_storage_only(self):
+        self.prober.start_probing(self.executor, ['storage.block-only'])
+        self.assertEqual(
+            self.executor.submitted, [self.prober._watch_and_probe_storage])
+        self.assertIsNone(self.prober.network_future)
+
+    def test_default_is_everything(self):
+        self.prober.start_probing(self.executor)
+        self.assertEqual(len(self.executor.submitted), 2)
+        self.assertIsNone(self.prober._storage_attrs())
+
+    def test_block_only_reads_fewer_attrs(self):
+        self.prober.start_probing(self.executor, ['storage.block-only'])
+        device = FakeDevice(
+            '/dev/sda', {'MAJOR': '8'},
+            {'size': '2', 'ro': '0', 'stat': OSError("hung")})
+        self.assertEqual(
+            block_device_data(device, self.prober._storage_attrs()),
+            {'MAJOR': '8', 'attrs': {'size': '1024', 'ro': '0'}})
+
+    def test_full_storage_when_unscoped(self):
+        # Storage that is probed on demand, without a storage scope
+        # having been asked for, is probed in full.
+        self.prober.start_probing(self.executor, ['network.links'])
+        self.assertIsNone(self.prober._storage_attrs())
+
+
+class ImmediateExecutor:
+
+    def submit(self, func):
+        fut = concurrent.futures.Future()
+        fut.set_result(func())
+        return fut
+
+
+class TestEarlyBlockObserver(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            BlockDeviceObserver, 'start', return_value=[42])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.prober = Prober(argparse.Namespace(machine_config=None))
+        self.prober._probe_storage = lambda: {'/dev/sda': {'MAJOR': '8'}}
+
+    def test_events_before_subscribing(self):
+        self.prober.start_probing(
+            ImmediateExecutor(), ['storage.block-only'])
+        self.assertEqual(self.prober.block_fds, [42])
+        device = FakeDevice('/dev/sdb', {'MAJOR': '8'}, {'size': '1'})
+        self.prober.block_observer.handle_event('add', device)
+        self.assertIn('/dev/sdb', self.prober.get_storage())
+        receiver = Receiver()
+        observer, fds = self.prober.probe_storage_events(receiver)
+        self.assertIs(observer, self.prober.block_observer)
+        self.assertEqual(fds, [])
+        self.assertEqual(
+            [call[:2] for call in receiver.calls], [('changed', '/dev/sdb')])
+        self.prober.block_observer.handle_event(
+            'remove', FakeDevice('/dev/sda', {'MAJOR': '8'}, {}))
+        self.assertEqual(receiver.calls[-1], ('removed', '/dev/sda'))
+
+
+class TestProbeCacheUse(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.opts = argparse.Namespace(
+            machine_config=None,
+            probe_cache=os.path.join(tmpdir, 'probe-cache.json'))
+
+    def probe(self, fingerprints):
+        prober = Prober(self.opts)
+        probed = []
+
+        def probe_block_devices(cached):
+            storage = {}
+            for path in fingerprints:
+                if path in cached:
+                    storage[path] = cached[path]
+                else:
+                    probed.append(path)
+                    storage[path] = {'attrs': {'size': path}}
+            return storage
+
+        prober._probe_block_devices = probe_block_devices
+        with mock.patch('subiquitycore.prober.block_fingerprint',
+                        return_value=fingerprints):
+            storage = prober.get_storage()
+        return storage, probed
+
+    def test_only_changed_devices_probed(self):
+        storage, probed = self.probe({'/dev/sda': [1], '/dev/sdb': [1]})
+        self.assertEqual(probed, ['/dev/sda', '/dev/sdb'])
+        new_storage, probed = self.probe({'/dev/sda': [1], '/dev/sdb': [2]})
+        self.assertEqual(probed, ['/dev/sdb'])
+        self.assertEqual(new_storage, storage)
+
+
+class FakeUdevContext:
+
+    def __init__(self):
+        self.lookups = []
+
+    def list_devices(self, **kw):
+        self.lookups.append(kw)
+        return [FakeDevice(
+            None, {'IFINDEX': kw['IFINDEX'], 'INTERFACE': 'eth0'},
+            {'address': b'52:54:00:00:00:01'})]
+
+
+class TestCachingUdevContext(unittest.TestCase):
+
+    def test_cached_lookups(self):
+        context = FakeUdevContext()
+        items = {}
+        [device] = CachingUdevContext(context, items).list_devices(
+            IFINDEX='2')
+        self.assertEqual(dict(device), {'IFINDEX': '2', 'INTERFACE': 'eth0'})
+        self.assertEqual(
+            device.attributes.get('address'), '52:54:00:00:00:01')
+        self.assertEqual(list(items), ['2'])
+        context = FakeUdevContext()
+        [cached] = CachingUdevContext(context, items).list_devices(
+            IFINDEX='2')
+        self.assertEqual(context.lookups, [])
+        self.assertEqual(dict(cached), dict(device))
+        self.assertEqual(
+            list(cached.attributes.available_attributes), ['address'])
+
+
+class FakeStorageInfo:
+
+    def __init__(self, probe_data):
+        self.probe_data = probe_data
+
+
+class TestGetStorageInfo(unittest.TestCase):
+
+    def setUp(self):
+        storage_module = types.ModuleType('probert.storage')
+        storage_module.StorageInfo = FakeStorageInfo
+        patcher = mock.patch.dict(sys.modules, {
+            'probert': types.ModuleType('probert'),
+            'probert.storage': storage_module,
+            })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        opts = argparse.Namespace(machine_config=None)
+        self.prober = Prober(opts)
+        self.prober.probe_data['storage'] = {
+            '/dev/sda': {'MAJOR': '8'},
+            '/dev/sdb': {'MAJOR': '8'},
+            }
+
+    def test_memoized(self):
+        info = self.prober.get_storage_info('/dev/sda')
+        self.assertEqual(info.probe_data, {'/dev/sda': {'MAJOR': '8'}})
+        self.assertIs(self.prober.get_storage_info('/dev/sda'), info)
+        self.assertIsNot(self.prober.get_storage_info('/dev/sdb'), info)
+
+    def test_invalidated_when_data_changes(self):
+        info = self.prober.get_storage_info('/dev/sda')
+        observer = BlockDeviceObserver(
+            self.prober.probe_data['storage'], Receiver())
+        observer.handle_event(
+            'change', FakeDevice('/dev/sda', {'MAJOR': '8'}, {'size': '1'}))
+        new_info = self.prober.get_storage_info('/dev/sda')
+        self.assertIsNot(new_info, info)
+        self.assertEqual(new_info.probe_data['/dev/sda']['attrs']['size'],
+                         '512')
@@ -0,0 +1,65 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from subiquitycore.profiler import (
+    collapse_stack,
+    parse_interval,
+    SamplingProfiler,
+    )
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_collapse_stack(self):
+        stack = collapse_stack(sys._getframe())
+        self.assertTrue(stack.endswith(
+            '{}:test_collapse_stack'.format(__name__)))
+
+    def test_sections(self):
+        profiler = SamplingProfiler(self.tmpdir, interval=0.001)
+        profiler.start()
+        busy(0.1)
+        profiler.set_section('Network')
+        busy(0.1)
+        profiler.stop()
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir)),
+            ['profile-Network.folded', 'profile-startup.folded'])
+        with open(os.path.join(self.tmpdir, 'profile-Network.folded')) as fp:
+            lines = fp.read().splitlines()
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn('{}:busy'.format(__name__), stack)
+        self.assertGreater(int(count), 0)
+
+    def test_stop_without_start(self):
+        SamplingProfiler(self.tmpdir).stop()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval('20'), 0.02)
+        self.assertEqual(parse_interval('0.5'), 0.0005)
+        for value in '0', '-5', 'nan', 'fast':
+            with self.subTest(value=value):
+                self.assertRaises(
+                    argparse.ArgumentTypeError, parse_interval, value)
+
+    def test_interval_must_be_positive(self):
+        for interval in 0, -0.01:
+            with self.subTest(interval=interval):
+                self.assertRaises(
+                    ValueError, SamplingProfiler, self.tmpdir, interval)
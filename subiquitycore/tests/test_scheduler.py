@@ -0,0 +1,116 @@
+from concurrent import futures
+import os
+import threading
+import unittest
+
+from subiquitycore.scheduler import (
+    CompletionDispatcher,
+    DEFAULT_LANES,
+    parse_lane_spec,
+    Scheduler,
+    SchedulerError,
+    )
+
+
+class TestParseLaneSpec(unittest.TestCase):
+
+    def test_defaults(self):
+        self.assertEqual(parse_lane_spec([]), DEFAULT_LANES)
+
+    def test_override(self):
+        lanes = parse_lane_spec(['probe=4', 'extra=1'])
+        self.assertEqual(lanes['probe'], 4)
+        self.assertEqual(lanes['extra'], 1)
+        self.assertEqual(lanes['install'], DEFAULT_LANES['install'])
+
+    def test_errors(self):
+        for spec in 'probe', 'probe=', '=2', 'probe=x', 'probe=0':
+            with self.subTest(spec=spec):
+                self.assertRaises(SchedulerError, parse_lane_spec, [spec])
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler({'install': 1, 'ui': 1})
+        self.addCleanup(self.scheduler.shutdown)
+
+    def test_lanes_are_independent(self):
+        # A blocked install lane must not stop the ui lane.
+        release = threading.Event()
+        blocked = self.scheduler.submit('install', release.wait)
+        fut = self.scheduler.submit('ui', lambda: 42)
+        self.assertEqual(fut.result(timeout=5), 42)
+        self.assertFalse(blocked.done())
+        release.set()
+        blocked.result(timeout=5)
+
+    def test_stats(self):
+        self.scheduler.submit('ui', lambda: None).result(timeout=5)
+        stats = self.scheduler.stats()['ui']
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['running'], 0)
+        self.assertGreaterEqual(stats['run_time'], 0)
+
+    def test_thread_names(self):
+        fut = self.scheduler.submit(
+            'install', lambda: threading.current_thread().name)
+        self.assertEqual(fut.result(timeout=5), 'lane-install')
+
+    def test_submit_after_shutdown(self):
+        self.scheduler.shutdown()
+        self.assertRaises(
+            RuntimeError, self.scheduler.submit, 'ui', lambda: None)
+        self.assertEqual(self.scheduler.stats()['ui']['queued'], 0)
+
+    def test_unknown_lane(self):
+        self.assertRaises(
+            SchedulerError, self.scheduler.submit, 'nope', lambda: None)
+
+
+class FakeLoop:
+    def __init__(self):
+        self.watched = []
+
+    def watch_pipe(self, callback):
+        r, w = os.pipe()
+        self.watched.append((r, callback))
+        return w
+
+    def run_once(self):
+        for r, callback in self.watched:
+            callback(os.read(r, 4096))
+
+
+class TestCompletionDispatcher(unittest.TestCase):
+
+    def test_batches_completions(self):
+        loop = FakeLoop()
+        dispatcher = CompletionDispatcher(loop)
+        results = []
+        futs = [futures.Future() for i in range(3)]
+        for fut in futs:
+            dispatcher.add(fut, lambda fut: results.append(fut.result()))
+        for i, fut in enumerate(futs):
+            fut.set_result(i)
+        self.assertEqual(len(loop.watched), 1)
+        self.assertEqual(results, [])
+        r, callback = loop.watched[0]
+        # Three completions, but only one wakeup.
+        self.assertEqual(os.read(r, 4096), b'x')
+        callback(b'x')
+        self.assertEqual(results, [0, 1, 2])
+
+    def test_failing_callback_does_not_stop_others(self):
+        loop = FakeLoop()
+        dispatcher = CompletionDispatcher(loop)
+        results = []
+        bad, good = futures.Future(), futures.Future()
+        dispatcher.add(bad, lambda fut: 1/0)
+        dispatcher.add(good, lambda fut: results.append(fut.result()))
+        bad.set_result(None)
+        good.set_result('ok')
+        with self.assertLogs('subiquitycore.scheduler', 'ERROR'):
+            loop.run_once()
+        self.assertEqual(results, ['ok'])
@@ -0,0 +1,60 @@
+import unittest
+
+from subiquitycore.signals import Signal, SignalException
+
+
+class TestSignal(unittest.TestCase):
+
+    def setUp(self):
+        self.signal = Signal()
+        self.calls = []
+
+    def connect(self, *names):
+        self.signal.connect_signals([
+            (name, lambda *args, name=name: self.calls.append((name, args)))
+            for name in names])
+
+    def test_connect_and_emit(self):
+        self.connect('next-screen')
+        self.signal.emit_signal('next-screen', 1)
+        self.assertEqual(self.calls, [('next-screen', (1,))])
+
+    def test_connect_requires_list(self):
+        self.assertRaises(
+            SignalException, self.signal.connect_signals, ('a', print))
+
+    def test_instances_are_independent(self):
+        self.connect('menu:a')
+        self.assertNotIn('menu:a', Signal().known_signals)
+
+    def test_menu_stack_trims_on_revisit(self):
+        self.connect('menu:a', 'menu:a:b', 'menu:a:b:c')
+        for name in 'menu:a', 'menu:a:b', 'menu:a:b:c':
+            self.signal.emit_signal(name)
+        self.signal.emit_signal('menu:a:b')
+        self.assertEqual(
+            [name for name, *_ in self.signal.signal_stack],
+            ['menu:a', 'menu:a:b'])
+        self.signal.emit_signal('menu:a:b:c')
+        self.assertEqual(len(self.signal.signal_stack), 3)
+
+    def test_prev_signal(self):
+        self.connect('menu:a', 'menu:a:b')
+        self.signal.emit_signal('menu:a', 'x')
+        self.signal.emit_signal('menu:a:b')
+        del self.calls[:]
+        self.signal.prev_signal()
+        self.assertEqual(self.calls, [('menu:a', ('x',))])
+        self.assertEqual(
+            [name for name, *_ in self.signal.signal_stack], ['menu:a'])
+
+    def test_stats(self):
+        self.signal = Signal(stats=True)
+        self.connect('refresh')
+        self.signal.emit_signal('refresh')
+        self.signal.emit_signal('refresh')
+        self.assertEqual(self.signal.emit_counts, {'refresh': 2})
+        [(calls, seconds)] = self.signal.handler_times.values()
+        self.assertEqual(calls, 2)
+        with self.assertLogs('subiquity.signals', 'DEBUG'):
+            self.signal.dump_stats()
@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from subiquitycore import startup
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStartupTimer(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        for target, kw in [
+                ('subiquitycore.startup.time.monotonic',
+                 dict(new=self.clock)),
+                ('subiquitycore.startup._process_age',
+                 dict(return_value=1.0)),
+                ]:
+            patcher = mock.patch(target, **kw)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.timer = startup.StartupTimer()
+
+    def phases(self):
+        return [
+            (p['name'], p['start'], p['duration'], p['depth'])
+            for p in self.timer.as_dict()['phases']
+            ]
+
+    def test_nesting(self):
+        with self.timer.timed("outer"):
+            self.clock.now += 1
+            with self.timer.timed("inner"):
+                self.clock.now += 2
+            self.timer.mark("mark")
+            self.clock.now += 1
+        with self.timer.timed("after"):
+            self.clock.now += 1
+        self.assertEqual(self.phases(), [
+            ("interpreter start", 0.0, 1.0, 0),
+            ("outer", 1.0, 4.0, 0),
+            ("inner", 2.0, 2.0, 1),
+            ("mark", 4.0, 0.0, 1),
+            ("after", 5.0, 1.0, 0),
+            ])
+
+    def test_finish_freezes(self):
+        with self.timer.timed("running"):
+            self.clock.now += 2
+            with self.timer.timed("first frame"):
+                self.clock.now += 0.5
+            self.timer.finish()
+            self.clock.now += 1
+        with self.timer.timed("FilesystemController.__init__"):
+            self.clock.now += 1
+        self.timer.mark("late")
+        self.assertEqual(self.phases(), [
+            ("interpreter start", 0.0, 1.0, 0),
+            ("running", 1.0, 2.5, 0),
+            ("first frame", 3.0, 0.5, 1),
+            ])
+        self.assertEqual(self.timer.as_dict()['total'], 3.5)
+
+    def test_report(self):
+        with self.timer.timed("imports"):
+            with self.timer.timed("urwid"):
+                self.clock.now += 0.25
+        self.timer.finish()
+        self.assertEqual(self.timer.report().splitlines(), [
+            "phase                                        start  duration",
+            "interpreter start                            0.000     1.000",
+            "imports                                      1.000     0.250",
+            "  urwid                                      1.000     0.250",
+            "total" + " " * 50 + "1.250",
+            ])
+
+    def test_report_written_once(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.timer.report_path = os.path.join(tmpdir, 'timings.json')
+        with self.timer.timed("first frame"):
+            self.clock.now += 0.5
+        self.timer.finish()
+        os.remove(self.timer.report_path)
+        self.timer.finish()
+        self.assertFalse(os.path.exists(self.timer.report_path))
+        self.timer.report_path = os.path.join(tmpdir, 'again.json')
+        self.timer.finish()
+        self.assertFalse(os.path.exists(self.timer.report_path))
+
+    def test_report_json(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.timer.report_path = os.path.join(tmpdir, 'timings.json')
+        with self.timer.timed("first frame"):
+            self.clock.now += 0.5
+        self.timer.finish()
+        with open(self.timer.report_path) as fp:
+            self.assertEqual(json.load(fp), {
+                'total': 1.5,
+                'phases': [
+                    {'name': 'interpreter start', 'start': 0.0,
+                     'duration': 1.0, 'depth': 0},
+                    {'name': 'first frame', 'start': 1.0,
+                     'duration': 0.5, 'depth': 0},
+                    ],
+                })
@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import tempfile
+import unittest
+
+from subiquitycore.prober import Prober
+from subiquitycore.synthetic_machine import (
+    generate_machine_config,
+    main,
+    sd_name,
+    )
+
+
+class TestSyntheticMachine(unittest.TestCase):
+
+    def test_sd_name(self):
+        self.assertEqual(
+            [sd_name(i) for i in (0, 25, 26, 51, 701, 702)],
+            ['sda', 'sdz', 'sdaa', 'sdaz', 'sdzz', 'sdaaa'])
+
+    def test_disks(self):
+        config = generate_machine_config(disks=6, partitions=3)
+        storage = config['storage']
+        disks = sorted(
+            path for path, data in storage.items()
+            if data['DEVTYPE'] == 'disk')
+        self.assertEqual(
+            disks,
+            ['/dev/nvme0n1', '/dev/nvme1n1', '/dev/sda', '/dev/sdb',
+             '/dev/sdc', '/dev/sdd'])
+        self.assertEqual(len(storage), 6 * 4)
+        self.assertIn('/dev/nvme1n1p3', storage)
+        self.assertEqual(
+            storage['/dev/sda']['ID_ATA_ROTATION_RATE_RPM'], '7200')
+        self.assertEqual(
+            storage['/dev/sdb']['ID_ATA_ROTATION_RATE_RPM'], '0')
+
+    def test_device_numbers_unique(self):
+        storage = generate_machine_config(disks=600, multipath=4)['storage']
+        devs = [data['attrs']['dev'] for data in storage.values()]
+        self.assertEqual(len(devs), len(set(devs)))
+
+    def test_multipath(self):
+        storage = generate_machine_config(
+            disks=0, partitions=0, multipath=1)['storage']
+        self.assertEqual(sorted(storage), ['/dev/dm-0', '/dev/sda', '/dev/sdb'])
+        a, b = storage['/dev/sda'], storage['/dev/sdb']
+        self.assertEqual(a['ID_SERIAL'], b['ID_SERIAL'])
+        self.assertEqual(a['ID_WWN'], b['ID_WWN'])
+        self.assertEqual(a['attrs']['size'], b['attrs']['size'])
+        self.assertTrue(
+            storage['/dev/dm-0']['DEVPATH'].startswith('/devices/virtual'))
+
+    def test_network(self):
+        network = generate_machine_config(
+            nics=4, wlans=1, bonds=1, bond_members=2)['network']
+        by_name = {
+            link['netlink_data']['name']: link for link in network['links']}
+        self.assertEqual(
+            sorted(by_name),
+            ['bond0', 'enp1s0', 'enp2s0', 'enp3s0', 'enp4s0', 'wlp1s0'])
+        self.assertEqual(by_name['bond0']['bond']['slaves'],
+                         ['enp1s0', 'enp2s0'])
+        self.assertTrue(by_name['enp2s0']['bond']['is_slave'])
+        self.assertEqual(by_name['wlp1s0']['udev_data']['DEVTYPE'], 'wlan')
+        self.assertEqual(
+            network['routes'][0]['ifindex'],
+            by_name['enp3s0']['netlink_data']['ifindex'])
+
+    def test_too_many_bond_members(self):
+        with self.assertRaises(ValueError):
+            generate_machine_config(nics=2, bonds=2, bond_members=2)
+
+    def test_same_seed_same_config(self):
+        self.assertEqual(
+            generate_machine_config(disks=10, seed=1),
+            generate_machine_config(disks=10, seed=1))
+
+    def test_prober_loads_written_config(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'machine.json')
+            self.assertEqual(
+                main(['--disks', '3', '--nics', '2', '-o', path]), 0)
+            with open(path) as fp:
+                config = json.load(fp)
+            opts = argparse.Namespace(
+                machine_config=path, machine_config_snapshot=False)
+            prober = Prober(opts)
+            self.assertEqual(prober.get_storage(), config['storage'])
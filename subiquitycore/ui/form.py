@@ -28,6 +28,7 @@ from urwid import (
     )
 
 from subiquitycore.i18n import *
+from subiquitycore.i18n import lazy_gettext
 from subiquitycore.ui.buttons import cancel_btn, done_btn
 from subiquitycore.ui.container import Columns, Pile
 from subiquitycore.ui.interactive import (
@@ -181,7 +182,7 @@ class BoundFormField(object):
         if self._help is not None:
             return self._help
         elif self.field.help is not None:
-            return self.field.help
+            return str(self.field.help)
         else:
             return ""
 
@@ -196,7 +197,7 @@ class BoundFormField(object):
         if self._caption is not None:
             return self._caption
         else:
-            return self.field.caption
+            return str(self.field.caption)
 
     @caption.setter
     def caption(self, val):
@@ -273,10 +274,10 @@ class Form(object, metaclass=MetaForm):
 
     signals = ['submit', 'cancel']
 
-    ok_label = _("Done")
+    ok_label = lazy_gettext("Done")
 
     def __init__(self, initial={}):
-        self.done_btn = Toggleable(done_btn(self.ok_label, on_press=self._click_done))
+        self.done_btn = Toggleable(done_btn(str(self.ok_label), on_press=self._click_done))
         self.cancel_btn = Toggleable(cancel_btn(_("Cancel"), on_press=self._click_cancel))
         self.buttons = button_pile([self.done_btn, self.cancel_btn])
         self._fields = []
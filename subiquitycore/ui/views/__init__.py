@@ -13,10 +13,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from .network import NetworkView  # NOQA
-from .network_default_route import NetworkSetDefaultRouteView  # NOQA
-from .network_configure_interface import NetworkConfigureInterfaceView  # NOQA
-from .network_configure_manual_interface import NetworkConfigureIPv4InterfaceView, NetworkConfigureIPv6InterfaceView  # NOQA
-from .network_configure_wlan_interface import NetworkConfigureWLANView  # NOQA
-from .network_bond_interfaces import NetworkBondInterfacesView  # NOQA
-from .login import LoginView  # NOQA
+from subiquitycore.lazy import lazy_attributes
+
+lazy_attributes(__name__, {
+    'NetworkView': '.network',
+    'NetworkSetDefaultRouteView': '.network_default_route',
+    'NetworkConfigureInterfaceView': '.network_configure_interface',
+    'NetworkConfigureIPv4InterfaceView': '.network_configure_manual_interface',
+    'NetworkConfigureIPv6InterfaceView': '.network_configure_manual_interface',
+    'NetworkConfigureWLANView': '.network_configure_wlan_interface',
+    'NetworkBondInterfacesView': '.network_bond_interfaces',
+    'LoginView': '.login',
+    })
@@ -18,6 +18,7 @@ import ipaddress
 
 from urwid import connect_signal, Text
 
+from subiquitycore.i18n import lazy_gettext
 from subiquitycore.view import BaseView
 from subiquitycore.ui.buttons import menu_btn
 from subiquitycore.ui.container import ListBox, Pile
@@ -64,12 +65,16 @@ class NetworkConfigForm(Form):
         self.ip_address_cls = fam['address_cls']
         self.ip_network_cls = fam['network_cls']
 
-    ok_label = _("Save")
-    subnet = IPField(_("Subnet:"), has_mask=True)
-    address = IPField(_("Address:"))
-    gateway = IPField(_("Gateway:"))
-    nameservers = StringField(_("Name servers:"), help=_("IP addresses, comma separated"))
-    searchdomains = StringField(_("Search domains:"), help=_("Domains, comma separated"))
+    ok_label = lazy_gettext("Save")
+    subnet = IPField(lazy_gettext("Subnet:"), has_mask=True)
+    address = IPField(lazy_gettext("Address:"))
+    gateway = IPField(lazy_gettext("Gateway:"))
+    nameservers = StringField(
+        lazy_gettext("Name servers:"),
+        help=lazy_gettext("IP addresses, comma separated"))
+    searchdomains = StringField(
+        lazy_gettext("Search domains:"),
+        help=lazy_gettext("Domains, comma separated"))
 
     def clean_subnet(self, subnet):
         log.debug("clean_subnet %r", subnet)
@@ -6,6 +6,7 @@ from urwid import (
     Text,
     WidgetWrap,
     )
+from subiquitycore.i18n import lazy_gettext
 from subiquitycore.view import BaseView
 from subiquitycore.ui.buttons import cancel_btn, menu_btn
 from subiquitycore.ui.container import Columns, ListBox, Pile
@@ -35,7 +36,7 @@ class NetworkList(WidgetWrap):
 
 class WLANForm(Form):
 
-    ok_label = _("Save")
+    ok_label = lazy_gettext("Save")
 
     ssid = StringField(caption="Network Name:")
     psk = PasswordField(caption="Password:")
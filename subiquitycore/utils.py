@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import crypt
 import errno
 import logging
@@ -151,6 +152,38 @@ def run_command(command, timeout=None, shell=False):
     return run_command_summarize(p, stdout, stderr)
 
 
+async def arun_command(command, shell=False):
+    """ Execute command without blocking the event loop or a thread.
+
+    This is a coroutine; it returns the same dict as run_command.  If
+    it is cancelled, the command is killed.
+    """
+    log.debug('arun_command called: {}'.format(command))
+    cmd_env = os.environ.copy()
+    # set consistent locale
+    cmd_env['LC_ALL'] = 'C'
+    kw = dict(stdin=asyncio.subprocess.DEVNULL,
+              stdout=asyncio.subprocess.PIPE,
+              stderr=asyncio.subprocess.PIPE,
+              env=cmd_env)
+    try:
+        if shell:
+            p = await asyncio.create_subprocess_shell(command, **kw)
+        else:
+            p = await asyncio.create_subprocess_exec(*command, **kw)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return dict(status=127, output="", err="")
+        raise
+    try:
+        stdout, stderr = await p.communicate()
+    except asyncio.CancelledError:
+        p.kill()
+        await p.wait()
+        raise
+    return run_command_summarize(p, stdout, stderr)
+
+
 # FIXME: replace with passlib and update package deps
 def crypt_password(passwd, algo='SHA-512'):
     # encryption algo - id pairs for crypt()